@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.payouts.payout_cache_middleware',  # One payout rule lookup per disaster per request
 ]
 
 ROOT_URLCONF = 'BantayAyuda.urls'
@@ -85,6 +86,73 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Disaster-scoped API responses are cached per data version (api/response_cache.py);
+# stale versions are evicted by TIMEOUT/MAX_ENTRIES. Use a shared backend
+# (Redis/Memcached/file) in production so all workers see the same versions.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bantayayuda',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # LLM-generated SMS templates (see api/sms_pipeline.py)
+    'sms_templates': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bantayayuda-sms-templates',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+RESPONSE_CACHE_TIMEOUT = 300  # seconds
+
+# ML model registry (see api/model_registry.py)
+ML_MODEL_REGISTRY = BASE_DIR / 'data' / 'models'
+ML_MODEL_CHECK_INTERVAL = 5.0  # seconds between checks for a newly promoted model
+
+# Shared model server (see api/model_server.py): 'unix:/path/to.sock' or
+# 'host:port'. Empty predicts in-process in every worker.
+ML_MODEL_SERVER = ''
+ML_MODEL_SERVER_TIMEOUT = 10.0  # seconds per predict request before falling back
+
+# Concurrent SMS generation with Gemini (see api/sms_pipeline.py)
+SMS_LLM_URL = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent'
+SMS_LLM_CONCURRENCY = 8  # Gemini calls in flight at once
+SMS_LLM_RATE = 1.0  # calls per second (Gemini's default quota is 60 per minute)
+SMS_LLM_BURST = 5  # calls allowed back to back before the rate applies
+SMS_LLM_TIMEOUT = 10.0  # seconds per call before falling back to the template
+SMS_LLM_DEADLINE = 30.0  # seconds per batch (0: none); messages not generated by then use the template
+SMS_TEMPLATE_TTL = 24 * 60 * 60  # seconds a generated SMS template is reused
+
+# Pooled Gemini HTTP client (see api/http_client.py)
+GEMINI_HTTP_POOL_SIZE = 10  # kept-alive connections
+GEMINI_CONNECT_TIMEOUT = 3.05  # seconds
+GEMINI_READ_TIMEOUT = 15.0  # seconds
+GEMINI_RETRIES = 2  # extra attempts on connection errors, timeouts, 429 and 5xx
+GEMINI_BACKOFF = 0.5  # seconds; jittered, doubling per attempt
+GEMINI_BREAKER_THRESHOLD = 5  # consecutive failed calls before failing fast
+GEMINI_BREAKER_RESET = 30.0  # seconds before trying Gemini again
+
+# SMS outbox (see api/outbox.py), sent by `manage.py run_sms_workers`.
+# SMS_GATEWAY is a class with send(messages): FileGateway appends JSON lines
+# (SMS_GATEWAY_OPTIONS = {'path': ...}, default BASE_DIR / 'sms_outbox.jsonl'),
+# HttpGateway posts batches to a provider ({'url': ..., 'api_key': ...}).
+SMS_GATEWAY = 'api.outbox.FileGateway'
+SMS_OUTBOX_BATCH_SIZE = 200  # messages per claim and gateway call
+SMS_OUTBOX_MAX_ATTEMPTS = 5  # failed attempts before a message is dead-lettered (FAILED)
+SMS_OUTBOX_RETRY_BACKOFF = 30.0  # seconds before the first retry; jittered, doubling per attempt
+SMS_OUTBOX_RETRY_BACKOFF_MAX = 3600.0  # seconds
+SMS_OUTBOX_CLAIM_TIMEOUT = 300.0  # seconds before a message left SENDING by a stopped worker is retried
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Household, DisasterEvent, DamageAssessment
+from django.utils import timezone
+from .models import Household, DisasterEvent, DamageAssessment, PredictionJob, SmsMessage, BudgetRollup, PayoutRuleSet
+from .payouts import create_rule_set
 
 
 @admin.register(Household)
@@ -22,3 +24,55 @@ class DamageAssessmentAdmin(admin.ModelAdmin):
     list_filter = ['damage_status', 'disaster', 'assessed_at']
     search_fields = ['household__name', 'household__barangay', 'disaster__name']
     readonly_fields = ['recommended_ect_amount']
+
+
+@admin.register(BudgetRollup)
+class BudgetRollupAdmin(admin.ModelAdmin):
+    """Read-only: maintained from the assessments (see api/rollup.py)"""
+    list_display = ['disaster', 'barangay', 'damage_status', 'ect_amount', 'count', 'count_4ps', 'amount_total']
+    list_filter = ['disaster', 'damage_status']
+    search_fields = ['barangay']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PayoutRuleSet)
+class PayoutRuleSetAdmin(admin.ModelAdmin):
+    """Adding a rule set re-prices the disaster; versions are never edited"""
+    list_display = ['disaster', 'version', 'total_amount', 'partial_amount', 'none_amount', 'created_by', 'created_at']
+    list_filter = ['disaster']
+    readonly_fields = ['version']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        repriced = create_rule_set(obj)
+        self.message_user(request, f'Version {obj.version} in force: {repriced} assessments re-priced')
+
+
+@admin.register(PredictionJob)
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ['disaster', 'status', 'processed', 'total', 'created_at', 'finished_at']
+    list_filter = ['status', 'disaster']
+    readonly_fields = ['total', 'processed', 'error', 'started_at', 'finished_at']
+
+
+@admin.register(SmsMessage)
+class SmsMessageAdmin(admin.ModelAdmin):
+    list_display = ['phone', 'household', 'disaster', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'disaster']
+    search_fields = ['phone', 'idempotency_key', 'household__name']
+    readonly_fields = ['idempotency_key', 'attempts', 'claim_token', 'claimed_at', 'last_error', 'sent_at']
+    actions = ['requeue']
+
+    @admin.action(description='Retry the selected failed messages')
+    def requeue(self, request, queryset):
+        count = queryset.filter(status=SmsMessage.Status.FAILED).update(
+            status=SmsMessage.Status.PENDING, attempts=0, next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{count} messages requeued')
@@ -0,0 +1,205 @@
+"""
+Server-side marker clustering for the map.
+
+Households are grouped by geohash cell (see api/spatial.py). For each
+disaster we aggregate the finest cluster level with one GROUP BY query and
+roll it up into every coarser level; the result is cached per disaster.
+
+When an assessment or household changes, only the finest cell containing it
+is re-aggregated, and the difference is applied to that cell's ancestors, so
+a single edit never triggers a full rebuild. Rebuilds and refreshes of a
+disaster hold a lock (a cache.add marker, so it works across processes on a
+shared cache) so that concurrent commits never lose each other's changes.
+"""
+import contextlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce, Substr
+
+from .models import DisasterEvent, Household
+from .spatial import cell_filter, precision_for_zoom
+
+
+CLUSTER_PRECISION = 7           # Finest cluster cell, ~150m x 150m
+CLUSTER_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Per-cell stats vector
+COUNT, TOTAL, PARTIAL, NONE, AMOUNT, LAT_SUM, LON_SUM = range(7)
+
+
+# Seconds a rebuild or refresh waits for another one on the same disaster,
+# and how long a lock left by a crashed process lasts
+LOCK_WAIT = 5.0
+LOCK_TIMEOUT = 60
+
+
+def _cache_key(disaster_id):
+    return f'clusters:{disaster_id}'
+
+
+def cached_disaster_ids(disaster_ids=None):
+    """
+    Disasters among ``disaster_ids`` (default: all of them) with cached
+    clusters, the only ones that need refreshing on writes
+    """
+    if disaster_ids is None:
+        disaster_ids = DisasterEvent.objects.values_list('pk', flat=True)
+    keys = {_cache_key(disaster_id): int(disaster_id) for disaster_id in disaster_ids}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+@contextlib.contextmanager
+def _locked(disaster_id):
+    """Hold the disaster's cluster lock; yields False if it could not be taken in LOCK_WAIT"""
+    key = f'{_cache_key(disaster_id)}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(key, True, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        cache.delete(key)
+
+
+def _cell_stats(disaster_id, cell=None):
+    """
+    Aggregate finest-level cells for a disaster in one GROUP BY query.
+    If ``cell`` is given, only that cell is aggregated.
+    """
+    households = Household.objects.all()
+    if cell is not None:
+        households = households.filter(cell_filter(cell))
+    rows = (
+        households
+        .annotate(
+            disaster_assessment=FilteredRelation(
+                'assessments',
+                condition=Q(assessments__disaster_id=disaster_id),
+            ),
+            cell=Substr('geohash', 1, CLUSTER_PRECISION),
+        )
+        .order_by()
+        .values('cell')
+        .annotate(
+            count=Count('id'),
+            total=Count('id', filter=Q(disaster_assessment__damage_status='TOTAL')),
+            partial=Count('id', filter=Q(disaster_assessment__damage_status='PARTIAL')),
+            amount=Coalesce(
+                Sum('disaster_assessment__recommended_ect_amount'),
+                Value(0), output_field=DecimalField(),
+            ),
+            lat_sum=Sum('latitude'),
+            lon_sum=Sum('longitude'),
+        )
+    )
+    return {
+        row['cell']: [
+            row['count'],
+            row['total'],
+            row['partial'],
+            row['count'] - row['total'] - row['partial'],
+            float(row['amount']),
+            float(row['lat_sum']),
+            float(row['lon_sum']),
+        ]
+        for row in rows
+    }
+
+
+def _apply(levels, cell, delta):
+    """Add ``delta`` to ``cell`` and all its ancestor cells"""
+    for precision in range(1, CLUSTER_PRECISION + 1):
+        level = levels[precision]
+        key = cell[:precision]
+        stats = level.get(key, [0] * len(delta))
+        stats = [a + b for a, b in zip(stats, delta)]
+        if stats[COUNT] <= 0:
+            level.pop(key, None)
+        else:
+            level[key] = stats
+
+
+def build_clusters(disaster_id):
+    """
+    Aggregate every cluster level for a disaster and cache the result (not
+    cached if another rebuild or refresh holds the lock too long)
+    """
+    with _locked(disaster_id) as locked:
+        levels = {precision: {} for precision in range(1, CLUSTER_PRECISION + 1)}
+        for cell, stats in _cell_stats(disaster_id).items():
+            _apply(levels, cell, stats)
+        if locked:
+            cache.set(_cache_key(disaster_id), levels, CLUSTER_CACHE_TIMEOUT)
+    return levels
+
+
+def get_clusters(disaster_id):
+    """Return cached cluster levels for a disaster, building them if needed"""
+    levels = cache.get(_cache_key(disaster_id))
+    if levels is None:
+        levels = build_clusters(disaster_id)
+    return levels
+
+
+def refresh_cells(disaster_id, geohashes):
+    """
+    Incrementally update a disaster's cached clusters after households in
+    ``geohashes`` changed. Does nothing when the disaster isn't cached; when
+    the lock can't be taken the cached clusters are dropped instead, so the
+    next read rebuilds them.
+    """
+    if not any(geohashes):
+        return
+    with _locked(disaster_id) as locked:
+        if not locked:
+            cache.delete(_cache_key(disaster_id))
+            return
+        levels = cache.get(_cache_key(disaster_id))
+        if levels is None:
+            return
+        finest = levels[CLUSTER_PRECISION]
+        for cell in {geohash[:CLUSTER_PRECISION] for geohash in geohashes if geohash}:
+            old = finest.get(cell, [0] * 7)
+            new = _cell_stats(disaster_id, cell).get(cell, [0] * 7)
+            _apply(levels, cell, [b - a for a, b in zip(old, new)])
+        cache.set(_cache_key(disaster_id), levels, CLUSTER_CACHE_TIMEOUT)
+
+
+def cluster_precision(zoom):
+    """Cluster cells are one geohash level finer than a map tile at ``zoom``"""
+    return min(precision_for_zoom(zoom) + 1, CLUSTER_PRECISION)
+
+
+def clusters_for_zoom(disaster_id, zoom, bbox=None):
+    """
+    List clusters for a zoom level, optionally limited to clusters whose
+    centroid lies inside ``bbox`` (west, south, east, north).
+    """
+    level = get_clusters(disaster_id)[cluster_precision(zoom)]
+    clusters = []
+    for cell, stats in sorted(level.items()):
+        count = stats[COUNT]
+        lat = stats[LAT_SUM] / count
+        lon = stats[LON_SUM] / count
+        if bbox is not None:
+            west, south, east, north = bbox
+            if not (south <= lat <= north and west <= lon <= east):
+                continue
+        clusters.append({
+            'cell': cell,
+            'lat': round(lat, 6),
+            'lon': round(lon, 6),
+            'count': count,
+            'by_status': {
+                'TOTAL': stats[TOTAL],
+                'PARTIAL': stats[PARTIAL],
+                'NONE': stats[NONE],
+            },
+            'total_ect_amount': stats[AMOUNT],
+        })
+    return clusters
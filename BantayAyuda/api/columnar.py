@@ -0,0 +1,114 @@
+"""
+Compact columnar encoding of the household map for constrained networks.
+
+Instead of one GeoJSON object (with an HTML popup) per household, the map
+is sent as a handful of typed arrays. Names, addresses and popups are not
+included; the client fetches them lazily per household from
+/api/households/<id>/popup/?disaster_id=<id>.
+
+Layout (all little-endian, every 4-byte array starts 4-byte aligned so a
+browser can wrap it in a typed array without copying):
+
+    offset  size     content
+    0       4        magic b'BAC1'
+    4       4        uint32  N, number of households
+    8       4*N      uint32  household ids
+            4*N      int32   longitude in micro-degrees
+            4*N      int32   latitude in micro-degrees
+            4*N      uint32  recommended ECT amount in centavos
+            N        uint8   damage status code (see STATUS_CODES)
+"""
+import struct
+import sys
+from array import array
+
+from django.db.models import F, FilteredRelation, Q
+
+from .models import Household
+
+
+MEDIA_TYPE = 'application/vnd.bantayayuda.columnar'
+MAGIC = b'BAC1'
+
+STATUS_CODES = {'NONE': 0, 'PARTIAL': 1, 'TOTAL': 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+_HEADER = struct.Struct('<4sI')
+
+
+def _column_rows(disaster_id, queryset=None):
+    """values_list() of just the columns the columnar payload carries"""
+    if queryset is None:
+        queryset = Household.objects.all()
+    return queryset.annotate(
+        disaster_assessment=FilteredRelation(
+            'assessments',
+            condition=Q(assessments__disaster_id=disaster_id),
+        ),
+    ).values_list(
+        'id', 'longitude', 'latitude',
+        F('disaster_assessment__recommended_ect_amount'),
+        F('disaster_assessment__damage_status'),
+    )
+
+
+def _little_endian(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode_columnar(disaster_id, queryset=None, chunk_size=2000):
+    """Encode a disaster's households as a columnar payload (bytes)"""
+    ids = array('I')
+    lons = array('i')
+    lats = array('i')
+    amounts = array('I')
+    statuses = array('B')
+
+    for pk, lon, lat, amount, damage_status in _column_rows(disaster_id, queryset).iterator(chunk_size=chunk_size):
+        ids.append(pk)
+        lons.append(int(lon * 1000000))
+        lats.append(int(lat * 1000000))
+        amounts.append(int((amount or 0) * 100))
+        statuses.append(STATUS_CODES.get(damage_status, 0))
+
+    return b''.join([
+        _HEADER.pack(MAGIC, len(ids)),
+        _little_endian(ids),
+        _little_endian(lons),
+        _little_endian(lats),
+        _little_endian(amounts),
+        statuses.tobytes(),
+    ])
+
+
+def decode_columnar(payload):
+    """
+    Decode a columnar payload back into a dict of lists (used by tests and
+    benchmarks; browsers read the arrays directly).
+
+    Raises:
+        ValueError: if the payload is not a columnar map payload
+    """
+    magic, count = _HEADER.unpack_from(payload)
+    if magic != MAGIC or len(payload) != _HEADER.size + 17 * count:
+        raise ValueError('Not a columnar map payload')
+
+    columns = {}
+    offset = _HEADER.size
+    for name, typecode in (('id', 'I'), ('lon', 'i'), ('lat', 'i'), ('amount', 'I'), ('status', 'B')):
+        column = array(typecode)
+        column.frombytes(payload[offset:offset + column.itemsize * count])
+        if sys.byteorder == 'big' and column.itemsize > 1:
+            column.byteswap()
+        offset += column.itemsize * count
+        columns[name] = column
+
+    return {
+        'id': columns['id'].tolist(),
+        'lon': [value / 1000000 for value in columns['lon']],
+        'lat': [value / 1000000 for value in columns['lat']],
+        'ect_amount': [value / 100 for value in columns['amount']],
+        'damage_status': [STATUS_NAMES[value] for value in columns['status']],
+    }
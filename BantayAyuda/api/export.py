@@ -0,0 +1,81 @@
+"""
+Streaming CSV export of a disaster's assessments.
+
+Rows are read with ``values_list`` (only the exported columns, no model
+instances) through ``.iterator(chunk_size=...)``, written chunk by chunk into
+a small buffer and yielded, so memory stays flat whatever the number of
+households. With gzip the same chunks go through one incremental compressor.
+"""
+import csv
+import io
+import zlib
+
+from .models import DamageAssessment
+
+
+# Rows fetched per database round trip and written per yielded chunk
+EXPORT_CHUNK_SIZE = 2000
+
+HEADER = [
+    'Household ID', 'Name', 'Address', 'Barangay',
+    'Latitude', 'Longitude', 'Damage Status', 'ECT Amount (PHP)',
+    'Flood Depth (m)', 'House Height (m)', 'House Width (m)', '4Ps Recipient',
+]
+
+COLUMNS = (
+    'household__household_id', 'household__name', 'household__address', 'household__barangay',
+    'household__latitude', 'household__longitude', 'damage_status', 'recommended_ect_amount',
+    'household__flood_depth', 'household__house_height', 'household__house_width', 'household__is_4ps',
+)
+
+
+def export_rows(disaster_id):
+    """A disaster's assessments as tuples of COLUMNS, in export order"""
+    # Primary key order follows the disaster index, so the database streams
+    # rows without sorting the whole disaster first
+    return DamageAssessment.objects.filter(disaster_id=disaster_id).values_list(*COLUMNS).order_by('pk')
+
+
+def _csv_row(row):
+    (household_id, name, address, barangay, latitude, longitude, damage_status, amount,
+     flood_depth, house_height, house_width, is_4ps) = row
+    return [
+        household_id or '', name, address, barangay,
+        float(latitude), float(longitude), damage_status, int(amount),
+        flood_depth, house_height, house_width, 'Yes' if is_4ps else 'No',
+    ]
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the export as UTF-8 CSV, one chunk of ``chunk_size`` rows at a
+    time. The header is yielded before the query runs.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    yield buffer.getvalue().encode()
+
+    written = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows.iterator(chunk_size=chunk_size):
+        writer.writerow(_csv_row(row))
+        written += 1
+        if written == chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            written = 0
+    if written:
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip file, chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
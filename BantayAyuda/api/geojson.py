@@ -0,0 +1,199 @@
+"""
+GeoJSON helpers for the Leaflet map.
+
+Builds map features for a disaster straight from a single LEFT JOIN between
+Household and that disaster's DamageAssessment, reading only the columns a
+feature needs.
+
+For very large disasters the collection can also be streamed feature by
+feature from a server-side cursor, so memory stays flat regardless of city
+size.
+
+Clients that already hold a map can poll for a delta instead: pass the
+``cursor`` from the previous response as ``since`` and only added, changed
+and deleted features come back (deletions are tracked by MapTombstone).
+"""
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F, FilteredRelation, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Household, MapTombstone
+
+
+# Marker colors per damage status (households without an assessment are NONE)
+STATUS_COLORS = {
+    'TOTAL': ('#dc3545', 'red'),       # Red
+    'PARTIAL': ('#fd7e14', 'orange'),  # Orange
+    'NONE': ('#28a745', 'green'),      # Green
+}
+
+# Rows fetched per database round trip when streaming
+STREAM_CHUNK_SIZE = 2000
+
+# Cursors lag the clock slightly so rows written by transactions that were
+# still in flight when the cursor was issued are picked up by the next poll
+DELTA_CURSOR_OVERLAP = timedelta(seconds=5)
+
+# Tombstones older than this are pruned; older cursors get a full resync
+TOMBSTONE_RETENTION = timedelta(days=7)
+
+FEATURE_FIELDS = (
+    'id', 'name', 'address', 'barangay', 'contact_number', 'latitude', 'longitude',
+)
+
+
+def household_rows(disaster_id, queryset=None, extra_fields=()):
+    """
+    Return a values() queryset of map rows for a disaster.
+
+    Each household is LEFT JOINed to its assessment for ``disaster_id`` only,
+    so households that were never assessed still come back (with NULL
+    status and amount).
+    """
+    if queryset is None:
+        queryset = Household.objects.all()
+    return queryset.annotate(
+        disaster_assessment=FilteredRelation(
+            'assessments',
+            condition=Q(assessments__disaster_id=disaster_id),
+        ),
+    ).values(
+        *FEATURE_FIELDS,
+        *extra_fields,
+        damage_status=F('disaster_assessment__damage_status'),
+        ect_amount=F('disaster_assessment__recommended_ect_amount'),
+    )
+
+
+def build_feature(row):
+    """Convert one row from household_rows() into a GeoJSON Feature dict."""
+    damage_status = row['damage_status'] or 'NONE'
+    ect_amount = float(row['ect_amount'] or 0)
+    marker_color = STATUS_COLORS.get(damage_status, STATUS_COLORS['NONE'])[1]
+
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [
+                float(row['longitude']),
+                float(row['latitude'])
+            ]
+        },
+        'properties': {
+            'id': row['id'],
+            'name': row['name'],
+            'address': row['address'],
+            'barangay': row['barangay'],
+            'contact_number': row['contact_number'] or '',
+            'damage_status': damage_status,
+            'ect_amount': ect_amount,
+            'marker_color': marker_color,
+            'popup_content': f"""
+                        <strong>{row['name']}</strong><br>
+                        {row['address']}<br>
+                        <strong>Status:</strong> {damage_status}<br>
+                        <strong>ECT Amount:</strong> ₱{ect_amount:,.2f}
+                    """
+        }
+    }
+
+
+def new_cursor():
+    """Cursor to hand out with a response: where the next delta should start"""
+    return (timezone.now() - DELTA_CURSOR_OVERLAP).isoformat()
+
+
+def parse_cursor(value):
+    """
+    Parse a ``since`` value: a cursor from a previous response, any ISO-8601
+    timestamp, or Unix epoch seconds.
+
+    Raises:
+        ValueError: if the value is not a timestamp
+    """
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    since = parse_datetime(value.replace(' ', '+')) if value else None  # '+' arrives as ' ' in query strings
+    if since is None:
+        raise ValueError('since must be a cursor or an ISO-8601 timestamp')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def delta_collection(disaster_id, since, queryset=None):
+    """
+    Build the delta FeatureCollection for changes after ``since``.
+
+    ``features`` holds added or changed households (``properties.change`` is
+    'added' or 'changed'), ``deleted`` the ids of households removed since.
+    When ``since`` is older than the tombstone retention window, deletions
+    can no longer be reported, so a full collection is returned with
+    ``full: true`` and the client should replace its map.
+    """
+    cursor = new_cursor()
+    if since < timezone.now() - TOMBSTONE_RETENTION:
+        return {
+            'type': 'FeatureCollection',
+            'features': [build_feature(row) for row in household_rows(disaster_id, queryset)],
+            'deleted': [],
+            'full': True,
+            'cursor': cursor,
+        }
+
+    tombstones = MapTombstone.objects.filter(deleted_at__gt=since)
+    deleted = set(
+        tombstones.filter(disaster_id__isnull=True).values_list('household_pk', flat=True)
+    )
+    unassessed = tombstones.filter(disaster_id=disaster_id).values('household_pk')
+
+    rows = household_rows(disaster_id, queryset, extra_fields=('created_at',)).filter(
+        Q(updated_at__gt=since)
+        | Q(disaster_assessment__updated_at__gt=since)
+        | Q(pk__in=unassessed)
+    )
+    features = []
+    for row in rows:
+        feature = build_feature(row)
+        feature['properties']['change'] = 'added' if row['created_at'] > since else 'changed'
+        features.append(feature)
+
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'deleted': sorted(deleted),
+        'full': False,
+        'cursor': cursor,
+    }
+
+
+def stream_feature_collection(rows, chunk_size=STREAM_CHUNK_SIZE, cursor=None):
+    """
+    Yield a GeoJSON FeatureCollection as encoded text, one chunk at a time.
+
+    ``rows`` is iterated with ``.iterator(chunk_size=...)`` so only one chunk
+    of rows and its encoded features are held in memory at any moment. The
+    opening bytes are yielded before the query runs, so clients start
+    receiving data immediately. ``cursor`` is written after the features.
+    """
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ''
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(json.dumps(build_feature(row)))
+        if len(batch) >= chunk_size:
+            yield separator + ', '.join(batch)
+            separator = ', '
+            batch = []
+    if batch:
+        yield separator + ', '.join(batch)
+    if cursor is None:
+        yield ']}'
+    else:
+        yield '], "cursor": %s}' % json.dumps(cursor)
@@ -0,0 +1,207 @@
+"""
+Shared HTTP client for upstream APIs (Gemini).
+
+- one requests.Session per client, so connections (and TLS sessions) are
+  pooled and reused across requests and threads,
+- separate connect and read timeouts on every call, so a hung upstream
+  can't hold a worker,
+- bounded retries with jittered exponential backoff on connection errors,
+  timeouts and 429/5xx responses,
+- a circuit breaker: after GEMINI_BREAKER_THRESHOLD consecutive failed
+  calls it opens and calls fail fast (callers use the template SMS) until
+  GEMINI_BREAKER_RESET seconds have passed; then a single trial call
+  decides whether it closes again.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """The upstream call failed (after retries), or returned an unusable answer"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open: the upstream is not being called"""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker (closed -> open -> half-open -> closed).
+
+    Args:
+        failure_threshold: consecutive failures that open the circuit
+        reset_timeout: seconds to stay open before allowing a trial call
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = 0.0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Whether a call may go out now (a half-open circuit lets one through)"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning('Circuit opened after %d failures', self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class PooledClient:
+    """
+    JSON-over-HTTP client with pooling, timeouts, retries and a breaker.
+
+    Args:
+        pool_size: connections kept per host
+        connect_timeout, read_timeout: seconds
+        retries: extra attempts after the first one
+        backoff: base delay in seconds; attempt n waits a random time up to
+                 min(backoff_max, backoff * 2**n)
+        breaker: CircuitBreaker shared by every client of the same upstream
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=15.0, retries=2,
+                 backoff=0.5, backoff_max=4.0, breaker=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+
+    def post_json(self, url, payload, params=None):
+        """
+        POST ``payload`` as JSON and return the decoded JSON answer.
+
+        Raises:
+            CircuitOpenError: if the breaker is open (nothing is sent)
+            UpstreamError: if every attempt failed, or on a non-retryable
+                           error status
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError('Upstream circuit is open')
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep_before_retry(attempt - 1)
+            try:
+                response = self.session.post(
+                    url, params=params, json=payload, timeout=(self.connect_timeout, self.read_timeout),
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            except requests.RequestException as e:
+                error = e
+                break
+            if response.status_code in RETRY_STATUSES:
+                error = UpstreamError(f'Upstream error {response.status_code}')
+                continue
+            if response.status_code >= 400:
+                # Our request is wrong (bad key, bad payload): retrying won't
+                # help, and the upstream itself is healthy
+                self.breaker.record_success()
+                raise UpstreamError(f'Upstream error {response.status_code}: {response.text[:200]}')
+            try:
+                result = response.json()
+            except ValueError as e:
+                error = UpstreamError(f'Invalid JSON from upstream: {e}')
+                break
+            self.breaker.record_success()
+            return result
+
+        self.breaker.record_failure()
+        # Connection errors quote the URL, which carries the API key: keep
+        # the details on the chained exception only
+        detail = str(error) if isinstance(error, UpstreamError) else type(error).__name__
+        raise UpstreamError(f'{detail} after {attempt + 1} attempt(s)') from error
+
+
+# One breaker for Gemini, shared by the generate-sms view and the SMS
+# pipeline (api/sms_pipeline.py), so both stop calling it when it is down
+gemini_breaker = CircuitBreaker(
+    failure_threshold=getattr(settings, 'GEMINI_BREAKER_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'GEMINI_BREAKER_RESET', 30.0),
+)
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+
+def gemini_client():
+    """The process-wide pooled client for the Gemini REST API"""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = PooledClient(
+                pool_size=getattr(settings, 'GEMINI_HTTP_POOL_SIZE', 10),
+                connect_timeout=getattr(settings, 'GEMINI_CONNECT_TIMEOUT', 3.05),
+                read_timeout=getattr(settings, 'GEMINI_READ_TIMEOUT', 15.0),
+                retries=getattr(settings, 'GEMINI_RETRIES', 2),
+                backoff=getattr(settings, 'GEMINI_BACKOFF', 0.5),
+                breaker=gemini_breaker,
+            )
+        return _gemini_client
+
+
+def gemini_text(result):
+    """
+    The generated text of a generateContent answer.
+
+    Raises:
+        UpstreamError: if the answer has no candidates
+    """
+    try:
+        return result['candidates'][0]['content']['parts'][0]['text'].strip()
+    except (KeyError, IndexError, TypeError):
+        raise UpstreamError('No response from Gemini API')
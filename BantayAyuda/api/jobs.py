@@ -0,0 +1,180 @@
+"""
+Background prediction jobs.
+
+A disaster-wide ML prediction run can take longer than the reverse proxy
+allows for one request, so /api/ml/jobs/ only records a PredictionJob and
+returns. Jobs are executed by a thread pool, either inside the web process
+(PREDICTION_JOBS_IN_PROCESS) or by `python manage.py run_prediction_workers`.
+
+A job is claimed with a conditional UPDATE (PENDING -> RUNNING), so any
+number of workers can poll the same table without running a job twice.
+Each job processes its disaster in chunks, storing the result rows and
+advancing `processed` and `heartbeat_at` after every chunk; jobs for
+different disasters run concurrently on the pool's threads.
+
+A partial unique constraint allows one PENDING/RUNNING job per disaster. A
+RUNNING job whose heartbeat is older than PREDICTION_JOB_STALE_AFTER seconds
+lost its worker (crash, restart) and is failed by fail_stale_jobs(), which
+start_job() and the worker command call, so the disaster can be re-run. A
+worker that comes back after that stops at its next chunk.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import DamageAssessment, PredictionJob, PredictionResult
+from .prediction_store import prediction_results
+
+
+logger = logging.getLogger(__name__)
+
+JOB_CHUNK_SIZE = getattr(settings, 'PREDICTION_JOB_CHUNK_SIZE', 500)
+JOB_WORKERS = getattr(settings, 'PREDICTION_JOB_WORKERS', 4)
+JOB_STALE_AFTER = getattr(settings, 'PREDICTION_JOB_STALE_AFTER', 300)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='prediction-job')
+    return _executor
+
+
+class JobLost(Exception):
+    """The job is no longer RUNNING for this worker (failed as stale)"""
+
+
+def fail_stale_jobs():
+    """Fail RUNNING jobs whose worker stopped sending heartbeats. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_AFTER)
+    return PredictionJob.objects.filter(
+        status=PredictionJob.Status.RUNNING, heartbeat_at__lt=cutoff,
+    ).update(
+        status=PredictionJob.Status.FAILED,
+        error=f'Worker stopped responding (no heartbeat for {JOB_STALE_AFTER} seconds)',
+        finished_at=timezone.now(),
+    )
+
+
+def _in_process():
+    return getattr(settings, 'PREDICTION_JOBS_IN_PROCESS', True)
+
+
+def _active_job(disaster):
+    return PredictionJob.objects.filter(
+        disaster=disaster,
+        status__in=[PredictionJob.Status.PENDING, PredictionJob.Status.RUNNING],
+    ).first()
+
+
+def start_job(disaster):
+    """
+    Create a prediction job for a disaster, or return the one already
+    pending/running for it. Returns (job, created).
+    """
+    fail_stale_jobs()
+    job = _active_job(disaster)
+    if job is not None:
+        if (job.status == PredictionJob.Status.PENDING and _in_process()
+                and job.created_at < timezone.now() - timedelta(seconds=JOB_STALE_AFTER)):
+            # The process that queued it is gone; claiming is atomic, so a
+            # second submit can never run it twice
+            submit_job(job.pk)
+        return job, False
+    try:
+        with transaction.atomic():
+            job = PredictionJob.objects.create(
+                disaster=disaster,
+                total=DamageAssessment.objects.filter(disaster=disaster).count(),
+            )
+    except IntegrityError:
+        # Created concurrently (one_active_prediction_job)
+        job = _active_job(disaster)
+        if job is None:
+            raise
+        return job, False
+
+    if _in_process():
+        transaction.on_commit(lambda: submit_job(job.pk))
+    return job, True
+
+
+def submit_job(job_id, executor=None):
+    """Queue a job on a thread pool (the in-process pool by default)"""
+    return (executor or _get_executor()).submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    # Worker threads get their own database connection; close it when done
+    try:
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """Atomically move a job from PENDING to RUNNING; False if someone else got it"""
+    return PredictionJob.objects.filter(
+        pk=job_id, status=PredictionJob.Status.PENDING,
+    ).update(status=PredictionJob.Status.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now()) == 1
+
+
+def _still_running(job_id, **changes):
+    """Record progress and a heartbeat; raise JobLost if the job was failed meanwhile"""
+    if not PredictionJob.objects.filter(pk=job_id, status=PredictionJob.Status.RUNNING).update(
+        heartbeat_at=timezone.now(), **changes,
+    ):
+        raise JobLost(job_id)
+
+
+def run_job(job_id):
+    """
+    Execute a pending job. Returns False if the job was already claimed.
+    """
+    if not claim_job(job_id):
+        return False
+
+    job = PredictionJob.objects.get(pk=job_id)
+    try:
+        ids = list(
+            DamageAssessment.objects.filter(disaster_id=job.disaster_id)
+            .order_by('id').values_list('id', flat=True)
+        )
+        _still_running(job_id, total=len(ids))
+
+        position = 0
+        for start in range(0, len(ids), JOB_CHUNK_SIZE):
+            chunk = ids[start:start + JOB_CHUNK_SIZE]
+            results = prediction_results(DamageAssessment.objects.filter(pk__in=chunk).order_by('id'))
+            with transaction.atomic():
+                PredictionResult.objects.bulk_create([
+                    PredictionResult(job_id=job_id, position=position + i, data=data)
+                    for i, data in enumerate(results)
+                ])
+                position += len(results)
+                _still_running(job_id, processed=position)
+
+        _still_running(job_id, status=PredictionJob.Status.COMPLETED, finished_at=timezone.now())
+    except JobLost:
+        logger.warning('Prediction job %s was failed as stale; stopping', job_id)
+    except Exception as e:
+        logger.exception('Prediction job %s failed', job_id)
+        PredictionJob.objects.filter(pk=job_id, status=PredictionJob.Status.RUNNING).update(
+            status=PredictionJob.Status.FAILED, error=str(e), finished_at=timezone.now(),
+        )
+    return True
+
+
+def pending_job_ids(limit=None):
+    """Oldest pending jobs first"""
+    ids = PredictionJob.objects.filter(
+        status=PredictionJob.Status.PENDING,
+    ).order_by('created_at').values_list('id', flat=True)
+    return list(ids[:limit] if limit else ids)
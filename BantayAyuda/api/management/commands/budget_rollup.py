@@ -0,0 +1,34 @@
+"""
+Management command to verify or rebuild the budget rollup (api/rollup.py).
+Run with: python manage.py budget_rollup [--rebuild] [--disaster ID ...]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.rollup import rebuild, verify
+
+
+class Command(BaseCommand):
+    help = 'Verifies the budget rollup against the assessments, or rebuilds it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the rollup from the assessments')
+        parser.add_argument('--disaster', type=int, action='append', dest='disasters', metavar='ID',
+                            help='Only this disaster (repeatable; default: all)')
+
+    def handle(self, *args, **options):
+        disasters = options['disasters']
+        if options['rebuild']:
+            rows = rebuild(disasters)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the budget rollup: {rows} rows'))
+            return
+
+        differences = verify(disasters)
+        for disaster_id, barangay, damage_status, ect_amount, expected, stored in differences:
+            self.stdout.write(
+                f'Disaster {disaster_id} / {barangay} / {damage_status} ₱{ect_amount}: '
+                f'expected {expected}, stored {stored} (count, 4Ps, amount)'
+            )
+        if differences:
+            raise CommandError(f'{len(differences)} rollup rows differ; run with --rebuild to fix them')
+        self.stdout.write(self.style.SUCCESS('The budget rollup matches the assessments'))
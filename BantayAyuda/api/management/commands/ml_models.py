@@ -0,0 +1,74 @@
+"""
+Management command to manage versions in the ML model registry.
+Run with:
+    python manage.py ml_models list
+    python manage.py ml_models register path/to/model.cbm [--notes "..."] [--promote]
+    python manage.py ml_models promote <version>
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = 'Lists, registers and promotes ML model versions (see api/model_registry.py)'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        subcommands.add_parser('list', help='List registered versions')
+
+        register = subcommands.add_parser('register', help='Copy a model file into the registry')
+        register.add_argument('path', help='CatBoost model file (.cbm)')
+        register.add_argument('--notes', default='', help='Free-text notes stored in the metadata')
+        register.add_argument('--promote', action='store_true', help='Make it the active version')
+
+        promote = subcommands.add_parser('promote', help='Make a version the active model')
+        promote.add_argument('version')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'list':
+            self._list()
+        elif action == 'register':
+            self._register(options['path'], options['notes'], options['promote'])
+        elif action == 'promote':
+            self._promote(options['version'])
+
+    def _list(self):
+        promoted = registry.promoted_version()
+        versions = registry.versions()
+        if not versions:
+            self.stdout.write(f'No registered versions; serving {registry.active_version() or "no model"}')
+            return
+        for meta in versions:
+            marker = '*' if meta['version'] == promoted else ' '
+            self.stdout.write(f"{marker} {meta['version']}  {meta.get('created_at', '')}  {meta.get('notes', '')}")
+        if promoted is None:
+            self.stdout.write(f'No version promoted; serving {registry.active_version() or "no model"}')
+
+    def _register(self, path, notes, promote):
+        # Load the model once: a file CatBoost can't read must not reach the registry
+        from api.ml_engine import load_model_file
+        try:
+            loaded = load_model_file(path, 'candidate', {})
+        except Exception as e:
+            raise CommandError(f'Could not load model {path}: {e}')
+
+        version = registry.register(path, notes=notes, metadata={
+            'feature_names': list(loaded.model.feature_names_ or []),
+            'classes': [str(c) for c in loaded.model.classes_],
+            'numpy_evaluator': loaded.compiled is not None,
+        })
+        self.stdout.write(self.style.SUCCESS(f'Registered {version}'))
+        if promote:
+            self._promote(version)
+
+    def _promote(self, version):
+        try:
+            registry.promote(version)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Promoted {version}; workers switch to it within {registry.check_interval:g}s'
+        ))
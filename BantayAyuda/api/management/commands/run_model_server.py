@@ -0,0 +1,59 @@
+"""
+Management command to run the shared ML model server.
+Run with: python manage.py run_model_server [--bind unix:/run/bantayayuda/model.sock]
+
+Point the web workers at it with settings.ML_MODEL_SERVER (see
+api/model_server.py).
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ml_engine
+from api.model_registry import registry
+from api.model_server import ModelServer
+
+
+class Command(BaseCommand):
+    help = 'Serves ML predictions to the web workers from one shared model (api/model_server.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=getattr(settings, 'ML_MODEL_SERVER', ''),
+                            help="'unix:/path/to.sock' or 'host:port' (default: settings.ML_MODEL_SERVER)")
+        parser.add_argument('--max-batch-rows', type=int, default=1024,
+                            help='Largest micro-batch in rows (default: %(default)s)')
+        parser.add_argument('--max-wait-ms', type=float, default=0.0,
+                            help='Extra milliseconds to wait for requests to batch together (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        if not options['bind']:
+            raise CommandError('Set settings.ML_MODEL_SERVER or pass --bind')
+
+        # Load now rather than on the first request; promoted versions are
+        # still hot-reloaded while the server runs
+        loaded = registry.reload()
+        if loaded is None:
+            self.stderr.write('No ML model available yet; requests fall back to rule-based amounts')
+        else:
+            self.stdout.write(f'Loaded ML model {loaded.version}')
+
+        try:
+            server = ModelServer(
+                options['bind'],
+                predict=ml_engine.predict_in_process,
+                info=ml_engine.model_info_in_process,
+                max_batch_rows=options['max_batch_rows'],
+                max_wait=options['max_wait_ms'] / 1000,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not listen on {options['bind']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Model server listening on {options['bind']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(
+            f'Model server stopped ({server.batcher.requests} requests in {server.batcher.batches} batches)'
+        )
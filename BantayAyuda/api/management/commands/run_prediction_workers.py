@@ -0,0 +1,57 @@
+"""
+Management command to run background ML prediction jobs.
+Run with: python manage.py run_prediction_workers [--workers 4] [--once]
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import JOB_WORKERS, fail_stale_jobs, pending_job_ids, submit_job
+
+
+class Command(BaseCommand):
+    help = 'Runs pending prediction jobs (/api/ml/jobs/) on a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=JOB_WORKERS,
+                            help='Jobs to run concurrently (default: %(default)s)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds between checks for new jobs (default: %(default)s)')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs pending now, then exit')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prediction-worker')
+        running = {}
+
+        self.stdout.write(f'Prediction workers started ({workers} threads)')
+        try:
+            while True:
+                # Forget finished jobs, then fill the free slots
+                for job_id, future in list(running.items()):
+                    if future.done():
+                        del running[job_id]
+                        self.stdout.write(f'Job {job_id} finished')
+
+                stale = fail_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(f'{stale} jobs without a heartbeat marked FAILED'))
+
+                if len(running) < workers:
+                    for job_id in pending_job_ids(limit=workers):
+                        if job_id not in running and len(running) < workers:
+                            running[job_id] = submit_job(job_id, executor)
+                            self.stdout.write(f'Job {job_id} started')
+
+                if options['once']:
+                    wait(running.values())
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping; waiting for running jobs to finish')
+        finally:
+            executor.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS('Prediction workers stopped'))
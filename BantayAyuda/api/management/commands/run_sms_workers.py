@@ -0,0 +1,99 @@
+"""
+Management command to send queued SMS (the outbox, see api/outbox.py).
+Run with: python manage.py run_sms_workers [--workers 2] [--batch-size 200] [--once]
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from api.outbox import (
+    BATCH_SIZE, CLAIM_TIMEOUT, dispatch_batch, get_gateway, release_stale_claims, requeue_failed,
+)
+
+
+class Command(BaseCommand):
+    help = 'Sends pending outbox SMS through the configured gateway on worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Batches sent concurrently (default: %(default)s)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Messages claimed and sent per gateway call (default: %(default)s)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when no message is due (default: %(default)s)')
+        parser.add_argument('--release-interval', type=float, default=CLAIM_TIMEOUT / 2,
+                            help='Seconds between checks for messages left SENDING by a stopped worker '
+                                 '(default: %(default)s)')
+        parser.add_argument('--once', action='store_true',
+                            help='Send the messages due now, then exit')
+        parser.add_argument('--requeue-failed', action='store_true',
+                            help='Retry dead-lettered (FAILED) messages first')
+
+    def handle(self, *args, **options):
+        if options['requeue_failed']:
+            self.stdout.write(f'Requeued {requeue_failed()} failed messages')
+
+        gateway = get_gateway()
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+        next_release = [0.0]
+
+        def release_due():
+            # One worker at a time releases stale claims, at startup and then
+            # every --release-interval seconds
+            with lock:
+                if time.monotonic() < next_release[0]:
+                    return
+                next_release[0] = time.monotonic() + options['release_interval']
+            released = release_stale_claims()
+            if released:
+                self.stdout.write(f'Released {released} messages left SENDING by a stopped worker')
+
+        def work():
+            try:
+                while not stop.is_set():
+                    try:
+                        release_due()
+                        counts = dispatch_batch(gateway, options['batch_size'])
+                    except DatabaseError as e:
+                        # e.g. SQLite busy past its timeout; a batch claimed
+                        # before the error is released as a stale claim
+                        self.stderr.write(f'{threading.current_thread().name}: {e}; retrying')
+                        stop.wait(options['poll_interval'])
+                        continue
+                    with lock:
+                        for key, value in counts.items():
+                            totals[key] += value
+                    if not any(counts.values()):
+                        if options['once']:
+                            break
+                        stop.wait(options['poll_interval'])
+            finally:
+                close_old_connections()
+
+        workers = [
+            threading.Thread(target=work, name=f'sms-worker-{i}', daemon=True)
+            for i in range(options['workers'])
+        ]
+        self.stdout.write(f'SMS workers started ({len(workers)} threads, {gateway.__class__.__name__})')
+        start = time.monotonic()
+        for thread in workers:
+            thread.start()
+        try:
+            for thread in workers:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping; waiting for the batches being sent')
+            stop.set()
+            for thread in workers:
+                thread.join()
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"SMS workers stopped: {totals['sent']} sent, {totals['retried']} to retry, "
+            f"{totals['failed']} dead-lettered in {elapsed:.1f} s"
+        ))
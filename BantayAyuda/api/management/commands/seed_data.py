@@ -4,6 +4,7 @@ Run with: python manage.py seed_data
 """
 from django.core.management.base import BaseCommand
 from api.models import Household, DisasterEvent, DamageAssessment
+from api.payouts import cached_payouts
 from decimal import Decimal
 import random
 import requests
@@ -74,6 +75,7 @@ class Command(BaseCommand):
         street = random.choice(streets)
         return f"{house_number} {street}, {barangay}, {area_name}"
 
+    @cached_payouts()  # One payout rule lookup for every assessment created
     def handle(self, *args, **options):
         self.stdout.write('Starting to seed sample data...')
         
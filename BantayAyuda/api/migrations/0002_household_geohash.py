@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+from api.spatial import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Household = apps.get_model('api', 'Household')
+    households = list(Household.objects.only('id', 'latitude', 'longitude'))
+    for household in households:
+        household.geohash = encode_geohash(household.latitude, household.longitude)
+    Household.objects.bulk_update(households, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='household',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
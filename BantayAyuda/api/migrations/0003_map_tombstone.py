@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_household_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('household_pk', models.BigIntegerField()),
+                ('disaster_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='damageassessment',
+            index=models.Index(fields=['disaster', 'updated_at'], name='api_damagea_disaste_b8b744_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='household',
+            index=models.Index(fields=['updated_at'], name='api_househo_updated_2cfa85_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_map_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EctPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feature_hash', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=64)),
+                ('ect_amount', models.IntegerField()),
+                ('probabilities', models.JSONField(default=dict, help_text='Class probabilities keyed by ECT amount')),
+                ('predicted_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prediction', to='api.damageassessment')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_sms_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='damageassessment',
+            index=models.Index(fields=['disaster', 'damage_status', 'recommended_ect_amount'], name='api_damagea_disaste_086e29_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def populate_rollup(apps, schema_editor):
+    """Aggregate the existing assessments (later writes keep it up to date)"""
+    DamageAssessment = apps.get_model('api', 'DamageAssessment')
+    BudgetRollup = apps.get_model('api', 'BudgetRollup')
+    rows = (
+        DamageAssessment.objects.values('disaster_id', 'damage_status', barangay=F('household__barangay'),
+                                        ect_amount=F('recommended_ect_amount'))
+        .annotate(
+            count=Count('id'),
+            count_4ps=Count('id', filter=Q(household__is_4ps=True)),
+            amount_total=Sum('recommended_ect_amount'),
+        )
+        .order_by()
+    )
+    BudgetRollup.objects.bulk_create([BudgetRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_assessment_budget_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barangay', models.CharField(max_length=100)),
+                ('damage_status', models.CharField(choices=[('NONE', 'No Damage'), ('PARTIAL', 'Partial Damage'), ('TOTAL', 'Total Damage')], max_length=10)),
+                ('ect_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('count', models.IntegerField(default=0)),
+                ('count_4ps', models.IntegerField(default=0)),
+                ('amount_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('disaster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_rollups', to='api.disasterevent')),
+            ],
+            options={
+                'ordering': ['disaster', 'barangay', 'damage_status'],
+                'unique_together': {('disaster', 'barangay', 'damage_status', 'ect_amount')},
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:09
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_budget_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutRuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(editable=False)),
+                ('total_amount', models.PositiveIntegerField(help_text='ECT for TOTAL damage, in pesos', validators=[django.core.validators.MaxValueValidator(10000)])),
+                ('partial_amount', models.PositiveIntegerField(help_text='ECT for PARTIAL damage, in pesos', validators=[django.core.validators.MaxValueValidator(10000)])),
+                ('none_amount', models.PositiveIntegerField(default=0, help_text='ECT for NONE damage, in pesos', validators=[django.core.validators.MaxValueValidator(10000)])),
+                ('notes', models.TextField(blank=True)),
+                ('created_by', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('disaster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payout_rule_sets', to='api.disasterevent')),
+            ],
+            options={
+                'ordering': ['disaster', '-version'],
+                'unique_together': {('disaster', 'version')},
+            },
+        ),
+    ]
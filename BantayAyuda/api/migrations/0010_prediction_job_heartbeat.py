@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:43
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Keep the newest PENDING/RUNNING job per disaster so the constraint holds"""
+    PredictionJob = apps.get_model('api', 'PredictionJob')
+    seen = set()
+    for job in PredictionJob.objects.filter(status__in=['PENDING', 'RUNNING']).order_by('-created_at'):
+        if job.disaster_id in seen:
+            job.status = 'FAILED'
+            job.error = 'Superseded by a newer job for the same disaster'
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'finished_at'])
+        seen.add(job.disaster_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_payout_rule_set'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker', null=True),
+        ),
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='predictionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'RUNNING'])), fields=('disaster',), name='one_active_prediction_job'),
+        ),
+    ]
@@ -2,159 +2,398 @@
 ML Engine for ECT Allocation Prediction
 Combines CatBoost ML model with Gemini LLM for SMS generation
 """
-import pandas as pd
-import numpy as np
+import hashlib
+import logging
 import os
-from catboost import CatBoostClassifier, Pool
 from django.conf import settings
-import google.generativeai as genai
-
-# Model path - try both .cbm and .bin extensions
-MODEL_PATH_CBM = os.path.join(settings.BASE_DIR, 'data', 'ect_model.cbm')
-MODEL_PATH_BIN = os.path.join(settings.BASE_DIR, 'data', 'ect_model.cbm')  # Will check for .bin too
-model = None
-
-# Initialize model on module load
-def _load_model():
-    global model
-    if model is None:
-        # Try .cbm first, then .bin
-        model_path = None
-        if os.path.exists(MODEL_PATH_CBM):
-            model_path = MODEL_PATH_CBM
-        elif os.path.exists(os.path.join(settings.BASE_DIR, 'data', 'ect_allocation_model_v1.bin')):
-            model_path = os.path.join(settings.BASE_DIR, 'data', 'ect_allocation_model_v1.bin')
-        elif os.path.exists(os.path.join(settings.BASE_DIR, '..', 'ect_allocation_model-main', 'models', 'ect_allocation_model_v1.bin')):
-            # Fallback to original location
-            model_path = os.path.join(settings.BASE_DIR, '..', 'ect_allocation_model-main', 'models', 'ect_allocation_model_v1.bin')
-        
-        if model_path:
-            try:
-                model = CatBoostClassifier()
-                model.load_model(model_path)
-                print(f"[OK] Loaded ML model from: {model_path}")
-            except Exception as e:
-                print(f"Warning: Could not load ML model from {model_path}: {e}")
-                model = None
-        else:
-            print("Warning: No ML model file found. Run 'python train_model.py' or copy model to data/ folder.")
-    return model
+from django.db.models import F, QuerySet
 
-# Load model
-_load_model()
+from .model_registry import LoadedModel, registry
+from .model_server import ModelServerError, get_client
+
+# NumPy, pandas, CatBoost and google.generativeai are imported inside the
+# functions that use them: every view imports this module through api.urls,
+# and management commands, migrations and the admin should not pay for the
+# ML stack. It loads with the first prediction or generated SMS.
+
+logger = logging.getLogger(__name__)
+
+# Labels the bundled data/ect_model.cbm was trained with
+DAMAGE_LABELS = {
+    'TOTAL': 'Totally Damaged',
+    'PARTIAL': 'Partially Damaged',
+    'NONE': 'Not Damaged',
+}
+
+
+def _compile_model(loaded):
+    """Export the model for NumPy evaluation; None keeps predictions on CatBoost"""
+    from .tree_eval import compile_catboost
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', getattr(settings, 'GEMINI_API_KEY', ''))
-if GEMINI_API_KEY and GEMINI_API_KEY != '':
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
+        return compile_catboost(loaded)
     except Exception as e:
-        print(f"Warning: Could not configure Gemini API: {e}")
+        logger.warning("Could not compile ML model, using CatBoost for predictions: %s", e)
+        return None
 
 
-def predict_ect(household):
+def _damage_labels(compiled):
     """
-    Predict ECT amount using CatBoost model
-    
+    Map damage statuses to the labels the model was trained with. The
+    bundled model knows 'Totally Damaged' etc.; models trained by
+    train_catboost_ect_engine use the statuses themselves.
+    """
+    if compiled is None:
+        return None
+    if compiled.knows_category('Damage_Classification', 'TOTAL'):
+        return None
+    if all(compiled.knows_category('Damage_Classification', label) for label in DAMAGE_LABELS.values()):
+        return DAMAGE_LABELS
+    return None
+
+
+def load_model_file(path, version, metadata):
+    """Registry loader: read a model file and prepare it for prediction"""
+    from catboost import CatBoostClassifier
+
+    model = CatBoostClassifier()
+    model.load_model(path)
+    compiled = _compile_model(model)
+    return LoadedModel(
+        version=version,
+        path=path,
+        model=model,
+        compiled=compiled,
+        damage_labels=_damage_labels(compiled),
+        metadata=metadata,
+    )
+
+
+def get_model():
+    """
+    The LoadedModel to predict with, or None if no model is available.
+    Loaded lazily on first use and hot-reloaded when a new version is
+    promoted (see api/model_registry.py).
+    """
+    return registry.current()
+
+
+def model_info_in_process():
+    """Version and details of the model loaded in this process, or None"""
+    loaded = get_model()
+    if loaded is None:
+        return None
+    return {
+        'version': loaded.version,
+        'numpy_evaluator': loaded.compiled is not None,
+        'metadata': loaded.metadata,
+    }
+
+
+def model_info():
+    """
+    Version and details of the model predictions are made with: the model
+    server's when settings.ML_MODEL_SERVER is set and reachable, otherwise
+    this process's. None without a model.
+    """
+    client = get_client()
+    if client is not None:
+        try:
+            return {**client.info(), 'served_by': 'model-server'}
+        except ModelServerError as e:
+            logger.warning("Model server unavailable, using the in-process model: %s", e)
+    info = model_info_in_process()
+    return {**info, 'served_by': 'in-process'} if info is not None else None
+
+
+def current_model_version():
+    """Version of the model predictions are made with; None without a model"""
+    info = model_info()
+    return info['version'] if info is not None else None
+
+# Configure Gemini API
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', getattr(settings, 'GEMINI_API_KEY', ''))
+_genai = None
+
+
+def _gemini():
+    """google.generativeai, imported and configured on first use"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        try:
+            genai.configure(api_key=GEMINI_API_KEY)
+        except Exception as e:
+            logger.warning("Could not configure Gemini API: %s", e)
+        _genai = genai
+    return _genai
+
+
+# Feature columns used by train_catboost_ect_engine (must match training order).
+# The loaded model decides which columns it actually reads (model.feature_names_):
+# the bundled data/ect_model.cbm additionally uses Latitude/Longitude.
+FEATURE_COLUMNS = [
+    'Barangay_ID',           # 0 - categorical
+    'Flood_Depth_Meters',    # 1 - numeric
+    'House_Height_Meters',   # 2 - numeric
+    'House_Width_Meters',    # 3 - numeric
+    'Damage_Classification', # 4 - categorical
+    'Is_4Ps_Recipient',      # 5 - numeric (0/1)
+    'Flood_Height_Ratio'     # 6 - numeric
+]
+
+# Input row keys -> model columns
+_ROW_COLUMNS = {
+    'barangay': 'Barangay_ID',
+    'latitude': 'Latitude',
+    'longitude': 'Longitude',
+    'flood_depth': 'Flood_Depth_Meters',
+    'house_height': 'House_Height_Meters',
+    'house_width': 'House_Width_Meters',
+    'damage_status': 'Damage_Classification',
+    'is_4ps': 'Is_4Ps_Recipient',
+}
+
+# values() expressions reading the feature row of each DamageAssessment
+ASSESSMENT_FEATURES = {
+    'barangay': F('household__barangay'),
+    'latitude': F('household__latitude'),
+    'longitude': F('household__longitude'),
+    'flood_depth': F('household__flood_depth'),
+    'house_height': F('household__house_height'),
+    'house_width': F('household__house_width'),
+    'is_4ps': F('household__is_4ps'),
+}
+
+
+def build_feature_columns(rows):
+    """
+    Build the model's feature columns for many households at once.
+
     Args:
-        household: Household model instance
-        
+        rows: list of dicts with the keys of _ROW_COLUMNS
+
     Returns:
-        int: Predicted ECT amount (0, 5000, or 10000)
+        dict: model column name -> NumPy array, Flood_Height_Ratio computed
+              column-wise
     """
-    global model
-    
-    # Load model if not loaded
-    if model is None:
-        model = _load_model()
-    
-    # If model doesn't exist, return None (will use rule-based)
-    if model is None:
-        return None
-    
+    import numpy as np
+
+    columns = {
+        'Barangay_ID': np.array([str(row['barangay']) for row in rows], dtype=object),
+        'Latitude': np.array([row['latitude'] for row in rows], dtype=float),
+        'Longitude': np.array([row['longitude'] for row in rows], dtype=float),
+        'Flood_Depth_Meters': np.array([row['flood_depth'] for row in rows], dtype=float),
+        'House_Height_Meters': np.array([row['house_height'] for row in rows], dtype=float),
+        'House_Width_Meters': np.array([row['house_width'] for row in rows], dtype=float),
+        'Damage_Classification': np.array([str(row['damage_status']) for row in rows], dtype=object),
+        'Is_4Ps_Recipient': np.array([row['is_4ps'] for row in rows], dtype=int),
+    }
+    columns['Flood_Height_Ratio'] = np.minimum(
+        columns['Flood_Depth_Meters'] / columns['House_Height_Meters'],
+        1.0
+    )
+    return columns
+
+
+def build_feature_frame(rows):
+    """
+    Build the model's feature matrix for many households at once.
+
+    Args:
+        rows: list of dicts with the keys of _ROW_COLUMNS
+
+    Returns:
+        DataFrame with one row per input row (see build_feature_columns)
+    """
+    import pandas as pd
+
+    return pd.DataFrame(build_feature_columns(rows))
+
+
+def feature_hash(row):
+    """
+    Stable hash of a feature row (see build_feature_frame), used to tell
+    whether a stored prediction is still valid for the row.
+    """
+    key = '|'.join([
+        str(row['barangay']),
+        f"{float(row['latitude']):.6f}",
+        f"{float(row['longitude']):.6f}",
+        repr(float(row['flood_depth'])),
+        repr(float(row['house_height'])),
+        repr(float(row['house_width'])),
+        str(row['damage_status']),
+        str(int(row['is_4ps'])),
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def predict_ect_details(rows, loaded=None):
+    """
+    Predict ECT amounts and class probabilities for many households with a
+    single model call
+
+    Args:
+        rows: DamageAssessment queryset, or list of dicts with keys barangay,
+              latitude, longitude, flood_depth, house_height, house_width,
+              damage_status and is_4ps
+        loaded: LoadedModel to predict with (default: the model server when
+                configured, otherwise the active model)
+
+    Returns:
+        list: One dict per row, in input order, with 'ect_amount' (0, 5000
+              or 10000) and 'probabilities' ({amount: probability}); or None
+              for every row if the model is unavailable or fails
+    """
+    if isinstance(rows, QuerySet):
+        rows = list(rows.values('damage_status', **ASSESSMENT_FEATURES))
+    if not rows:
+        return []
+
+    # Without an explicit model, route to the model server or the active model
+    if loaded is None:
+        return predict_versioned(rows)[1]
+    return _predict_with(rows, loaded)
+
+
+def predict_versioned(rows):
+    """
+    Predict feature rows on the model server when settings.ML_MODEL_SERVER
+    is set, falling back to in-process inference if it is unreachable.
+
+    Args:
+        rows: list of dicts, see predict_ect_details
+
+    Returns:
+        tuple: (model version or None, list of predict_ect_details results)
+    """
+    if not rows:
+        return current_model_version(), []
+    client = get_client()
+    if client is not None:
+        try:
+            return client.predict([{key: row[key] for key in _ROW_COLUMNS} for row in rows])
+        except ModelServerError as e:
+            logger.warning("Model server unavailable, predicting in-process: %s", e)
+    return predict_in_process(rows)
+
+
+def predict_in_process(rows):
+    """(model version, predictions) from the model loaded in this process"""
+    loaded = get_model()  # Loads the model on first use
+    if loaded is None:
+        # If model doesn't exist, return None (will use rule-based)
+        return None, [None] * len(rows)
+    return loaded.version, _predict_with(rows, loaded)
+
+
+def _predict_with(rows, loaded):
+    import numpy as np
+
+    model = loaded.model
+
     try:
-        # Get damage status from latest assessment
-        damage_status = 'NONE'
-        if household.assessments.exists():
-            latest_assessment = household.assessments.first()
-            damage_status = latest_assessment.damage_status
-        
-        # Prepare features
-        df = pd.DataFrame([{
-            'Barangay_ID': household.barangay,
-            'Flood_Depth_Meters': float(household.flood_depth),
-            'House_Height_Meters': float(household.house_height),
-            'House_Width_Meters': float(household.house_width),
-            'Damage_Classification': damage_status,
-            'Is_4Ps_Recipient': int(household.is_4ps)
-        }])
-        
-        # Calculate flood height ratio
-        df['Flood_Height_Ratio'] = np.minimum(
-            df['Flood_Depth_Meters'] / df['House_Height_Meters'], 
-            1.0
-        )
-        
-        # Select features for prediction (must match training order)
-        X = df[[
-            'Barangay_ID',           # 0 - categorical
-            'Flood_Depth_Meters',    # 1 - numeric
-            'House_Height_Meters',   # 2 - numeric
-            'House_Width_Meters',    # 3 - numeric
-            'Damage_Classification', # 4 - categorical
-            'Is_4Ps_Recipient',      # 5 - numeric (0/1)
-            'Flood_Height_Ratio'     # 6 - numeric
-        ]]
-        
-        # Use Pool to specify categorical features correctly
-        cat_features = [0, 4]  # Barangay_ID and Damage_Classification are categorical
-        pool = Pool(X, cat_features=cat_features)
-        
-        # Predict
-        prediction = model.predict(pool)
-        ect_amount = int(prediction[0])
-        
-        # Ensure valid ECT amounts (0, 5000, 10000)
-        if ect_amount not in [0, 5000, 10000]:
-            # Round to nearest valid amount
-            if ect_amount < 2500:
-                ect_amount = 0
-            elif ect_amount < 7500:
-                ect_amount = 5000
-            else:
-                ect_amount = 10000
-        
-        return ect_amount
-        
+        columns = build_feature_columns(rows)
+
+        if loaded.damage_labels:
+            columns['Damage_Classification'] = np.array(
+                [loaded.damage_labels.get(status, status) for status in columns['Damage_Classification']],
+                dtype=object
+            )
+
+        # One call for the whole batch; the predicted class is the most likely one.
+        # The NumPy evaluator reads the columns directly; CatBoost is the fallback.
+        if loaded.compiled is not None:
+            probabilities = loaded.compiled.predict_proba(columns)
+        else:
+            import pandas as pd
+            from catboost import Pool
+
+            # Select the model's features and use Pool to mark categorical ones
+            X = pd.DataFrame(columns)[model.feature_names_ or FEATURE_COLUMNS]
+            pool = Pool(X, cat_features=model.get_cat_feature_indices())
+            probabilities = np.asarray(model.predict_proba(pool))
+        classes = [int(c) for c in model.classes_]
+        amounts = np.asarray(classes, dtype=float)[probabilities.argmax(axis=1)]
+
+        # Ensure valid ECT amounts (0, 5000, 10000) by rounding to nearest
+        amounts = np.where(amounts < 2500, 0, np.where(amounts < 7500, 5000, 10000))
+        return [
+            {
+                'ect_amount': amount,
+                'probabilities': {str(c): round(float(p), 6) for c, p in zip(classes, row)},
+            }
+            for amount, row in zip(amounts.tolist(), probabilities)
+        ]
+
     except Exception as e:
-        print(f"Error in ML prediction: {e}")
-        return None
+        logger.warning("Error in ML prediction: %s", e)
+        return [None] * len(rows)
 
 
-def generate_sms(amount, household_id, brgy, status):
+def predict_ect_batch(rows):
+    """
+    Predict ECT amounts for many households with a single model call
+
+    Args:
+        rows: see predict_ect_details
+
+    Returns:
+        list: Predicted ECT amounts (0, 5000 or 10000), in input order,
+              or None for every row if the model is unavailable or fails
+    """
+    return [
+        detail['ect_amount'] if detail is not None else None
+        for detail in predict_ect_details(rows)
+    ]
+
+
+def predict_ect(household, assessment=None):
     """
-    Generate empathetic Tagalog SMS using Gemini API or fallback template
+    Predict ECT amount using CatBoost model
     
     Args:
-        amount: ECT amount (0, 5000, or 10000)
-        household_id: Household ID
-        brgy: Barangay name
-        status: Damage status
+        household: Household model instance
+        assessment: The household's DamageAssessment for the disaster being
+                    predicted, or just its damage status ('TOTAL', 'PARTIAL',
+                    'NONE'). Defaults to 'NONE' (not assessed). No database
+                    queries are made.
         
     Returns:
-        str: SMS message in Tagalog
+        int: Predicted ECT amount (0, 5000, or 10000)
     """
-    # Fallback SMS template
+    if assessment is None:
+        damage_status = 'NONE'
+    elif isinstance(assessment, str):
+        damage_status = assessment
+    else:
+        damage_status = assessment.damage_status
+
+    return predict_ect_batch([{
+        'barangay': household.barangay,
+        'latitude': household.latitude,
+        'longitude': household.longitude,
+        'flood_depth': household.flood_depth,
+        'house_height': household.house_height,
+        'house_width': household.house_width,
+        'damage_status': damage_status,
+        'is_4ps': household.is_4ps,
+    }])[0]
+
+
+def sms_template(amount, household_id, brgy, status):
+    """Fallback SMS text, used when Gemini is not configured or fails"""
     if amount == 0:
         return f"DSWD: {household_id} sa {brgy} ay {status}. Wala pong ECT. Apela sa MSWDO."
-    
+
     status_txt = "lubos na nasira" if amount == 10000 else "bahagyang nasira"
-    fallback_sms = f"DSWD-ECT: Aprubado ang PHP{amount:,} para sa {household_id} sa {brgy} dahil sa {status_txt}. Antayin ang LGU. #DSWDMayMalasakit"
-    
-    # Try Gemini API if configured
-    if GEMINI_API_KEY and GEMINI_API_KEY != '':
-        try:
-            prompt = f"""You are a DSWD (Department of Social Welfare and Development) agent. Generate a compassionate, professional SMS message in Filipino/Tagalog to inform a household about their Emergency Cash Transfer (ECT) allocation.
+    return f"DSWD-ECT: Aprubado ang PHP{amount:,} para sa {household_id} sa {brgy} dahil sa {status_txt}. Antayin ang LGU. #DSWDMayMalasakit"
+
+
+def sms_prompt(amount, household_id, brgy, status):
+    """Gemini prompt for one household's SMS"""
+    return f"""You are a DSWD (Department of Social Welfare and Development) agent. Generate a compassionate, professional SMS message in Filipino/Tagalog to inform a household about their Emergency Cash Transfer (ECT) allocation.
 
 Household Information:
 - Household ID: {household_id}
@@ -171,8 +410,54 @@ Requirements:
 6. Use #DSWDMayMalasakit hashtag
 
 Generate the SMS message:"""
+
+
+# Bump when sms_template_prompt changes: cached templates are keyed by it
+SMS_PROMPT_VERSION = 1
+
+# Stands in for the household ID in generated templates
+HOUSEHOLD_PLACEHOLDER = '{household_id}'
+
+
+def sms_template_prompt(amount, brgy, status):
+    """
+    Gemini prompt for an SMS template shared by every household with the
+    same amount, damage status and barangay; the household ID is written as
+    HOUSEHOLD_PLACEHOLDER and filled in per household.
+    """
+    return sms_prompt(amount, HOUSEHOLD_PLACEHOLDER, brgy, status).replace(
+        "\n\nGenerate the SMS message:",
+        f"\n7. Write {HOUSEHOLD_PLACEHOLDER} exactly as written wherever the household ID goes"
+        "\n\nGenerate the SMS message:",
+    )
+
+
+def generate_sms(amount, household_id, brgy, status):
+    """
+    Generate empathetic Tagalog SMS using Gemini API or fallback template.
+    For many households use api.sms_pipeline.generate_sms_many, which
+    makes the Gemini calls concurrently.
+    
+    Args:
+        amount: ECT amount (0, 5000, or 10000)
+        household_id: Household ID
+        brgy: Barangay name
+        status: Damage status
+        
+    Returns:
+        str: SMS message in Tagalog
+    """
+    # Fallback SMS template
+    fallback_sms = sms_template(amount, household_id, brgy, status)
+    if amount == 0:
+        return fallback_sms
+    
+    # Try Gemini API if configured
+    if GEMINI_API_KEY and GEMINI_API_KEY != '':
+        try:
+            prompt = sms_prompt(amount, household_id, brgy, status)
             
-            model = genai.GenerativeModel('gemini-pro')
+            model = _gemini().GenerativeModel('gemini-pro')
             response = model.generate_content(prompt)
             generated_text = response.text.strip()
             
@@ -180,7 +465,7 @@ Generate the SMS message:"""
             if generated_text and len(generated_text) > 20:
                 return generated_text
         except Exception as e:
-            print(f"Warning: Gemini API error, using fallback: {e}")
+            logger.warning("Gemini API error, using the fallback SMS: %s", e)
     
     # Return fallback
     return fallback_sms
@@ -196,19 +481,10 @@ def train_catboost_ect_engine(df):
     Returns:
         CatBoostClassifier: Trained model
     """
-    # Define features
-    feature_cols = [
-        'Barangay_ID',
-        'Flood_Depth_Meters',
-        'House_Height_Meters',
-        'House_Width_Meters',
-        'Damage_Classification',
-        'Is_4Ps_Recipient',
-        'Flood_Height_Ratio'
-    ]
-    
+    from catboost import CatBoostClassifier
+
     # Prepare data
-    X = df[feature_cols]
+    X = df[FEATURE_COLUMNS]
     y = df['ECT_Amount']
     
     # Split data
@@ -0,0 +1,283 @@
+"""
+Versioned ML model registry with lazy loading and hot reload.
+
+Layout (settings.ML_MODEL_REGISTRY, default data/models/):
+
+    data/models/
+        ACTIVE                      name of the promoted version
+        <version>/model.cbm         CatBoost model file
+        <version>/metadata.json     version, sha256, created_at, features, classes, notes
+
+Registering copies a model file into a new version directory; promoting
+rewrites ACTIVE with an atomic rename. Every process checks ACTIVE at most
+once per ML_MODEL_CHECK_INTERVAL seconds. When it changed, the new version
+is loaded on a background thread while requests keep using the old one,
+then swapped in with a single reference assignment, so workers pick up new
+models without a restart and without a cold-start pause.
+
+Without a registry (no ACTIVE file) the legacy data/ect_model.cbm is served,
+versioned by its content hash.
+
+Nothing is loaded at import time: the first prediction loads the model.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_FILE = 'ACTIVE'
+MODEL_FILE = 'model.cbm'
+METADATA_FILE = 'metadata.json'
+
+
+class LoadedModel:
+    """A model version loaded into memory, as returned by ModelRegistry.current()"""
+
+    def __init__(self, version, path, model, compiled=None, damage_labels=None, metadata=None):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.compiled = compiled            # api.tree_eval.ObliviousTrees, or None
+        self.damage_labels = damage_labels  # Damage status -> training label, or None
+        self.metadata = metadata or {}
+
+    def __repr__(self):
+        return f'<LoadedModel {self.version}>'
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ModelRegistry:
+    """
+    Args:
+        root: registry directory
+        legacy_paths: model files to serve when nothing has been promoted
+        loader: callable(path, version, metadata) -> LoadedModel, or its
+                dotted path (imported on first load, keeping CatBoost out
+                of processes that never predict)
+        check_interval: seconds between checks of the ACTIVE pointer
+    """
+
+    def __init__(self, root, legacy_paths, loader, check_interval=5.0):
+        self.root = root
+        self.legacy_paths = legacy_paths
+        self.loader = loader
+        self.check_interval = check_interval
+
+        self._loaded = None
+        self._lock = threading.Lock()
+        self._loading = None            # Version being loaded in the background
+        self._failed = {}               # Version -> time of the last failed load
+        self._active = None             # (version, path, metadata) from the last check
+        self._checked_at = 0.0
+        self._legacy = None             # ((path, mtime, size), active tuple) of the legacy file
+
+    # --- Active version ---
+
+    def _read_active(self):
+        """(version, path, metadata) of the promoted version, or of the legacy model file"""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = None
+
+        if version:
+            path = os.path.join(self.root, version, MODEL_FILE)
+            if os.path.exists(path):
+                return version, path, self.metadata(version)
+            logger.warning('Active model version %s has no %s; ignoring it', version, MODEL_FILE)
+
+        for path in self.legacy_paths:
+            if os.path.exists(path):
+                # Only re-hash the legacy file when it changed on disk
+                stat = os.stat(path)
+                key = (path, stat.st_mtime_ns, stat.st_size)
+                if self._legacy is None or self._legacy[0] != key:
+                    self._legacy = (key, (f'legacy-{file_sha256(path)[:16]}', path, {'source': path}))
+                return self._legacy[1]
+        return None
+
+    def active(self):
+        """(version, path, metadata) that should be served, re-checked every check_interval"""
+        now = time.monotonic()
+        if self._active is None or now - self._checked_at >= self.check_interval:
+            self._active = self._read_active()
+            self._checked_at = now
+        return self._active
+
+    def active_version(self):
+        """Version that should be served (cheap: does not load the model)"""
+        active = self.active()
+        return active[0] if active else None
+
+    # --- Loading ---
+
+    def _load(self, version, path, metadata):
+        try:
+            if isinstance(self.loader, str):
+                self.loader = import_string(self.loader)
+            loaded = self.loader(path, version, metadata)
+        except Exception:
+            logger.exception('Could not load ML model %s from %s', version, path)
+            self._failed[version] = time.monotonic()
+            return None
+        with self._lock:
+            self._loaded = loaded
+        logger.info('Loaded ML model %s from %s', version, path)
+        return loaded
+
+    def _load_in_background(self, version, path, metadata):
+        with self._lock:
+            if self._loading == version:
+                return
+            self._loading = version
+
+        def run():
+            try:
+                self._load(version, path, metadata)
+            finally:
+                with self._lock:
+                    self._loading = None
+
+        threading.Thread(target=run, name=f'model-load-{version}', daemon=True).start()
+
+    def current(self):
+        """
+        The LoadedModel to predict with, or None if no model is available.
+
+        The first call loads synchronously; a newly promoted version is
+        loaded in the background while the previous one keeps serving.
+        """
+        active = self.active()
+        loaded = self._loaded
+        if active is None:
+            return loaded
+        version, path, metadata = active
+        if loaded is not None and loaded.version == version:
+            return loaded
+
+        # Don't retry a broken model file on every request
+        failed_at = self._failed.get(version)
+        if failed_at is not None and time.monotonic() - failed_at < max(self.check_interval, 30.0):
+            return loaded
+
+        if loaded is None:
+            return self._load(version, path, metadata)
+        self._load_in_background(version, path, metadata)
+        return loaded
+
+    def reload(self):
+        """Re-check ACTIVE now and load the active version synchronously"""
+        self._checked_at = 0.0
+        active = self.active()
+        if active is None:
+            return None
+        loaded = self._loaded
+        if loaded is not None and loaded.version == active[0]:
+            return loaded
+        return self._load(*active)
+
+    # --- Registering and promoting ---
+
+    def metadata(self, version):
+        try:
+            with open(os.path.join(self.root, version, METADATA_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'version': version}
+
+    def versions(self):
+        """Metadata of every registered version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        versions = [
+            self.metadata(name)
+            for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, MODEL_FILE))
+        ]
+        return sorted(versions, key=lambda meta: (meta.get('created_at', ''), meta['version']))
+
+    def promoted_version(self):
+        """Version named in ACTIVE (None when serving the legacy model)"""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def register(self, source_path, notes='', metadata=None):
+        """
+        Copy a model file into the registry as a new version.
+
+        Returns:
+            str: the new version name (timestamp plus content hash)
+        """
+        digest = file_sha256(source_path)
+        created_at = timezone.now()
+        version = f"{created_at:%Y%m%d-%H%M%S}-{digest[:8]}"
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        try:
+            shutil.copyfile(source_path, os.path.join(staging, MODEL_FILE))
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump({
+                    'version': version,
+                    'sha256': digest,
+                    'created_at': created_at.isoformat(),
+                    'source': os.path.abspath(source_path),
+                    'notes': notes,
+                    **(metadata or {}),
+                }, f, indent=2)
+            os.rename(staging, os.path.join(self.root, version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+    def promote(self, version):
+        """
+        Make ``version`` the active model for every process (atomic rename).
+
+        Raises:
+            ValueError: if the version is not registered
+        """
+        if not os.path.exists(os.path.join(self.root, version, MODEL_FILE)):
+            raise ValueError(f'Unknown model version: {version}')
+        fd, staging = tempfile.mkstemp(dir=self.root, prefix='.active-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(staging, os.path.join(self.root, ACTIVE_FILE))
+        self._checked_at = 0.0  # This process picks it up on its next prediction
+
+
+# Model files served when no registry version has been promoted, in order
+LEGACY_MODEL_PATHS = [
+    os.path.join(settings.BASE_DIR, 'data', 'ect_model.cbm'),
+    os.path.join(settings.BASE_DIR, 'data', 'ect_allocation_model_v1.bin'),
+    # Fallback to original location
+    os.path.join(settings.BASE_DIR, '..', 'ect_allocation_model-main', 'models', 'ect_allocation_model_v1.bin'),
+]
+
+# The process-wide registry used by api/ml_engine.py
+registry = ModelRegistry(
+    getattr(settings, 'ML_MODEL_REGISTRY', os.path.join(settings.BASE_DIR, 'data', 'models')),
+    legacy_paths=LEGACY_MODEL_PATHS,
+    loader='api.ml_engine.load_model_file',
+    check_interval=getattr(settings, 'ML_MODEL_CHECK_INTERVAL', 5.0),
+)
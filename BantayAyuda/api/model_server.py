@@ -0,0 +1,358 @@
+"""
+Shared out-of-process model server.
+
+By default every web worker loads the CatBoost model itself (see
+api/model_registry.py). With settings.ML_MODEL_SERVER set, workers instead
+send their feature rows to one `python manage.py run_model_server` process
+that holds the only copy of the model:
+
+    ML_MODEL_SERVER = 'unix:/run/bantayayuda/model.sock'   # or '127.0.0.1:8765'
+
+Requests from all workers are micro-batched: requests that arrive while the
+model is busy (optionally also those arriving within a short wait) are run
+through the model in one call, and every request gets its own rows back.
+
+Protocol: length-prefixed JSON frames (4-byte big-endian length, UTF-8 JSON)
+over a persistent connection.
+
+    {"op": "predict", "rows": [...]}  ->  {"version": ..., "predictions": [...]}
+    {"op": "info"}                    ->  {"version": ..., "numpy_evaluator": ..., "metadata": {...}}
+    any failure                       ->  {"error": "..."}
+
+api/ml_engine.py routes predictions here when configured and falls back to
+in-process inference when the server is unreachable or fails.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from decimal import Decimal
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_FRAME = struct.Struct('>I')
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+# Seconds to skip an unreachable server before trying it again
+RETRY_AFTER = 5.0
+
+
+class ModelServerError(Exception):
+    """The model server could not be reached or failed to answer"""
+
+
+def parse_address(address):
+    """
+    'unix:/path', '/path' or 'host:port' -> (socket family, address)
+
+    Raises:
+        ValueError: if the address is not in one of those forms
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if address.startswith('/'):
+        return socket.AF_UNIX, address
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"Model server address must be 'unix:/path' or 'host:port', not {address!r}")
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def send_frame(sock, message):
+    payload = json.dumps(message, default=_json_default).encode()
+    sock.sendall(_FRAME.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """Read one message; raises ConnectionError on EOF"""
+    (size,) = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f'Frame of {size} bytes exceeds the limit')
+    return json.loads(_recv_exactly(sock, size))
+
+
+# --- Server ---
+
+class MicroBatcher:
+    """
+    Merge concurrent predict requests into batched model calls.
+
+    Requests that queue up while the model is busy always go into the next
+    call, so batches grow with load without delaying a lone request.
+
+    Args:
+        predict: callable(rows) -> (model version, list of per-row results)
+        max_batch_rows: run the batch as soon as it has this many rows
+        max_wait: extra seconds to wait for more requests after the first
+                  one (0: only take the requests already queued)
+    """
+
+    def __init__(self, predict, max_batch_rows=1024, max_wait=0.0):
+        self.predict = predict
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='model-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """Queue rows for prediction; the Future resolves to (version, results)"""
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_rows:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rows = [row for request_rows, _ in batch for row in request_rows]
+        self.batches += 1
+        self.requests += len(batch)
+        try:
+            version, results = self.predict(rows)
+        except Exception as e:
+            logger.exception('Batched prediction of %d rows failed', len(rows))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_rows, future in batch:
+            future.set_result((version, results[offset:offset + len(request_rows)]))
+            offset += len(request_rows)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                response = self.server.answer(message)
+            except Exception as e:
+                response = {'error': f'{type(e).__name__}: {e}'}
+            try:
+                send_frame(self.request, response)
+            except OSError:
+                return
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.BaseServer):
+    """
+    Serve predictions over a Unix socket or TCP (see parse_address), one
+    thread per client connection, with model calls micro-batched.
+
+    Args:
+        address: see parse_address
+        predict: callable(rows) -> (model version, list of per-row results)
+        info: callable() -> dict describing the loaded model, or None
+        max_batch_rows, max_wait: see MicroBatcher
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, predict, info=None, max_batch_rows=1024, max_wait=0.0):
+        self.family, self.bind_address = parse_address(address)
+        self.info = info
+        self.batcher = MicroBatcher(predict, max_batch_rows, max_wait)
+        super().__init__(self.bind_address, _RequestHandler)
+        self.socket = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            if self.family == socket.AF_UNIX:
+                self._remove_stale_socket()
+            else:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(self.bind_address)
+            self.server_address = self.socket.getsockname()
+            self.socket.listen(128)
+        except Exception:
+            self.server_close()
+            raise
+
+    def _remove_stale_socket(self):
+        """Remove a socket file left by a server that is no longer running"""
+        if not os.path.exists(self.bind_address):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.bind_address)
+        except OSError:
+            os.unlink(self.bind_address)
+        else:
+            raise OSError(f'A model server is already listening on {self.bind_address}')
+        finally:
+            probe.close()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def get_request(self):
+        return self.socket.accept()
+
+    def shutdown_request(self, request):
+        try:
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        request.close()
+
+    def server_close(self):
+        super().server_close()
+        self.socket.close()
+        self.batcher.stop()
+        if self.family == socket.AF_UNIX and os.path.exists(self.bind_address):
+            os.unlink(self.bind_address)
+
+    def answer(self, message):
+        op = message.get('op')
+        if op == 'predict':
+            version, predictions = self.batcher.submit(message['rows']).result()
+            return {'version': version, 'predictions': predictions}
+        if op == 'info':
+            return (self.info() if self.info else None) or {'error': 'No ML model available'}
+        return {'error': f'Unknown op: {op!r}'}
+
+
+# --- Client ---
+
+class ModelServerClient:
+    """
+    Thread-safe client: each thread keeps its own persistent connection.
+
+    Args:
+        address: see parse_address
+        timeout: seconds to wait for a connection or an answer
+    """
+
+    def __init__(self, address, timeout=10.0):
+        self.address = address
+        self.family, self.connect_address = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.connect_address)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
+
+    def request(self, message):
+        """
+        Send one message and return the answer.
+
+        Raises:
+            ModelServerError: if the server is unreachable, times out or
+                              answers with an error
+        """
+        if time.monotonic() < self._down_until:
+            raise ModelServerError(f'Model server {self.address} was unreachable; retrying later')
+
+        # A kept-alive connection may have been closed by a server restart:
+        # retry once on a fresh one
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_frame(sock, message)
+                response = recv_frame(sock)
+                break
+            except (OSError, ValueError) as e:
+                self.close()
+                if attempt or isinstance(e, (socket.timeout, FileNotFoundError, ConnectionRefusedError)):
+                    self._down_until = time.monotonic() + RETRY_AFTER
+                    raise ModelServerError(f'Model server {self.address}: {e}') from e
+
+        if 'error' in response:
+            raise ModelServerError(response['error'])
+        return response
+
+    def predict(self, rows):
+        """(model version, per-row results) for a list of feature rows"""
+        response = self.request({'op': 'predict', 'rows': rows})
+        return response['version'], response['predictions']
+
+    def info(self):
+        return self.request({'op': 'info'})
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """Client for settings.ML_MODEL_SERVER, or None when it isn't configured"""
+    address = getattr(settings, 'ML_MODEL_SERVER', '')
+    if not address:
+        return None
+    timeout = getattr(settings, 'ML_MODEL_SERVER_TIMEOUT', 10.0)
+    with _clients_lock:
+        client = _clients.get((address, timeout))
+        if client is None:
+            client = _clients[(address, timeout)] = ModelServerClient(address, timeout)
+    return client
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from .spatial import encode_geohash
 
 
 class Household(models.Model):
@@ -10,6 +13,8 @@ class Household(models.Model):
     barangay = models.CharField(max_length=100)
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    # Spatial grid index (see api/spatial.py), derived from latitude/longitude
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     # ML Features
     flood_depth = models.FloatField(default=0.0, help_text="Flood depth in meters")
     house_height = models.FloatField(default=4.0, help_text="House height in meters")
@@ -21,6 +26,19 @@ class Household(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [models.Index(fields=['updated_at'])]
+
+    def save(self, *args, **kwargs):
+        """Keep the geohash grid cell in sync with the coordinates"""
+        # Remember the cell we are leaving so map clusters can be updated
+        self._previous_geohash = self.geohash
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        # Atomic so the budget rollup (moved by a signal) changes with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.household_id or self.name} - {self.barangay}"
@@ -67,24 +85,28 @@ class DamageAssessment(models.Model):
     class Meta:
         unique_together = ['household', 'disaster']
         ordering = ['-assessed_at']
+        indexes = [
+            models.Index(fields=['disaster', 'updated_at']),
+            # Covers the budget summary's status x amount aggregation
+            models.Index(fields=['disaster', 'damage_status', 'recommended_ect_amount']),
+        ]
 
     def save(self, *args, **kwargs):
         """
         CRITICAL IMPLEMENTATION: Automatically implements the hackathon's core business logic.
-        Uses PAYOUT_CRITERIA from PDF 1 (Page 2) and PDF 2 (Page 4):
+        The amount per damage status comes from the disaster's current payout
+        rule set (see api/payouts.py), by default PAYOUT_CRITERIA from PDF 1
+        (Page 2) and PDF 2 (Page 4):
         - TOTAL damage = ₱10,000
         - PARTIAL damage = ₱5,000
         - NONE damage = ₱0
         
         ML Override: If flood_depth > 0, use ML prediction instead of rule-based
         """
-        # Rule-based (fallback)
-        if self.damage_status == self.DamageStatus.TOTAL:
-            self.recommended_ect_amount = 10000
-        elif self.damage_status == self.DamageStatus.PARTIAL:
-            self.recommended_ect_amount = 5000
-        else:  # NONE
-            self.recommended_ect_amount = 0
+        from .payouts import payout_for
+
+        # Rule-based (fallback); payouts.recompute() applies the same rule in bulk
+        self.recommended_ect_amount = payout_for(self.disaster_id, self.damage_status)
         
         # ML Override (if flood data exists) - disabled during bulk operations
         # ML predictions are handled via API endpoint /api/ml/predict/
@@ -92,14 +114,221 @@ class DamageAssessment(models.Model):
         # if self.household.flood_depth > 0:
         #     try:
         #         from .ml_engine import predict_ect
-        #         ml_amount = predict_ect(self.household)
+        #         ml_amount = predict_ect(self.household, self)
         #         if ml_amount is not None:
         #             self.recommended_ect_amount = ml_amount
         #     except Exception:
         #         # If ML fails, use rule-based
         #         pass
         
-        super().save(*args, **kwargs)
+        # Atomic so the budget rollup (updated by a signal) changes with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.household.name} - {self.disaster.name}: {self.damage_status} (₱{self.recommended_ect_amount})"
+
+
+class BudgetRollup(models.Model):
+    """
+    Budget totals per disaster x barangay x damage status x ECT amount, kept
+    in step with every DamageAssessment and Household write (see
+    api/rollup.py), so the budget summary reads a few rows per barangay.
+    Splitting by amount keeps the summary's by_amount exact.
+    """
+    disaster = models.ForeignKey(DisasterEvent, on_delete=models.CASCADE, related_name='budget_rollups')
+    barangay = models.CharField(max_length=100)
+    damage_status = models.CharField(max_length=10, choices=DamageAssessment.DamageStatus.choices)
+    ect_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    count = models.IntegerField(default=0)
+    count_4ps = models.IntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['disaster', 'barangay', 'damage_status', 'ect_amount']
+        ordering = ['disaster', 'barangay', 'damage_status']
+
+    def __str__(self):
+        return f"{self.disaster_id} / {self.barangay} / {self.damage_status} ₱{self.ect_amount}: {self.count}"
+
+
+class PayoutRuleSet(models.Model):
+    """
+    ECT amounts per damage status for a disaster, versioned (see
+    api/payouts.py). The highest version is in force; older versions are
+    kept as history and never edited.
+    """
+    disaster = models.ForeignKey(DisasterEvent, on_delete=models.CASCADE, related_name='payout_rule_sets')
+    version = models.PositiveIntegerField(editable=False)
+    total_amount = models.PositiveIntegerField(
+        validators=[MaxValueValidator(10000)], help_text="ECT for TOTAL damage, in pesos")
+    partial_amount = models.PositiveIntegerField(
+        validators=[MaxValueValidator(10000)], help_text="ECT for PARTIAL damage, in pesos")
+    none_amount = models.PositiveIntegerField(
+        default=0, validators=[MaxValueValidator(10000)], help_text="ECT for NONE damage, in pesos")
+    notes = models.TextField(blank=True)
+    created_by = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['disaster', 'version']
+        ordering = ['disaster', '-version']
+
+    @property
+    def amounts(self):
+        return {
+            DamageAssessment.DamageStatus.TOTAL: self.total_amount,
+            DamageAssessment.DamageStatus.PARTIAL: self.partial_amount,
+            DamageAssessment.DamageStatus.NONE: self.none_amount,
+        }
+
+    def __str__(self):
+        return f"{self.disaster} v{self.version}: ₱{self.total_amount} / ₱{self.partial_amount} / ₱{self.none_amount}"
+
+
+class MapTombstone(models.Model):
+    """
+    Records deletions so the delta GeoJSON feed (?since=) can report them.
+    A household tombstone (disaster_id is NULL) removes the feature from every
+    map; an assessment tombstone means that household's feature changed on
+    one disaster's map (it falls back to NONE).
+    """
+    household_pk = models.BigIntegerField()
+    disaster_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+
+    def __str__(self):
+        scope = f"disaster {self.disaster_id}" if self.disaster_id else "all disasters"
+        return f"Household {self.household_pk} ({scope}) deleted at {self.deleted_at}"
+
+
+class EctPrediction(models.Model):
+    """
+    Stored ML prediction for one assessment. Reused until the assessment's
+    features (feature_hash) or the loaded model (model_version) change.
+    """
+    assessment = models.OneToOneField(DamageAssessment, on_delete=models.CASCADE, related_name='prediction')
+    feature_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    ect_amount = models.IntegerField()
+    probabilities = models.JSONField(default=dict, help_text="Class probabilities keyed by ECT amount")
+    predicted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Assessment {self.assessment_id}: ₱{self.ect_amount} (model {self.model_version})"
+
+
+class PredictionJob(models.Model):
+    """
+    Background ML prediction run for a disaster (see api/jobs.py). Progress
+    is tracked in processed/total; results are stored as PredictionResult rows.
+    A disaster has at most one PENDING or RUNNING job, and a RUNNING job whose
+    heartbeat stops is failed so a new one can start.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        COMPLETED = 'COMPLETED', 'Completed'
+        FAILED = 'FAILED', 'Failed'
+
+    disaster = models.ForeignKey(DisasterEvent, on_delete=models.CASCADE, related_name='prediction_jobs')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, db_index=True)
+    total = models.IntegerField(default=0, help_text="Assessments to predict")
+    processed = models.IntegerField(default=0, help_text="Assessments predicted so far")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['disaster'],
+                condition=models.Q(status__in=['PENDING', 'RUNNING']),
+                name='one_active_prediction_job',
+            ),
+        ]
+
+    @property
+    def percent_done(self):
+        if self.status == self.Status.COMPLETED:
+            return 100.0
+        if not self.total:
+            return 0.0
+        return round(100.0 * self.processed / self.total, 1)
+
+    @property
+    def rows_per_second(self):
+        """Throughput since the job started"""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"Prediction job {self.pk} for {self.disaster}: {self.status} ({self.processed}/{self.total})"
+
+
+class PredictionResult(models.Model):
+    """One household's row in a prediction job's results (same shape as /api/ml/predict/)"""
+    job = models.ForeignKey(PredictionJob, on_delete=models.CASCADE, related_name='results')
+    position = models.IntegerField()
+    data = models.JSONField()
+
+    class Meta:
+        ordering = ['position']
+        unique_together = ['job', 'position']
+
+    def __str__(self):
+        return f"Job {self.job_id} #{self.position}"
+
+
+class SmsMessage(models.Model):
+    """
+    Outbox entry: one SMS to a household about a disaster (see api/outbox.py).
+    idempotency_key is unique per (household, disaster), so queueing twice
+    never sends twice, and is passed to the gateway so it can drop resends.
+    FAILED messages ran out of attempts (the dead letters).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENDING = 'SENDING', 'Sending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+
+    household = models.ForeignKey(Household, on_delete=models.CASCADE, related_name='sms_messages')
+    disaster = models.ForeignKey(DisasterEvent, on_delete=models.CASCADE, related_name='sms_messages')
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    phone = models.CharField(max_length=20)
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0, help_text="Failed send attempts so far")
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, help_text="Worker batch that is sending it")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Workers claim due PENDING messages, oldest first
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['disaster', 'status']),
+        ]
+
+    @staticmethod
+    def key_for(household_id, disaster_id):
+        return f"sms:{disaster_id}:{household_id}"
+
+    def __str__(self):
+        return f"SMS to {self.phone} ({self.disaster_id}): {self.status}"
@@ -0,0 +1,374 @@
+"""
+SMS outbox.
+
+Generated SMS are stored as SmsMessage rows (PENDING) instead of only being
+returned by the API, and `python manage.py run_sms_workers` sends them:
+
+- enqueue_disaster() inserts one row per (household, disaster) for a
+  disaster's households with a contact number; the idempotency key makes
+  queueing again a no-op. The text is generated by the worker that first
+  claims the message, so the API request does no ML or template work,
+- workers claim due messages in batches (PENDING -> SENDING) with a
+  conditional UPDATE, so any number of workers can share the table on
+  SQLite; databases with SKIP LOCKED also lock the claimed rows,
+- a batch goes to the gateway (SMS_GATEWAY) in one call; failed messages
+  are retried with jittered exponential backoff and marked FAILED (dead
+  letters) after SMS_OUTBOX_MAX_ATTEMPTS attempts,
+- messages left SENDING by a crashed worker are released (as a failed
+  attempt) after SMS_OUTBOX_CLAIM_TIMEOUT seconds by the running workers.
+  The gateway gets the idempotency key, so a message sent just before the
+  crash can be dropped as a duplicate.
+"""
+import contextlib
+import itertools
+import json
+import logging
+import random
+import threading
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, DateTimeField, F, TextField, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .http_client import CircuitOpenError, PooledClient, UpstreamError
+from .models import DamageAssessment, SmsMessage
+from .prediction_store import prediction_results
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'SMS_OUTBOX_BATCH_SIZE', 200)
+MAX_ATTEMPTS = getattr(settings, 'SMS_OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BACKOFF = getattr(settings, 'SMS_OUTBOX_RETRY_BACKOFF', 30.0)
+RETRY_BACKOFF_MAX = getattr(settings, 'SMS_OUTBOX_RETRY_BACKOFF_MAX', 3600.0)
+CLAIM_TIMEOUT = getattr(settings, 'SMS_OUTBOX_CLAIM_TIMEOUT', 300.0)
+ENQUEUE_CHUNK_SIZE = 500
+
+
+class GatewayError(Exception):
+    """The whole batch could not be sent (every message is retried)"""
+
+
+class FileGateway:
+    """
+    Appends each message as a JSON line to a file; for development and
+    tests, or for another process to pick up.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, messages):
+        lines = ''.join(json.dumps(message) + '\n' for message in messages)
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            raise GatewayError(str(e)) from e
+        return {}
+
+
+class HttpGateway:
+    """
+    POSTs a batch as {"messages": [{"key", "phone", "text"}, ...]} to an SMS
+    provider. The answer may list rejected messages as {"failed": {key:
+    reason}}; the rest count as sent.
+    """
+
+    def __init__(self, url, api_key='', timeout=10.0):
+        self.url = url
+        self.api_key = api_key
+        self.client = PooledClient(pool_size=4, read_timeout=timeout, retries=1)
+
+    def send(self, messages):
+        try:
+            result = self.client.post_json(
+                self.url, {'messages': messages}, params={'key': self.api_key} if self.api_key else None,
+            )
+        except CircuitOpenError:
+            raise
+        except UpstreamError as e:
+            raise GatewayError(str(e)) from e
+        failed = result.get('failed') if isinstance(result, dict) else None
+        return failed or {}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The gateway configured by SMS_GATEWAY (a class path) and SMS_GATEWAY_OPTIONS"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            gateway_class = import_string(getattr(settings, 'SMS_GATEWAY', 'api.outbox.FileGateway'))
+            options = getattr(settings, 'SMS_GATEWAY_OPTIONS', None)
+            if options is None:
+                options = {'path': settings.BASE_DIR / 'sms_outbox.jsonl'}
+            _gateway = gateway_class(**options)
+        return _gateway
+
+
+def enqueue_disaster(disaster):
+    """
+    Queue an SMS for every household of a disaster that has a contact number
+    and no SMS queued yet. Rows are inserted without their text: the workers
+    generate it (ML prediction and templates) for each batch they claim, so
+    queueing a disaster stays a few queries.
+
+    Returns:
+        int: Messages queued (rows actually inserted)
+    """
+    recipients = (
+        DamageAssessment.objects.filter(disaster=disaster)
+        .exclude(household__contact_number__isnull=True).exclude(household__contact_number='')
+        .exclude(household__sms_messages__disaster=disaster)
+        .order_by('id')
+        .values_list('household_id', 'household__contact_number')
+    )
+    messages = (
+        SmsMessage(
+            household_id=household_id,
+            disaster=disaster,
+            idempotency_key=SmsMessage.key_for(household_id, disaster.pk),
+            phone=phone,
+        )
+        for household_id, phone in recipients.iterator(chunk_size=ENQUEUE_CHUNK_SIZE)
+    )
+    queued = 0
+    while chunk := list(itertools.islice(messages, ENQUEUE_CHUNK_SIZE)):
+        # Skip messages queued concurrently since the recipients were read,
+        # and count only the rows this call inserted
+        keys = [message.idempotency_key for message in chunk]
+        existing = set(SmsMessage.objects.filter(idempotency_key__in=keys).values_list('idempotency_key', flat=True))
+        chunk = [message for message in chunk if message.idempotency_key not in existing]
+        if chunk:
+            # Conflicts left are messages queued in between: keep the first one
+            SmsMessage.objects.bulk_create(chunk, ignore_conflicts=True)
+            queued += SmsMessage.objects.filter(idempotency_key__in=keys).count() - len(existing)
+    return queued
+
+
+def _generate_texts(batch, token):
+    """
+    Generate the text of claimed messages queued without one, from their
+    household's assessment; saved (while still claimed with ``token``) so
+    retries send the same SMS.
+
+    Returns:
+        dict: Errors by idempotency key for messages left without a text
+    """
+    pending = defaultdict(list)
+    for message in batch:
+        if not message.text:
+            pending[message.disaster_id].append(message)
+
+    errors = {}
+    generated = []
+    for disaster_id, messages in pending.items():
+        assessments = DamageAssessment.objects.filter(
+            disaster_id=disaster_id, household_id__in=[m.household_id for m in messages],
+        ).order_by('id')
+        try:
+            households = list(assessments.values_list('household_id', flat=True))
+            texts = {
+                household_id: result['sms']
+                for household_id, result in zip(households, prediction_results(assessments), strict=True)
+            }
+        except Exception as e:
+            logger.warning('SMS generation failed for %d messages: %s', len(messages), e)
+            texts = {}
+            error = f'{type(e).__name__}: {e}'
+        else:
+            error = 'No assessment to generate the SMS from'
+        for message in messages:
+            message.text = texts.get(message.household_id, '')
+            if message.text:
+                generated.append(message)
+            else:
+                errors[message.idempotency_key] = error
+    if generated:
+        SmsMessage.objects.filter(pk__in=[m.pk for m in generated], claim_token=token).update(text=Case(
+            *[When(pk=m.pk, then=Value(m.text)) for m in generated], output_field=TextField(),
+        ))
+    return errors
+
+
+def claim_batch(size=BATCH_SIZE):
+    """
+    Claim up to ``size`` due PENDING messages for sending.
+
+    The conditional UPDATE only takes rows that are still PENDING, so two
+    workers never claim the same message; on SQLite (no SELECT ... FOR
+    UPDATE) a worker may just get fewer rows than it selected.
+
+    Returns:
+        list: The claimed SmsMessage rows, oldest first
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    due = SmsMessage.objects.filter(
+        status=SmsMessage.Status.PENDING, next_attempt_at__lte=now,
+    ).order_by('next_attempt_at', 'id')
+
+    with transaction.atomic() if skip_locked else contextlib.nullcontext():
+        if skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:size])
+        if not ids:
+            return []
+        SmsMessage.objects.filter(pk__in=ids, status=SmsMessage.Status.PENDING).update(
+            status=SmsMessage.Status.SENDING, claim_token=token, claimed_at=now,
+        )
+    return list(SmsMessage.objects.filter(pk__in=ids, claim_token=token).order_by('next_attempt_at', 'id'))
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: jittered, doubling per failed attempt"""
+    return random.uniform(0.5, 1.0) * min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def _record_failures(messages, errors, token, now):
+    """
+    Schedule a retry for failed messages, or dead-letter them. Only the
+    messages still claimed with ``token`` are written: one released as a
+    stale claim and claimed again belongs to the other worker now.
+
+    Returns:
+        tuple: Messages (retried, dead-lettered)
+    """
+    last_error = Case(
+        *[When(pk=m.pk, then=Value(str(errors.get(m.idempotency_key, ''))[:1000])) for m in messages],
+        output_field=TextField(),
+    )
+    dead = [m for m in messages if m.attempts + 1 >= MAX_ATTEMPTS]
+    retry = [m for m in messages if m.attempts + 1 < MAX_ATTEMPTS]
+    failed = retried = 0
+    if dead:
+        failed = SmsMessage.objects.filter(pk__in=[m.pk for m in dead], claim_token=token).update(
+            status=SmsMessage.Status.FAILED, attempts=F('attempts') + 1, last_error=last_error, claim_token='',
+        )
+        for message in dead:
+            logger.warning('SMS %s dead-lettered after %d attempts: %s',
+                           message.idempotency_key, message.attempts + 1, errors.get(message.idempotency_key, ''))
+    if retry:
+        next_attempt_at = Case(
+            *[When(pk=m.pk, then=Value(now + timedelta(seconds=retry_delay(m.attempts + 1)))) for m in retry],
+            output_field=DateTimeField(),
+        )
+        retried = SmsMessage.objects.filter(pk__in=[m.pk for m in retry], claim_token=token).update(
+            status=SmsMessage.Status.PENDING, attempts=F('attempts') + 1, last_error=last_error, claim_token='',
+            next_attempt_at=next_attempt_at,
+        )
+    return retried, failed
+
+
+def dispatch_batch(gateway=None, size=BATCH_SIZE):
+    """
+    Claim one batch and send it through the gateway.
+
+    Every write that completes the batch is conditional on the batch's
+    claim token, so a worker whose claim was released as stale (and maybe
+    taken by another worker) while it was sending leaves the messages alone.
+
+    Returns:
+        dict: Messages 'sent', 'retried' and 'failed' (dead-lettered)
+    """
+    counts = {'sent': 0, 'retried': 0, 'failed': 0}
+    batch = claim_batch(size)
+    if not batch:
+        return counts
+    gateway = gateway or get_gateway()
+    token = batch[0].claim_token
+
+    errors = _generate_texts(batch, token)
+    payload = [
+        {'key': m.idempotency_key, 'phone': m.phone, 'text': m.text}
+        for m in batch if m.idempotency_key not in errors
+    ]
+    try:
+        if payload:
+            errors.update(gateway.send(payload))
+    except CircuitOpenError:
+        # The provider is known to be down: put the batch back without
+        # spending an attempt
+        held = {m['key'] for m in payload}
+        counts['retried'] = SmsMessage.objects.filter(
+            pk__in=[m.pk for m in batch if m.idempotency_key in held], claim_token=token,
+        ).update(
+            status=SmsMessage.Status.PENDING, claim_token='',
+            next_attempt_at=timezone.now() + timedelta(seconds=RETRY_BACKOFF),
+        )
+        batch = [m for m in batch if m.idempotency_key not in held]
+    except Exception as e:
+        logger.warning('SMS gateway failed for a batch of %d: %s', len(payload), e)
+        errors.update({m['key']: f'{type(e).__name__}: {e}' for m in payload})
+
+    now = timezone.now()
+    failed = [m for m in batch if m.idempotency_key in errors]
+    sent = [m.pk for m in batch if m.idempotency_key not in errors]
+    if sent:
+        counts['sent'] = SmsMessage.objects.filter(pk__in=sent, claim_token=token).update(
+            status=SmsMessage.Status.SENT, sent_at=now, claim_token='', last_error='',
+        )
+    if failed:
+        retried, counts['failed'] = _record_failures(failed, errors, token, now)
+        counts['retried'] += retried
+    return counts
+
+
+def release_stale_claims(timeout=CLAIM_TIMEOUT):
+    """
+    Put messages left SENDING longer than ``timeout`` seconds back to
+    PENDING. A release counts as an attempt, so a message whose batch keeps
+    stopping its worker is dead-lettered after MAX_ATTEMPTS like any other.
+
+    Returns:
+        int: Messages released (retried or dead-lettered)
+    """
+    now = timezone.now()
+    stale = SmsMessage.objects.filter(
+        status=SmsMessage.Status.SENDING, claimed_at__lt=now - timedelta(seconds=timeout),
+    )
+    error = 'Worker stopped while sending'
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS - 1).update(
+        status=SmsMessage.Status.FAILED, attempts=F('attempts') + 1, claim_token='', last_error=error,
+    )
+    if failed:
+        logger.warning('%d SMS dead-lettered after their worker stopped while sending them', failed)
+    return failed + stale.update(
+        status=SmsMessage.Status.PENDING, attempts=F('attempts') + 1, claim_token='', last_error=error,
+        next_attempt_at=now,
+    )
+
+
+def requeue_failed(disaster=None):
+    """Give dead-lettered messages a fresh set of attempts"""
+    failed = SmsMessage.objects.filter(status=SmsMessage.Status.FAILED)
+    if disaster is not None:
+        failed = failed.filter(disaster=disaster)
+    return failed.update(status=SmsMessage.Status.PENDING, attempts=0, next_attempt_at=timezone.now())
+
+
+def outbox_summary(disaster):
+    """Message counts by status for a disaster, and the latest dead letters"""
+    messages = SmsMessage.objects.filter(disaster=disaster)
+    counts = dict(messages.values_list('status').annotate(count=Count('id')).order_by())
+    return {
+        'disaster_id': disaster.pk,
+        'counts': {status: counts.get(status, 0) for status in SmsMessage.Status.values},
+        'dead_letters': list(
+            messages.filter(status=SmsMessage.Status.FAILED).order_by('-id').values(
+                'idempotency_key', 'phone', 'attempts', 'last_error',
+                household_code=F('household__household_id'),
+            )[:20]
+        ),
+    }
@@ -0,0 +1,223 @@
+"""
+Typed columnar export of assessments and their stored predictions, as
+Parquet or Arrow IPC (Feather v2) files for analysts.
+
+Unlike the CSV export (api/export.py) the file carries dtypes: barangay,
+damage status, disaster and model version are dictionary columns (pandas
+categoricals), amounts are integers, coordinates and features floats and
+assessed_at a UTC timestamp. Predictions are the ones stored by
+api/prediction_store.py; rows never predicted are null.
+
+Rows are read with ``.iterator(chunk_size=...)`` and written one record
+batch per chunk (a Parquet row group, or an IPC record batch) into a sink
+that is drained after every batch, so memory stays bounded and the response
+streams. The dictionaries are read up front (one small query each for the
+barangays and model versions) and shared by every batch. A value written
+while the export streams is appended to its dictionary (a dictionary delta
+in Feather), so earlier codes stay valid and no value turns into a null; a
+damage status outside the model's choices raises ValueError.
+Readers can load only the columns they need, e.g.
+``pd.read_parquet(path, columns=['barangay', 'ect_amount'])``.
+
+pyarrow is imported lazily, like the ML stack.
+"""
+from django.db.models import F, FloatField, IntegerField
+from django.db.models.functions import Cast
+
+from .models import DamageAssessment, DisasterEvent, Household
+
+
+# Rows per record batch / Parquet row group
+BATCH_SIZE = 20000
+
+FORMATS = {
+    # ?output=: (content type, file extension)
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'feather': ('application/vnd.apache.arrow.file', 'feather'),
+}
+
+STATUSES = [choice for choice, _ in DamageAssessment.DamageStatus.choices]
+
+COLUMNS = {
+    'disaster_id': F('disaster_id'),
+    'household_id': F('household__household_id'),
+    'name': F('household__name'),
+    'address': F('household__address'),
+    'barangay': F('household__barangay'),
+    'latitude': Cast('household__latitude', FloatField()),
+    'longitude': Cast('household__longitude', FloatField()),
+    'damage_status': F('damage_status'),
+    'ect_amount': Cast('recommended_ect_amount', IntegerField()),
+    'flood_depth': F('household__flood_depth'),
+    'house_height': F('household__house_height'),
+    'house_width': F('household__house_width'),
+    'is_4ps': F('household__is_4ps'),
+    'assessed_at': F('assessed_at'),
+    'predicted_ect_amount': F('prediction__ect_amount'),
+    'prediction_probabilities': F('prediction__probabilities'),
+    'model_version': F('prediction__model_version'),
+}
+
+
+def schema():
+    import pyarrow as pa
+
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('disaster_id', pa.int64()),
+        ('disaster', category),
+        ('household_id', pa.string()),
+        ('name', pa.string()),
+        ('address', pa.string()),
+        ('barangay', category),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('damage_status', category),
+        ('ect_amount', pa.int32()),
+        ('flood_depth', pa.float64()),
+        ('house_height', pa.float64()),
+        ('house_width', pa.float64()),
+        ('is_4ps', pa.bool_()),
+        ('assessed_at', pa.timestamp('us', tz='UTC')),
+        ('predicted_ect_amount', pa.int32()),
+        ('prediction_confidence', pa.float64()),
+        ('model_version', category),
+    ])
+
+
+def export_rows(disaster_ids):
+    """The disasters' assessments as tuples of COLUMNS, disaster by disaster"""
+    return DamageAssessment.objects.filter(disaster_id__in=disaster_ids).values_list(
+        *COLUMNS.values(),
+    ).order_by('disaster_id', 'pk')
+
+
+class _Sink:
+    """Write-only file object whose written bytes are taken after each batch"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class _Dictionary:
+    """
+    A dictionary column: values -> int32 codes (None stays null). Unseen
+    values are appended with new codes, or raise ValueError when the
+    dictionary is ``fixed``.
+    """
+
+    def __init__(self, values, fixed=False):
+        import pyarrow as pa
+
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        self.fixed = fixed
+        self.dictionary = pa.array(self.values, pa.string())
+
+    def array(self, column):
+        import pyarrow as pa
+
+        codes = self.codes
+        unseen = {value for value in column if value is not None and value not in codes}
+        if unseen:
+            if self.fixed:
+                raise ValueError(f'Values outside the dictionary: {sorted(unseen)}')
+            for value in sorted(unseen):
+                codes[value] = len(self.values)
+                self.values.append(value)
+            self.dictionary = pa.array(self.values, pa.string())
+        indices = pa.array([codes.get(value) for value in column], pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, self.dictionary)
+
+
+def _confidence(probabilities):
+    return max(probabilities.values()) if probabilities else None
+
+
+def stream_export(disaster_ids, file_format='parquet', batch_size=BATCH_SIZE):
+    """
+    Yield a Parquet or Feather file of the disasters' assessments, one
+    record batch of ``batch_size`` rows at a time.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    target = schema()
+    disasters = dict(DisasterEvent.objects.filter(pk__in=disaster_ids).values_list('pk', 'name'))
+    disaster_names = _Dictionary(sorted(set(disasters.values())))
+    barangays = _Dictionary(Household.objects.filter(
+        assessments__disaster_id__in=disaster_ids,
+    ).values_list('barangay', flat=True).distinct().order_by('barangay'))
+    statuses = _Dictionary(STATUSES, fixed=True)
+    model_versions = _Dictionary(DamageAssessment.objects.filter(
+        disaster_id__in=disaster_ids, prediction__isnull=False,
+    ).values_list('prediction__model_version', flat=True).distinct().order_by('prediction__model_version'))
+
+    def record_batch(rows):
+        (disaster_id, household_id, name, address, barangay, latitude, longitude, damage_status, ect_amount,
+         flood_depth, house_height, house_width, is_4ps, assessed_at, predicted, probabilities,
+         model_version) = zip(*rows)
+        return pa.record_batch([
+            pa.array(disaster_id, pa.int64()),
+            disaster_names.array([disasters[pk] for pk in disaster_id]),
+            pa.array(household_id, pa.string()),
+            pa.array(name, pa.string()),
+            pa.array(address, pa.string()),
+            barangays.array(barangay),
+            pa.array(latitude, pa.float64()),
+            pa.array(longitude, pa.float64()),
+            statuses.array(damage_status),
+            pa.array(ect_amount, pa.int32()),
+            pa.array(flood_depth, pa.float64()),
+            pa.array(house_height, pa.float64()),
+            pa.array(house_width, pa.float64()),
+            pa.array(is_4ps, pa.bool_()),
+            pa.array(assessed_at, pa.timestamp('us', tz='UTC')),
+            pa.array(predicted, pa.int32()),
+            pa.array([_confidence(p) for p in probabilities], pa.float64()),
+            model_versions.array(model_version),
+        ], schema=target)
+
+    sink = _Sink()
+    if file_format == 'feather':
+        writer = pa.ipc.new_file(
+            sink, target, options=pa.ipc.IpcWriteOptions(compression='zstd', emit_dictionary_deltas=True),
+        )
+    else:
+        writer = pq.ParquetWriter(sink, target, compression='zstd')
+
+    rows = []
+    for row in export_rows(disaster_ids).iterator(chunk_size=batch_size):
+        rows.append(row)
+        if len(rows) == batch_size:
+            writer.write_batch(record_batch(rows))
+            rows = []
+            yield sink.take()
+    if rows:
+        writer.write_batch(record_batch(rows))
+    writer.close()
+    yield sink.take()
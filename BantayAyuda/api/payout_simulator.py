@@ -0,0 +1,160 @@
+"""
+Payout what-if simulator.
+
+Budget officers ask "what if PARTIAL were 7,000 and 4Ps got +2,000?". A
+scenario is a payout rule set:
+
+    {"name": "Partial 7k", "amounts": {"TOTAL": 10000, "PARTIAL": 7000, "NONE": 0}, "bonus_4ps": 2000}
+
+Statuses left out of "amounts" keep the disaster's current payout rule
+(api/payouts.py), and the 4Ps bonus is added to 4Ps households that get a
+payout at all.
+
+A payout only depends on barangay, status and 4Ps, and the budget rollup
+(api/rollup.py) already counts a disaster's households per barangay x
+status (with the 4Ps among them), so the simulator reads those few rows
+instead of the assessments. Every scenario's per-barangay budget is then one
+matrix product of the counts with the scenarios' amount table: the cost
+grows with barangays x scenarios, not households x scenarios.
+
+Amounts are capped at the same MAX_PAYOUT as rule sets, so a scenario can
+always be adopted as one.
+"""
+from django.db.models import Sum
+
+from .models import BudgetRollup
+from .payouts import DEFAULT_PAYOUTS, MAX_PAYOUT, STATUSES
+
+
+MAX_SCENARIOS = 1000
+
+
+class ScenarioError(ValueError):
+    """A scenario is malformed (reported to the client as a 400)"""
+
+
+def _amount(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+        raise ScenarioError(f'{what} must be a whole number of pesos')
+    if not 0 <= value <= MAX_PAYOUT:
+        raise ScenarioError(f'{what} must be between 0 and {MAX_PAYOUT}')
+    return int(value)
+
+
+def parse_scenarios(scenarios, defaults=DEFAULT_PAYOUTS):
+    """
+    Validate scenarios from a request body. Statuses a scenario leaves out
+    get their amount from ``defaults``.
+
+    Returns:
+        list: dicts with 'name', 'amounts' (every status) and 'bonus_4ps'
+
+    Raises:
+        ScenarioError: with a message naming the offending scenario
+    """
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ScenarioError('scenarios must be a non-empty list')
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ScenarioError(f'At most {MAX_SCENARIOS} scenarios per request')
+
+    parsed = []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ScenarioError(f'Scenario {i + 1} must be an object')
+        name = str(scenario.get('name') or f'Scenario {i + 1}')
+        amounts = scenario.get('amounts') or {}
+        if not isinstance(amounts, dict):
+            raise ScenarioError(f'{name}: amounts must be an object')
+        unknown = set(amounts) - set(STATUSES)
+        if unknown:
+            raise ScenarioError(f'{name}: unknown damage status {sorted(unknown)[0]!r}')
+        parsed.append({
+            'name': name,
+            'amounts': {
+                status: _amount(amounts.get(status, defaults[status]), f'{name}: {status} amount')
+                for status in STATUSES
+            },
+            'bonus_4ps': _amount(scenario.get('bonus_4ps', 0), f'{name}: bonus_4ps'),
+        })
+    return parsed
+
+
+class PayoutSimulator:
+    """
+    A disaster's household counts as NumPy arrays, ready to price scenarios.
+
+    Attributes:
+        barangays: barangay names (index = barangay code)
+        counts: int array [barangay, status, is_4ps] of households
+        baseline: current per-barangay budget (stored amounts)
+    """
+
+    def __init__(self, disaster_id):
+        import numpy as np
+
+        # One row per (barangay, status), summed over the rollup's amounts
+        rows = list(
+            BudgetRollup.objects.filter(disaster_id=disaster_id, count__gt=0)
+            .values_list('barangay', 'damage_status')
+            .annotate(count=Sum('count'), count_4ps=Sum('count_4ps'), total=Sum('amount_total'))
+            .order_by('barangay')
+        )
+        self.barangays = sorted({barangay for barangay, *_ in rows})
+        barangay_index = {name: i for i, name in enumerate(self.barangays)}
+        status_index = {status: i for i, status in enumerate(STATUSES)}
+
+        self.counts = np.zeros((len(self.barangays), len(STATUSES), 2), dtype=np.int64)
+        self.baseline = np.zeros(len(self.barangays), dtype=np.int64)
+        for barangay, status, count, count_4ps, total in rows:
+            b = barangay_index[barangay]
+            self.counts[b, status_index[status]] = (count - count_4ps, count_4ps)
+            self.baseline[b] += int(total)
+        self.households = int(self.counts.sum())
+
+    def evaluate(self, scenarios):
+        """
+        Price many parsed scenarios at once (see parse_scenarios).
+
+        Returns:
+            list: per scenario, its name, total_budget, households_paid,
+                  average_per_household, change from the current budget and
+                  by_barangay {name: {'count': paid, 'budget': pesos}}
+        """
+        import numpy as np
+
+        amounts = np.array([[s['amounts'][status] for status in STATUSES] for s in scenarios], dtype=np.int64)
+        bonus = np.array([s['bonus_4ps'] for s in scenarios], dtype=np.int64)
+        paid = amounts > 0
+        # [scenario, status, is_4ps]: payout of one household
+        payout = np.stack([amounts, amounts + bonus[:, None] * paid], axis=2)
+
+        budget = np.einsum('bkf,skf->sb', self.counts, payout)  # [scenario, barangay]
+        paid_count = np.einsum('bk,sk->sb', self.counts.sum(axis=2), paid.astype(np.int64))
+        totals = budget.sum(axis=1)
+        baseline_total = int(self.baseline.sum())
+
+        results = []
+        for i, scenario in enumerate(scenarios):
+            total = int(totals[i])
+            results.append({
+                'name': scenario['name'],
+                'amounts': scenario['amounts'],
+                'bonus_4ps': scenario['bonus_4ps'],
+                'total_budget': total,
+                'households_paid': int(paid_count[i].sum()),
+                'average_per_household': round(total / self.households, 2) if self.households else 0,
+                'change_from_current': total - baseline_total,
+                'by_barangay': {
+                    name: {'count': int(paid_count[i, b]), 'budget': int(budget[i, b])}
+                    for b, name in enumerate(self.barangays)
+                },
+            })
+        return results
+
+    def current(self):
+        """The stored budget, in the same shape as a scenario result's totals"""
+        total = int(self.baseline.sum())
+        return {
+            'total_budget': total,
+            'by_barangay': {name: int(self.baseline[b]) for b, name in enumerate(self.barangays)},
+        }
@@ -0,0 +1,178 @@
+"""
+Payout rules.
+
+The ECT amount per damage status is data: each disaster has versioned
+PayoutRuleSet rows and the highest version is in force (DEFAULT_PAYOUTS, the
+original PDF amounts, while it has none).
+
+- DamageAssessment.save prices one row with payout_for(). Inside
+  cached_payouts() (every request, through payout_cache_middleware, and
+  bulk paths such as seed_data) each disaster's rule set is read once;
+  saving a rule set drops it from the memo,
+- recompute() re-prices a whole disaster with a single UPDATE whose new
+  amount is a CASE over damage_status, touching only rows whose amount
+  changes. Like any QuerySet.update it skips save() and the signals, so it
+  re-keys the disaster's budget rollup itself (rollup.reprice) and
+  invalidates its cached clusters and responses on commit,
+- create_rule_set() stores the next version and recomputes.
+"""
+import contextlib
+import contextvars
+import operator
+from decimal import Decimal
+from functools import reduce
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, Max, Q, Value, When
+from django.utils import timezone
+
+from .clusters import build_clusters, cached_disaster_ids
+from .models import DamageAssessment, PayoutRuleSet
+from .response_cache import bump_disaster_version
+from . import rollup
+
+
+DEFAULT_PAYOUTS = {'TOTAL': 10000, 'PARTIAL': 5000, 'NONE': 0}
+STATUSES = list(DEFAULT_PAYOUTS)
+MAX_PAYOUT = 10000  # recommended_ect_amount's validator
+
+
+class PayoutRuleError(ValueError):
+    """Invalid rule set amounts (reported to the client as a 400)"""
+
+
+def current_rule_set(disaster_id):
+    """The rule set in force for a disaster, or None for the defaults"""
+    return PayoutRuleSet.objects.filter(disaster_id=disaster_id).order_by('-version').first()
+
+
+# {disaster id: payouts} read in the current cached_payouts() scope, or None
+_payouts_memo = contextvars.ContextVar('payouts_memo', default=None)
+
+
+@contextlib.contextmanager
+def cached_payouts():
+    """
+    Read each disaster's payouts once within the block (a request, a bulk
+    import) instead of once per DamageAssessment.save. Usable as a decorator.
+    """
+    token = _payouts_memo.set({})
+    try:
+        yield
+    finally:
+        _payouts_memo.reset(token)
+
+
+def payout_cache_middleware(get_response):
+    """Scope the payouts memo to each request"""
+    def middleware(request):
+        with cached_payouts():
+            return get_response(request)
+    return middleware
+
+
+def forget_payouts(disaster_id):
+    """Drop a disaster's memoized payouts (its rule sets changed)"""
+    memo = _payouts_memo.get()
+    if memo is not None:
+        memo.pop(int(disaster_id), None)
+
+
+def current_payouts(disaster_id):
+    """{damage status: pesos} in force for a disaster"""
+    memo = _payouts_memo.get()
+    if memo is not None and int(disaster_id) in memo:
+        return dict(memo[int(disaster_id)])
+    rule_set = current_rule_set(disaster_id)
+    payouts = dict(rule_set.amounts) if rule_set else dict(DEFAULT_PAYOUTS)
+    if memo is not None:
+        memo[int(disaster_id)] = payouts
+    return dict(payouts)
+
+
+def payout_for(disaster_id, damage_status):
+    """The ECT amount of one assessment"""
+    return current_payouts(disaster_id).get(damage_status, 0)
+
+
+def parse_amounts(amounts):
+    """
+    Validate {damage status: pesos} from a request body; every status is
+    required.
+
+    Raises:
+        PayoutRuleError
+    """
+    if not isinstance(amounts, dict):
+        raise PayoutRuleError('amounts must be an object')
+    unknown = set(amounts) - set(STATUSES)
+    if unknown:
+        raise PayoutRuleError(f'Unknown damage status {sorted(unknown)[0]!r}')
+    parsed = {}
+    for status in STATUSES:
+        value = amounts.get(status)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+            raise PayoutRuleError(f'{status} amount must be a whole number of pesos')
+        if not 0 <= value <= MAX_PAYOUT:
+            raise PayoutRuleError(f'{status} amount must be between 0 and {MAX_PAYOUT}')
+        parsed[status] = int(value)
+    return parsed
+
+
+def amount_case(amounts):
+    """SQL expression: the amount for each row's damage_status"""
+    return Case(
+        *[When(damage_status=status, then=Value(Decimal(amount))) for status, amount in amounts.items()],
+        default=Value(Decimal(0)),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def recompute(disaster_id):
+    """
+    Re-price a disaster's assessments with its current rule set.
+
+    Returns:
+        int: assessments whose amount changed
+    """
+    amounts = current_payouts(disaster_id)
+    stale = reduce(operator.or_, [
+        Q(damage_status=status) & ~Q(recommended_ect_amount=amount) for status, amount in amounts.items()
+    ]) | ~Q(damage_status__in=list(amounts))
+    with transaction.atomic():
+        changed = DamageAssessment.objects.filter(stale, disaster_id=disaster_id).update(
+            recommended_ect_amount=amount_case(amounts),
+            # The delta map feed picks up changes by updated_at
+            updated_at=timezone.now(),
+        )
+        if changed:
+            rollup.reprice(disaster_id, amounts)
+
+    def invalidate():
+        if cached_disaster_ids([disaster_id]):
+            build_clusters(disaster_id)
+        bump_disaster_version(disaster_id)
+
+    if changed:
+        transaction.on_commit(invalidate)
+    return changed
+
+
+def create_rule_set(rule_set):
+    """
+    Save an unsaved PayoutRuleSet as its disaster's next version and apply it.
+
+    Returns:
+        int: assessments whose amount changed
+    """
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                latest = PayoutRuleSet.objects.filter(disaster_id=rule_set.disaster_id).aggregate(Max('version'))
+                rule_set.version = (latest['version__max'] or 0) + 1
+                rule_set.save()
+                return recompute(rule_set.disaster_id)
+        except IntegrityError:
+            # Another version was saved concurrently
+            rule_set.pk = None
+    raise IntegrityError(f'Could not store a new payout rule set for disaster {rule_set.disaster_id}')
@@ -0,0 +1,20 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .columnar import MEDIA_TYPE
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Binary columnar map payload (see api/columnar.py).
+    Selected with ?format=columnar or Accept: application/vnd.bantayayuda.columnar
+    """
+    media_type = MEDIA_TYPE
+    format = 'columnar'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray)):
+            return data
+        # Error payloads ({'error': ...}) are still sent as JSON
+        return JSONRenderer().render(data, renderer_context=renderer_context)
@@ -0,0 +1,139 @@
+"""
+Versioned response cache for disaster-scoped endpoints.
+
+Every disaster has a version counter, and households share one global
+counter (a household shows up in every disaster's data). Writes bump the
+counters through model signals (see api/signals.py), so cached responses are
+never invalidated explicitly: a bump simply changes the cache key, and the
+old entries age out through the cache backend's eviction (TIMEOUT /
+MAX_ENTRIES in settings.CACHES).
+
+The key also includes the active ML model version (api/model_registry.py),
+so promoting a model invalidates cached predictions.
+
+The same key doubles as the response ETag, so clients that send a matching
+If-None-Match get a 304 without touching the database.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .model_registry import registry
+
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+HOUSEHOLDS_VERSION_KEY = 'version:households'
+
+
+def _disaster_version_key(disaster_id):
+    return f'version:disaster:{disaster_id}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed with the clock rather than 1, so a counter lost to eviction
+        # can never come back to a value that old responses were cached under
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_disaster_version(disaster_id):
+    """Invalidate every cached response for one disaster"""
+    _bump_version(_disaster_version_key(disaster_id))
+
+
+def bump_households_version():
+    """Invalidate cached responses for all disasters (household data changed)"""
+    _bump_version(HOUSEHOLDS_VERSION_KEY)
+
+
+def response_etag(request, disaster_id):
+    """ETag for a request at the current data version"""
+    version = (
+        _get_version(_disaster_version_key(disaster_id)),
+        _get_version(HOUSEHOLDS_VERSION_KEY),
+    )
+    key = '|'.join([
+        request.path,
+        '&'.join(f'{k}={v}' for k, v in sorted(request.GET.items())),
+        request.META.get('HTTP_ACCEPT', ''),
+        f'{version[0]}.{version[1]}',
+        registry.active_version() or '',
+    ])
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def cache_disaster_response(view):
+    """
+    Cache a disaster-scoped view per disaster version and answer
+    If-None-Match with 304.
+
+    Wrap views from the outside (above @api_view), or wrap a ViewSet action
+    directly: the DRF Response an action returns is finalized (renderer
+    chosen) and rendered here, before the view would do it. Only successful,
+    non-streaming responses are stored; streaming responses still get an
+    ETag.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[-1]  # (request,) for function views, (self, request) for actions
+        disaster_id = request.GET.get('disaster_id')
+        if not disaster_id or request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+
+        etag = response_etag(request, disaster_id)
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        cached = cache.get(f'response:{etag}')
+        if cached is not None:
+            content, content_type, headers = cached
+            response = HttpResponse(content, content_type=content_type)
+            for header, value in headers.items():
+                response[header] = value
+            response['ETag'] = etag
+            return response
+
+        response = view(*args, **kwargs)
+        if response.status_code != 200:
+            return response
+
+        response['ETag'] = etag
+        if not response.streaming:
+            if hasattr(response, 'render') and not response.is_rendered:
+                if getattr(response, 'accepted_renderer', None) is None:
+                    if len(args) < 2:
+                        return response  # Not a ViewSet action; can't finalize it here
+                    # An action's Response is finalized by the view only after
+                    # the action returns; the second finalize is then a no-op
+                    response = args[0].finalize_response(request, response)
+                response.render()
+            headers = {
+                header: response[header]
+                for header in ('Content-Disposition', 'X-Model-Version')
+                if response.has_header(header)
+            }
+            cache.set(
+                f'response:{etag}',
+                (response.content, response['Content-Type'], headers),
+                RESPONSE_CACHE_TIMEOUT,
+            )
+        return response
+
+    return wrapper
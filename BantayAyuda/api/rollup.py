@@ -0,0 +1,166 @@
+"""
+Budget rollup.
+
+BudgetRollup holds the budget summary pre-aggregated per disaster x
+barangay x damage status x ECT amount. Signal handlers (api/signals.py)
+apply each write as a delta: an assessment's entry moves from the bucket it
+was counted in to its new one, and a household whose barangay or 4Ps flag
+changes moves all of its assessments. Saves are atomic and deletes run in
+the collector's transaction, so the rollup commits or rolls back with the
+row.
+
+Bulk writes (bulk_create, QuerySet.update) bypass signals: call rebuild()
+afterwards, or run `python manage.py budget_rollup --rebuild`. A payout
+recompute (api/payouts.py) only changes amounts, so it uses reprice(). Without
+--rebuild the command verifies the rollup against the assessments.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import BudgetRollup, DamageAssessment, Household
+
+
+# An assessment's entry: (disaster_id, barangay, damage_status, ect_amount, is_4ps)
+ENTRY_FIELDS = ('disaster_id', 'household__barangay', 'damage_status', 'recommended_ect_amount', 'household__is_4ps')
+CENTS = Decimal('0.01')
+
+
+def _amount(value):
+    return Decimal(value).quantize(CENTS)
+
+
+def stored_entry(assessment_id):
+    """The entry an assessment is counted under now (None if it isn't saved)"""
+    entry = DamageAssessment.objects.filter(pk=assessment_id).values_list(*ENTRY_FIELDS).first()
+    return entry and (*entry[:3], _amount(entry[3]), entry[4])
+
+
+def household_entry(household_id):
+    """A household's stored (barangay, is_4ps)"""
+    return Household.objects.filter(pk=household_id).values_list('barangay', 'is_4ps').first()
+
+
+def _add(entry, sign):
+    disaster_id, barangay, damage_status, ect_amount, is_4ps = entry
+    key = {'disaster_id': disaster_id, 'barangay': barangay, 'damage_status': damage_status, 'ect_amount': ect_amount}
+    changes = {
+        'count': F('count') + sign,
+        'count_4ps': F('count_4ps') + (sign if is_4ps else 0),
+        'amount_total': F('amount_total') + sign * ect_amount,
+    }
+    # A missing bucket on removal means the disaster itself is being deleted
+    if BudgetRollup.objects.filter(**key).update(**changes) or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            BudgetRollup.objects.create(**key, count=1, count_4ps=int(is_4ps), amount_total=ect_amount)
+    except IntegrityError:
+        # Created concurrently
+        BudgetRollup.objects.filter(**key).update(**changes)
+
+
+def move(old, new):
+    """Move one assessment from entry ``old`` to ``new`` (either may be None)"""
+    if old == new:
+        return
+    if old is not None:
+        _add(old, -1)
+    if new is not None:
+        _add(new, 1)
+
+
+def move_household(household_id, old, new):
+    """
+    A household's (barangay, is_4ps) changed from ``old`` to ``new``: move
+    each of its assessments.
+    """
+    if old is None or new is None or old == new:
+        return
+    for disaster_id, damage_status, amount in DamageAssessment.objects.filter(
+        household_id=household_id,
+    ).values_list('disaster_id', 'damage_status', 'recommended_ect_amount'):
+        move((disaster_id, old[0], damage_status, _amount(amount), old[1]),
+             (disaster_id, new[0], damage_status, _amount(amount), new[1]))
+
+
+def computed(disaster_ids=None):
+    """The rollup rows aggregated from the assessments (GROUP BY)"""
+    assessments = DamageAssessment.objects.all()
+    if disaster_ids is not None:
+        assessments = assessments.filter(disaster_id__in=disaster_ids)
+    return (
+        assessments.values('disaster_id', 'damage_status', barangay=F('household__barangay'),
+                           ect_amount=F('recommended_ect_amount'))
+        .annotate(
+            count=Count('id'),
+            count_4ps=Count('id', filter=Q(household__is_4ps=True)),
+            amount_total=Sum('recommended_ect_amount'),
+        )
+        .order_by()
+    )
+
+
+def _keyed(rows):
+    return {
+        (row['disaster_id'], row['barangay'], row['damage_status'], _amount(row['ect_amount'])):
+            (row['count'], row['count_4ps'], _amount(row['amount_total']))
+        for row in rows if row['count']
+    }
+
+
+def rebuild(disaster_ids=None):
+    """Recompute the rollup (for all disasters, or the given ones). Returns the row count."""
+    with transaction.atomic():
+        rows = list(computed(disaster_ids))
+        stale = BudgetRollup.objects.all()
+        if disaster_ids is not None:
+            stale = stale.filter(disaster_id__in=disaster_ids)
+        stale.delete()
+        BudgetRollup.objects.bulk_create([BudgetRollup(**row) for row in rows], batch_size=1000)
+    return len(rows)
+
+
+def reprice(disaster_id, amounts):
+    """
+    After every assessment of a disaster was set to ``amounts[damage_status]``
+    (payouts.recompute): re-key its rollup rows to the new amounts. Reads the
+    disaster's few rollup rows instead of its assessments.
+    """
+    merged = {}
+    with transaction.atomic():
+        rows = BudgetRollup.objects.filter(disaster_id=disaster_id, count__gt=0)
+        for row in rows:
+            ect_amount = _amount(amounts.get(row.damage_status, 0))
+            counts = merged.setdefault((row.barangay, row.damage_status, ect_amount), [0, 0])
+            counts[0] += row.count
+            counts[1] += row.count_4ps
+        BudgetRollup.objects.filter(disaster_id=disaster_id).delete()
+        BudgetRollup.objects.bulk_create([
+            BudgetRollup(disaster_id=disaster_id, barangay=barangay, damage_status=damage_status,
+                         ect_amount=ect_amount, count=count, count_4ps=count_4ps, amount_total=count * ect_amount)
+            for (barangay, damage_status, ect_amount), (count, count_4ps) in merged.items()
+        ])
+
+
+def verify(disaster_ids=None):
+    """
+    Compare the rollup with the assessments.
+
+    Returns:
+        list: (disaster_id, barangay, damage_status, ect_amount, expected,
+              stored) for every bucket that differs, where expected and
+              stored are (count, count_4ps, amount_total) or None
+    """
+    stored = BudgetRollup.objects.all()
+    if disaster_ids is not None:
+        stored = stored.filter(disaster_id__in=disaster_ids)
+    expected = _keyed(computed(disaster_ids))
+    actual = _keyed(stored.values('disaster_id', 'barangay', 'damage_status', 'ect_amount',
+                                  'count', 'count_4ps', 'amount_total'))
+    return [
+        (*key, expected.get(key), actual.get(key))
+        for key in sorted(expected.keys() | actual.keys(), key=str)
+        if expected.get(key) != actual.get(key)
+    ]
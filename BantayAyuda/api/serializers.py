@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Household, DisasterEvent, DamageAssessment
+from .models import Household, DisasterEvent, DamageAssessment, PredictionJob, PayoutRuleSet
 
 
 class HouseholdSerializer(serializers.ModelSerializer):
@@ -24,3 +24,25 @@ class DamageAssessmentSerializer(serializers.ModelSerializer):
         model = DamageAssessment
         fields = '__all__'
 
+
+class PredictionJobSerializer(serializers.ModelSerializer):
+    disaster_name = serializers.CharField(source='disaster.name', read_only=True)
+    percent_done = serializers.FloatField(read_only=True)
+    rows_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = PredictionJob
+        fields = [
+            'id', 'disaster', 'disaster_name', 'status', 'total', 'processed',
+            'percent_done', 'rows_per_second', 'error',
+            'created_at', 'started_at', 'finished_at',
+        ]
+
+
+class PayoutRuleSetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PayoutRuleSet
+        fields = [
+            'id', 'disaster', 'version', 'total_amount', 'partial_amount', 'none_amount',
+            'notes', 'created_by', 'created_at',
+        ]
@@ -0,0 +1,114 @@
+"""
+Model signal handlers keeping derived data (map clusters, cached responses,
+delta-feed tombstones, the budget rollup) in sync with writes.
+
+Cache work is deferred with transaction.on_commit so rolled-back writes never
+leak into caches, and cascading deletes are seen in their final state.
+Tombstones and rollup deltas are rows, so they are written inside the
+writing transaction.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .clusters import cached_disaster_ids, refresh_cells
+from .geojson import TOMBSTONE_RETENTION
+from .models import DamageAssessment, DisasterEvent, Household, MapTombstone, PayoutRuleSet
+from .payouts import forget_payouts
+from .response_cache import bump_disaster_version, bump_households_version
+from . import rollup
+
+
+@receiver(post_save, sender=DamageAssessment)
+@receiver(post_delete, sender=DamageAssessment)
+def assessment_changed(sender, instance, **kwargs):
+    """Re-aggregate the cluster cell of the assessed household"""
+    disaster_id = instance.disaster_id
+    household_id = instance.household_id
+
+    def refresh():
+        if not cached_disaster_ids([disaster_id]):
+            return
+        # If the household itself was deleted, household_changed handles its cell
+        geohash = Household.objects.filter(pk=household_id).values_list('geohash', flat=True).first()
+        refresh_cells(disaster_id, [geohash])
+
+    transaction.on_commit(refresh)
+    transaction.on_commit(lambda: bump_disaster_version(disaster_id))
+
+
+@receiver(post_save, sender=Household)
+@receiver(post_delete, sender=Household)
+def household_changed(sender, instance, **kwargs):
+    """A household shows up on every disaster's map, so refresh its cells in all of them"""
+    geohashes = [instance.geohash, getattr(instance, '_previous_geohash', None)]
+
+    def refresh():
+        for disaster_id in cached_disaster_ids():
+            refresh_cells(disaster_id, geohashes)
+
+    transaction.on_commit(refresh)
+    transaction.on_commit(bump_households_version)
+
+
+@receiver(post_save, sender=DisasterEvent)
+@receiver(post_delete, sender=DisasterEvent)
+def disaster_changed(sender, instance, **kwargs):
+    """Disaster names appear in summaries and export filenames"""
+    disaster_id = instance.pk
+    transaction.on_commit(lambda: bump_disaster_version(disaster_id))
+
+
+@receiver(post_save, sender=PayoutRuleSet)
+@receiver(post_delete, sender=PayoutRuleSet)
+def rule_set_changed(sender, instance, **kwargs):
+    """Assessments saved from now on are priced with the new rule set"""
+    forget_payouts(instance.disaster_id)
+
+
+@receiver(post_delete, sender=DamageAssessment)
+def assessment_deleted(sender, instance, **kwargs):
+    """The household's feature on this disaster's map falls back to NONE"""
+    MapTombstone.objects.create(household_pk=instance.household_id, disaster_id=instance.disaster_id)
+
+
+@receiver(post_delete, sender=Household)
+def household_deleted(sender, instance, **kwargs):
+    """The feature disappears from every map; also prune expired tombstones"""
+    MapTombstone.objects.create(household_pk=instance.pk)
+    MapTombstone.objects.filter(deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
+
+
+@receiver(pre_save, sender=DamageAssessment)
+@receiver(pre_delete, sender=DamageAssessment)
+def assessment_rollup_before(sender, instance, raw=False, **kwargs):
+    """Remember the rollup bucket the assessment is counted in before the write"""
+    if not raw:
+        instance._rollup_entry = rollup.stored_entry(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=DamageAssessment)
+def assessment_rollup_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Read back rather than trusting the instance (update_fields may skip fields)
+        rollup.move(getattr(instance, '_rollup_entry', None), rollup.stored_entry(instance.pk))
+
+
+@receiver(post_delete, sender=DamageAssessment)
+def assessment_rollup_deleted(sender, instance, **kwargs):
+    rollup.move(getattr(instance, '_rollup_entry', None), None)
+
+
+@receiver(pre_save, sender=Household)
+def household_rollup_before(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._rollup_previous = rollup.household_entry(instance.pk)
+
+
+@receiver(post_save, sender=Household)
+def household_rollup_saved(sender, instance, created, raw=False, **kwargs):
+    """A new barangay or 4Ps flag moves the household's assessments in the rollup"""
+    previous = getattr(instance, '_rollup_previous', None)
+    if not raw and not created and previous is not None:
+        rollup.move_household(instance.pk, previous, rollup.household_entry(instance.pk))
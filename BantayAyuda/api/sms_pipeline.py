@@ -0,0 +1,292 @@
+"""
+Concurrent, rate-limited SMS generation.
+
+ml_engine.generate_sms makes one blocking Gemini call, so generating SMS for
+a whole disaster one household at a time takes N x the LLM latency. The
+pipeline here runs the calls on an asyncio event loop instead:
+
+- at most SMS_LLM_CONCURRENCY calls are in flight at once,
+- a token bucket holds the call rate to SMS_LLM_RATE per second (with bursts
+  of SMS_LLM_BURST), so throughput is bounded by the quota, not by latency;
+  the bucket is shared by every pipeline in the process,
+- every call has a SMS_LLM_TIMEOUT and the whole batch a SMS_LLM_DEADLINE,
+- any failure, timeout or missed deadline falls back to the SMS template.
+
+The text only really depends on the amount, damage status and barangay, so
+the LLM is asked for a template per (amount, status, barangay) with a
+placeholder for the household ID, which is filled in locally. Templates are
+cached per prompt version in the 'sms_templates' cache (TTL and eviction
+from settings.CACHES), so a disaster needs one LLM call per distinct
+combination rather than per household.
+
+The Gemini REST endpoint (SMS_LLM_URL) is called through a pooled client
+(api/http_client.py) on the pipeline's own threads, so tests can point it at
+a local stub server. Calls share Gemini's circuit breaker with the
+generate-sms view: once it opens, the remaining messages fail fast to the
+template.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, InvalidCacheBackendError
+
+from . import ml_engine
+from .http_client import PooledClient, UpstreamError, gemini_breaker, gemini_text
+from .ml_engine import HOUSEHOLD_PLACEHOLDER, SMS_PROMPT_VERSION, sms_template, sms_template_prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket shared by event loops and threads: refills ``rate`` tokens
+    per second and holds at most ``capacity``. An acquire reserves the next
+    token under a lock and sleeps until it is due, so waiters are served in
+    arrival order whichever loop they run on.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; return the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # Timed out waiting: the token was never used
+                with self._lock:
+                    self.tokens += 1
+                raise
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _rate_limiter(rate, burst):
+    """
+    Token bucket shared by every pipeline with the same rate and burst, so
+    concurrent batches (requests, jobs, outbox workers) stay within the LLM
+    quota together instead of each getting the full rate.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get((rate, burst))
+        if bucket is None:
+            bucket = _buckets[(rate, burst)] = TokenBucket(rate, burst)
+        return bucket
+
+
+def template_cache():
+    try:
+        return caches['sms_templates']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def template_key(message):
+    """Cache key of the LLM template for a message's amount, status and barangay"""
+    barangay = hashlib.md5(str(message['brgy']).encode()).hexdigest()[:16]
+    return f"sms-template:v{SMS_PROMPT_VERSION}:{message['amount']}:{message['status']}:{barangay}"
+
+
+def fill_template(template, household_id):
+    return template.replace(HOUSEHOLD_PLACEHOLDER, str(household_id))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _pipeline_client(pool_size, timeout):
+    """
+    Pooled Gemini client shared by pipelines with the same settings, so
+    connections are reused across batches. No retries: the rate limiter
+    and the batch deadline already bound the calls, and a failed message
+    falls back to the template.
+    """
+    with _clients_lock:
+        client = _clients.get((pool_size, timeout))
+        if client is None:
+            client = _clients[(pool_size, timeout)] = PooledClient(
+                pool_size=pool_size,
+                connect_timeout=min(timeout, getattr(settings, 'GEMINI_CONNECT_TIMEOUT', 3.05)),
+                read_timeout=timeout,
+                retries=0,
+                breaker=gemini_breaker,
+            )
+        return client
+
+
+class SmsPipeline:
+    """
+    Generate SMS text for many households concurrently.
+
+    Settings can be overridden per pipeline; messages are dicts with the
+    arguments of ml_engine.generate_sms (amount, household_id, brgy, status).
+    After a run, ``stats`` counts messages by outcome: 'llm' (template
+    generated in this run), 'cached' (template from the cache), 'template'
+    (no LLM needed or configured), 'timeout' and 'error'; ``llm_calls``
+    counts the LLM requests made.
+    """
+
+    def __init__(self, url=None, api_key=None, concurrency=None, rate=None, burst=None,
+                 timeout=None, deadline=None):
+        self.url = url if url is not None else getattr(settings, 'SMS_LLM_URL', '')
+        self.api_key = api_key if api_key is not None else ml_engine.GEMINI_API_KEY
+        self.concurrency = concurrency or getattr(settings, 'SMS_LLM_CONCURRENCY', 8)
+        self.rate = rate or getattr(settings, 'SMS_LLM_RATE', 1.0)
+        self.burst = burst or getattr(settings, 'SMS_LLM_BURST', 5)
+        self.timeout = timeout or getattr(settings, 'SMS_LLM_TIMEOUT', 10.0)
+        self.deadline = deadline if deadline is not None else getattr(settings, 'SMS_LLM_DEADLINE', 30.0)
+        self.stats = {'llm': 0, 'cached': 0, 'template': 0, 'timeout': 0, 'error': 0}
+        self.llm_calls = 0
+        self.client = _pipeline_client(self.concurrency, self.timeout)
+        self.bucket = _rate_limiter(self.rate, self.burst)
+
+    def call_llm(self, prompt):
+        """Blocking Gemini call (run on the pipeline's threads)"""
+        result = self.client.post_json(
+            self.url,
+            {'contents': [{'parts': [{'text': prompt}]}]},
+            params={'key': self.api_key},
+        )
+        text = gemini_text(result)
+        if len(text) <= 20:
+            raise ValueError(f'Generated SMS too short: {text!r}')
+        return text
+
+    async def _generate_template(self, message, semaphore, bucket, executor, deadline):
+        """(LLM template or None, outcome) for one (amount, status, barangay)"""
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            try:
+                remaining = deadline - loop.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(bucket.acquire(), remaining)
+
+                timeout = self.timeout
+                if deadline is not None:
+                    timeout = min(timeout, deadline - loop.time())
+                self.llm_calls += 1
+                prompt = sms_template_prompt(message['amount'], message['brgy'], message['status'])
+                call = loop.run_in_executor(executor, self.call_llm, prompt)
+                template = await asyncio.wait_for(call, max(timeout, 0))
+                if HOUSEHOLD_PLACEHOLDER not in template:
+                    raise ValueError(f'Generated template has no {HOUSEHOLD_PLACEHOLDER}: {template!r}')
+            except asyncio.TimeoutError:
+                return None, 'timeout'
+            except UpstreamError as e:
+                if isinstance(e.__cause__, requests.Timeout):
+                    return None, 'timeout'
+                logger.debug('SMS template generation for %s failed, using the fallback: %s', template_key(message), e)
+                return None, 'error'
+            except Exception as e:
+                logger.debug('SMS template generation for %s failed, using the fallback: %s', template_key(message), e)
+                return None, 'error'
+        return template, 'llm'
+
+    async def _generate_templates(self, wanted):
+        """{cache key: (template or None, outcome)} for the wanted messages"""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        deadline = loop.time() + self.deadline if self.deadline else None
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='sms-llm')
+        try:
+            results = await asyncio.gather(*(
+                self._generate_template(message, semaphore, self.bucket, executor, deadline)
+                for message in wanted.values()
+            ))
+        finally:
+            # Calls abandoned after a timeout finish (or time out) on their own
+            executor.shutdown(wait=False, cancel_futures=True)
+        return dict(zip(wanted, results))
+
+    async def generate(self, messages):
+        """SMS text for each message, in input order"""
+        if not self.url or not self.api_key:
+            self.stats['template'] += len(messages)
+            return [sms_template(**message) for message in messages]
+
+        # One template per distinct key; households with no ECT get the
+        # fixed notice, like generate_sms
+        wanted = {}
+        for message in messages:
+            if message['amount'] != 0:
+                wanted.setdefault(template_key(message), message)
+
+        cache = template_cache()
+        templates = {
+            key: (template, 'cached')
+            for key, template in (await sync_to_async(cache.get_many)(list(wanted))).items()
+        }
+        missing = {key: message for key, message in wanted.items() if key not in templates}
+        if missing:
+            generated = await self._generate_templates(missing)
+            await sync_to_async(cache.set_many)(
+                {key: template for key, (template, _) in generated.items() if template is not None},
+                getattr(settings, 'SMS_TEMPLATE_TTL', DEFAULT_TIMEOUT),
+            )
+            templates.update(generated)
+
+        results = []
+        for message in messages:
+            template, outcome = None, 'template'
+            if message['amount'] != 0:
+                template, outcome = templates[template_key(message)]
+            self.stats[outcome] += 1
+            if template is None:
+                results.append(sms_template(**message))
+            else:
+                results.append(fill_template(template, message['household_id']))
+
+        failed = self.stats['timeout'] + self.stats['error']
+        if failed:
+            logger.warning(
+                'SMS generation used the template for %d of %d messages (%d timed out, %d failed)',
+                failed, len(messages), self.stats['timeout'], self.stats['error'],
+            )
+        return results
+
+    def run(self, messages):
+        """Blocking version of generate(), usable from views and commands"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.generate(messages))
+        # Called from async code: run the pipeline on its own loop and thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.generate(messages)).result()
+
+
+def generate_sms_many(messages):
+    """
+    SMS text for many households (see SmsPipeline), in input order.
+
+    Args:
+        messages: list of dicts with keys amount, household_id, brgy, status
+    """
+    return SmsPipeline().run(messages)
@@ -0,0 +1,161 @@
+"""
+Spatial grid index for household coordinates.
+
+Households carry a geohash of their latitude/longitude in an indexed
+column. A geohash cell is a string prefix, so "all households inside a cell"
+is a plain B-tree range scan (geohash >= cell AND geohash < cell + '~') that
+works the same on SQLite and PostgreSQL without PostGIS.
+
+A map viewport (bbox) is covered by a small set of cells whose size follows
+the Leaflet zoom level; the exact bbox is then applied on the rows the index
+returned.
+"""
+from django.db.models import Q
+
+
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells
+MAX_COVER_CELLS = 32   # Upper bound on range predicates per bbox query
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_RANGE_END = '~'  # Sorts after every base32 character
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return (lat_height, lon_width) in degrees of a geohash cell"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def precision_for_zoom(zoom):
+    """
+    Geohash precision whose cells are no wider than one map tile at ``zoom``.
+    A Leaflet tile spans 360 / 2**zoom degrees of longitude.
+    """
+    tile_width = 360.0 / (1 << max(0, min(int(zoom), 30)))
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] <= tile_width:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def parse_bbox(value):
+    """
+    Parse a Leaflet bbox string "west,south,east,north".
+
+    Raises:
+        ValueError: if the string is malformed or the box is inverted
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('bbox must be "west,south,east,north"')
+    if south > north or west > east:
+        raise ValueError('bbox must be "west,south,east,north"')
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    return west, south, east, north
+
+
+def covering_cells(bbox, precision):
+    """List the geohash cells at ``precision`` that intersect ``bbox``"""
+    west, south, east, north = bbox
+    lat_step, lon_step = cell_size(precision)
+
+    cells = []
+    row = int((south + 90.0) // lat_step)
+    last_row = int((min(north, 90.0 - 1e-9) + 90.0) // lat_step)
+    first_col = int((west + 180.0) // lon_step)
+    last_col = int((min(east, 180.0 - 1e-9) + 180.0) // lon_step)
+    while row <= last_row:
+        lat = -90.0 + (row + 0.5) * lat_step
+        for col in range(first_col, last_col + 1):
+            lon = -180.0 + (col + 0.5) * lon_step
+            cells.append(encode_geohash(lat, lon, precision))
+        row += 1
+    return cells
+
+
+def cover_bbox(bbox, zoom=None):
+    """
+    Pick the geohash cells used to answer a bbox query.
+
+    Starts from the zoom level's tile-sized precision (or the finest
+    precision when no zoom is given) and coarsens until the bbox is covered
+    by at most MAX_COVER_CELLS cells.
+    """
+    west, south, east, north = bbox
+    precision = GEOHASH_PRECISION if zoom is None else precision_for_zoom(zoom)
+    while precision > 1:
+        lat_step, lon_step = cell_size(precision)
+        rows = int((north - south) // lat_step) + 2
+        cols = int((east - west) // lon_step) + 2
+        if rows * cols <= MAX_COVER_CELLS:
+            break
+        precision -= 1
+    return covering_cells(bbox, precision)
+
+
+def cell_filter(cell, prefix=''):
+    """Q object selecting rows whose geohash lies inside ``cell`` (index range scan)"""
+    return Q(**{
+        f'{prefix}geohash__gte': cell,
+        f'{prefix}geohash__lt': cell + _RANGE_END,
+    })
+
+
+def bbox_filter(bbox, zoom=None, prefix=''):
+    """
+    Build a Q object selecting rows inside ``bbox``.
+
+    The geohash range predicates let the database use the index; the exact
+    latitude/longitude bounds then trim the edges of the covering cells.
+    ``prefix`` is the lookup path to the Household (e.g. 'household__').
+    """
+    west, south, east, north = bbox
+    cells = Q()
+    for cell in cover_bbox(bbox, zoom):
+        cells |= cell_filter(cell, prefix)
+    return cells & Q(**{
+        f'{prefix}latitude__gte': south,
+        f'{prefix}latitude__lte': north,
+        f'{prefix}longitude__gte': west,
+        f'{prefix}longitude__lte': east,
+    })
@@ -1,3 +1,2221 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from datetime import timedelta
+from unittest import mock
+
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .columnar import MEDIA_TYPE, decode_columnar
+from .export import HEADER, stream_csv, export_rows
+from .parquet_export import stream_export
+from . import ml_engine
+from .clusters import CLUSTER_PRECISION, build_clusters, cached_disaster_ids, get_clusters, refresh_cells
+from .geojson import household_rows, parse_cursor, stream_feature_collection
+from .http_client import CircuitBreaker, CircuitOpenError, PooledClient, UpstreamError, gemini_breaker, gemini_client, gemini_text
+from .jobs import fail_stale_jobs, run_job, start_job
+from .model_registry import LoadedModel, ModelRegistry, registry
+from .model_server import MicroBatcher, ModelServer, get_client
+from .models import Household, DisasterEvent, DamageAssessment, EctPrediction, PredictionJob, SmsMessage, BudgetRollup, PayoutRuleSet
+from .outbox import (
+    FileGateway, GatewayError, HttpGateway, claim_batch, dispatch_batch, enqueue_disaster, release_stale_claims,
+    requeue_failed,
+)
+from .payout_simulator import PayoutSimulator
+from .payouts import cached_payouts, create_rule_set, current_payouts, recompute
+from .prediction_store import predict_assessments, prediction_results
+from .rollup import rebuild as rebuild_rollup, verify as verify_rollup
+from .sms_pipeline import SmsPipeline, TokenBucket, template_cache, template_key
+from .spatial import encode_geohash, cover_bbox, parse_bbox, MAX_COVER_CELLS
+from .tree_eval import compile_catboost
+
+
+def make_households(disaster, count, start=0, status=DamageAssessment.DamageStatus.PARTIAL):
+    """Create ``count`` households, each with an assessment for ``disaster``."""
+    households = []
+    for i in range(start, start + count):
+        household = Household.objects.create(
+            household_id=f'HH-{i:05d}',
+            name=f'Household {i:05d}',
+            address=f'{i} Juan Luna Street, Tondo, Manila',
+            barangay=['Tondo', 'Baseco', 'Navotas'][i % 3],
+            latitude=Decimal('14.620000') + Decimal(i) / 100000,
+            longitude=Decimal('120.970000') + Decimal(i) / 100000,
+            flood_depth=1.5,
+            house_height=4.0,
+            house_width=8.0,
+            is_4ps=i % 2 == 0,
+        )
+        DamageAssessment.objects.create(household=household, disaster=disaster, damage_status=status)
+        households.append(household)
+    return households
+
+
+class GeoJSONViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.url = reverse('household-geojson')
+
+    def get_geojson(self):
+        return self.client.get(self.url, {'disaster_id': self.disaster.pk})
+
+    def test_requires_disaster_id(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_unknown_disaster(self):
+        self.assertEqual(self.client.get(self.url, {'disaster_id': 999}).status_code, 404)
+
+    def test_features_use_assessment_for_requested_disaster(self):
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        assessed, = make_households(self.disaster, 1, status=DamageAssessment.DamageStatus.TOTAL)
+        DamageAssessment.objects.create(household=assessed, disaster=other, damage_status='PARTIAL')
+        unassessed = Household.objects.create(
+            name='No Assessment', address='1 Baseco Road', barangay='Baseco',
+            latitude=Decimal('14.592000'), longitude=Decimal('120.960000'),
+        )
+
+        response = self.get_geojson()
+        self.assertEqual(response.status_code, 200)
+        features = {f['properties']['id']: f for f in response.json()['features']}
+        self.assertEqual(len(features), 2)
+
+        total = features[assessed.pk]['properties']
+        self.assertEqual(total['damage_status'], 'TOTAL')
+        self.assertEqual(total['ect_amount'], 10000.0)
+        self.assertEqual(total['marker_color'], 'red')
+        self.assertEqual(
+            features[assessed.pk]['geometry']['coordinates'],
+            [float(assessed.longitude), float(assessed.latitude)],
+        )
+
+        none = features[unassessed.pk]['properties']
+        self.assertEqual(none['damage_status'], 'NONE')
+        self.assertEqual(none['ect_amount'], 0)
+        self.assertEqual(none['marker_color'], 'green')
+        self.assertEqual(none['contact_number'], '')
+
+    def test_query_count_is_constant(self):
+        make_households(self.disaster, 3)
+        with self.assertNumQueries(2):
+            self.get_geojson()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_households(self.disaster, 30, start=3)
+        with self.assertNumQueries(2):
+            response = self.get_geojson()
+        self.assertEqual(len(response.json()['features']), 33)
+
+    def test_streaming_matches_buffered_response(self):
+        make_households(self.disaster, 5)
+        buffered = self.get_geojson().json()
+
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'stream': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(streamed['features'], buffered['features'])
+        self.assertIn('cursor', streamed)
+
+    def test_stream_chunks_are_valid_json(self):
+        make_households(self.disaster, 5)
+        rows = household_rows(self.disaster.pk)
+        for count in (0, 2, 5):
+            chunks = list(stream_feature_collection(rows[:count], chunk_size=2))
+            self.assertEqual(len(json.loads(''.join(chunks))['features']), count)
+
+    def test_bbox_only_returns_households_in_viewport(self):
+        inside = make_households(self.disaster, 3)
+        outside = Household.objects.create(
+            name='Navotas Household', address='1 C-4 Road', barangay='Navotas',
+            latitude=Decimal('14.655000'), longitude=Decimal('120.945000'),
+        )
+        for zoom in ('', '6', '13', '18'):
+            response = self.client.get(self.url, {
+                'disaster_id': self.disaster.pk,
+                'bbox': '120.969,14.619,120.975,14.625',
+                'zoom': zoom,
+            })
+            ids = {f['properties']['id'] for f in response.json()['features']}
+            self.assertEqual(ids, {h.pk for h in inside}, zoom)
+            self.assertNotIn(outside.pk, ids)
+
+    def test_bbox_query_count_is_constant(self):
+        make_households(self.disaster, 20)
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'disaster_id': self.disaster.pk, 'bbox': '120,14,121,15', 'zoom': 12})
+
+    def test_invalid_bbox(self):
+        for bbox in ('1,2,3', 'a,b,c,d', '121,14,120,15'):
+            response = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'bbox': bbox})
+            self.assertEqual(response.status_code, 400, bbox)
+
+
+class SpatialIndexTests(TestCase):
+    def test_encode_geohash(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_household_save_sets_geohash(self):
+        household = Household.objects.create(
+            name='Juan', address='Tondo', barangay='Tondo',
+            latitude=Decimal('14.625000'), longitude=Decimal('120.970000'),
+        )
+        self.assertEqual(household.geohash, encode_geohash(14.625, 120.97))
+
+        household.latitude = Decimal('14.592000')
+        household.save(update_fields=['latitude'])
+        household.refresh_from_db()
+        self.assertEqual(household.geohash, encode_geohash(14.592, 120.97))
+
+    def test_cover_bbox_is_bounded(self):
+        for bbox in ('120,14,121,15', '-180,-90,180,90', '120.97,14.62,120.9701,14.6201'):
+            for zoom in (None, 0, 10, 18):
+                cells = cover_bbox(parse_bbox(bbox), zoom)
+                self.assertTrue(0 < len(cells) <= MAX_COVER_CELLS, (bbox, zoom))
+
+
+class ClusterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.url = reverse('household-clusters')
+        self.households = make_households(self.disaster, 4)
+        DamageAssessment.objects.filter(household=self.households[0]).update(
+            damage_status='TOTAL', recommended_ect_amount=10000,
+        )
+
+    def get_clusters(self, zoom):
+        return self.client.get(self.url, {'disaster_id': self.disaster.pk, 'zoom': zoom}).json()
+
+    def test_low_zoom_aggregates_everything(self):
+        data = self.get_clusters(3)
+        self.assertEqual(len(data['clusters']), 1)
+        cluster = data['clusters'][0]
+        self.assertEqual(cluster['count'], 4)
+        self.assertEqual(cluster['by_status'], {'TOTAL': 1, 'PARTIAL': 3, 'NONE': 0})
+        self.assertEqual(cluster['total_ect_amount'], 25000.0)
+        self.assertAlmostEqual(cluster['lat'], 14.620015, places=6)
+
+    def test_every_level_sums_to_household_count(self):
+        Household.objects.create(
+            name='Unassessed', address='1 C-4 Road', barangay='Navotas',
+            latitude=Decimal('14.655000'), longitude=Decimal('120.945000'),
+        )
+        for precision, level in get_clusters(self.disaster.pk).items():
+            self.assertEqual(sum(stats[0] for stats in level.values()), 5, precision)
+        self.assertEqual(len(self.get_clusters(3)['clusters']), 1)
+        self.assertEqual(len(self.get_clusters(14)['clusters']), 2)
+
+    def test_assessment_change_updates_clusters_incrementally(self):
+        build_clusters(self.disaster.pk)
+        assessment = DamageAssessment.objects.get(household=self.households[1])
+        assessment.damage_status = 'NONE'
+        with self.captureOnCommitCallbacks(execute=True):
+            assessment.save()
+
+        cluster = self.get_clusters(3)['clusters'][0]
+        self.assertEqual(cluster['by_status'], {'TOTAL': 1, 'PARTIAL': 2, 'NONE': 1})
+        self.assertEqual(cluster['total_ect_amount'], 20000.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.households[0].delete()
+        cluster = self.get_clusters(3)['clusters'][0]
+        self.assertEqual(cluster['count'], 3)
+        self.assertEqual(cluster['by_status'], {'TOTAL': 0, 'PARTIAL': 2, 'NONE': 1})
+
+    def test_refresh_queries_only_the_changed_cell(self):
+        build_clusters(self.disaster.pk)
+        assessment = DamageAssessment.objects.get(household=self.households[1])
+        assessment.damage_status = 'TOTAL'
+        with self.captureOnCommitCallbacks() as callbacks:
+            assessment.save()
+        # Household geohash lookup and one single-cell aggregate
+        with self.assertNumQueries(2):
+            for callback in callbacks:
+                callback()
+
+    def test_refresh_depends_only_on_the_cached_levels(self):
+        # Cached by another process: no other bookkeeping key exists
+        levels = build_clusters(self.disaster.pk)
+        cache.clear()
+        cache.set(f'clusters:{self.disaster.pk}', levels)
+        self.assertEqual(cached_disaster_ids(), {self.disaster.pk})
+
+        assessment = DamageAssessment.objects.get(household=self.households[1])
+        assessment.damage_status = 'NONE'
+        with self.captureOnCommitCallbacks(execute=True):
+            assessment.save()
+        self.assertEqual(self.get_clusters(3)['clusters'][0]['by_status'], {'TOTAL': 1, 'PARTIAL': 2, 'NONE': 1})
+
+    def test_refresh_drops_the_clusters_when_locked_out(self):
+        build_clusters(self.disaster.pk)
+        cache.add(f'clusters:{self.disaster.pk}:lock', True)
+        with mock.patch('api.clusters.LOCK_WAIT', 0):
+            refresh_cells(self.disaster.pk, [self.households[1].geohash])
+        self.assertEqual(cached_disaster_ids(), set())
+
+    def test_household_move_updates_both_cells(self):
+        build_clusters(self.disaster.pk)
+        household = self.households[2]
+        household.latitude = Decimal('14.655000')
+        household.longitude = Decimal('120.945000')
+        with self.captureOnCommitCallbacks(execute=True):
+            household.save()
+
+        finest = get_clusters(self.disaster.pk)[CLUSTER_PRECISION]
+        rebuilt = build_clusters(self.disaster.pk)[CLUSTER_PRECISION]
+        self.assertEqual(
+            {cell: stats[0] for cell, stats in finest.items()},
+            {cell: stats[0] for cell, stats in rebuilt.items()},
+        )
+        self.assertEqual(len(finest), 2)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 3)
+        self.params = {'disaster_id': self.disaster.pk}
+
+    def test_repeat_requests_are_served_from_cache(self):
+        for url in (reverse('household-geojson'), reverse('budget_summary')):
+            first = self.client.get(url, self.params)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(0):
+                second = self.client.get(url, self.params)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_action_response_is_served_from_cache(self):
+        # The columnar payload is a DRF Response returned by the geojson action
+        url = reverse('household-geojson')
+        params = {**self.params, 'format': 'columnar'}
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, params)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_export_keeps_content_disposition(self):
+        url = reverse('export_csv')
+        first = self.client.get(url, self.params)
+        second = self.client.get(url, self.params)
+        self.assertEqual(second['Content-Disposition'], first['Content-Disposition'])
+
+    def test_streamed_export_answers_if_none_match(self):
+        # Streamed responses are not stored, but still get an ETag
+        url = reverse('export_csv')
+        etag = self.client.get(url, self.params)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_none_match_returns_304(self):
+        url = reverse('budget_summary')
+        etag = self.client.get(url, self.params)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_assessment_write_invalidates_disaster(self):
+        url = reverse('budget_summary')
+        first = self.client.get(url, self.params)
+        self.assertEqual(first.json()['total_budget'], 15000)
+
+        assessment = DamageAssessment.objects.get(household=self.households[0])
+        assessment.damage_status = 'TOTAL'
+        with self.captureOnCommitCallbacks(execute=True):
+            assessment.save()
+
+        second = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()['total_budget'], 20000)
+
+    def test_household_write_invalidates_every_disaster(self):
+        url = reverse('household-geojson')
+        first = self.client.get(url, self.params)
+        with self.captureOnCommitCallbacks(execute=True):
+            Household.objects.filter(pk=self.households[0].pk).first().delete()
+        second = self.client.get(url, self.params)
+        self.assertEqual(len(second.json()['features']), len(first.json()['features']) - 1)
+
+    def test_other_disasters_stay_cached(self):
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        url = reverse('budget_summary')
+        self.client.get(url, {'disaster_id': other.pk})
+
+        assessment = DamageAssessment.objects.get(household=self.households[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            assessment.save()
+        with self.assertNumQueries(0):
+            self.client.get(url, {'disaster_id': other.pk})
+
+    def test_errors_are_not_cached(self):
+        url = reverse('budget_summary')
+        self.assertEqual(self.client.get(url, {'disaster_id': 999}).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            DisasterEvent.objects.create(pk=999, name='Late Typhoon', date_occurred='2025-12-01')
+        self.assertEqual(self.client.get(url, {'disaster_id': 999}).status_code, 200)
+
+
+class BudgetSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(self.disaster, 7, status=DamageAssessment.DamageStatus.TOTAL)
+        make_households(self.disaster, 5, start=7)
+        make_households(self.disaster, 4, start=12, status=DamageAssessment.DamageStatus.NONE)
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        make_households(other, 3, start=16)
+
+    def summary(self):
+        cache.clear()
+        response = self.client.get(reverse('budget_summary'), {'disaster_id': self.disaster.pk})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_totals_match_the_assessments(self):
+        summary = self.summary()
+        assessments = DamageAssessment.objects.filter(disaster=self.disaster).select_related('household')
+        by_barangay = {}
+        for assessment in assessments:
+            barangay = by_barangay.setdefault(assessment.household.barangay, {'count': 0, 'budget': 0})
+            barangay['count'] += 1
+            barangay['budget'] += int(assessment.recommended_ect_amount)
+
+        self.assertEqual(summary, {
+            'disaster_name': 'Typhoon Test',
+            'total_households': 16,
+            'total_budget': 7 * 10000 + 5 * 5000,
+            'by_status': {'TOTAL': 7, 'PARTIAL': 5, 'NONE': 4},
+            'by_barangay': by_barangay,
+            'by_amount': {'0': 4, '5000': 5, '10000': 7},
+            'total_4ps': sum(a.household.is_4ps for a in assessments),
+            'average_per_household': round(95000 / 16, 2),
+        })
+
+    def test_query_count_does_not_grow_with_households(self):
+        with CaptureQueriesContext(connection) as before:
+            self.summary()
+        make_households(self.disaster, 20, start=100)
+        with self.assertNumQueries(len(before)):
+            self.assertEqual(self.summary()['total_households'], 36)
+
+
+class BudgetRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 6)
+
+    def assertRollupConsistent(self):
+        self.assertEqual(verify_rollup(), [])
+
+    def rollup(self, **filters):
+        return {
+            (row.barangay, row.damage_status, int(row.ect_amount)): (row.count, row.count_4ps, int(row.amount_total))
+            for row in BudgetRollup.objects.filter(disaster=self.disaster, count__gt=0, **filters)
+        }
+
+    def test_assessment_writes_update_the_rollup(self):
+        self.assertEqual(self.rollup(barangay='Tondo'), {('Tondo', 'PARTIAL', 5000): (2, 1, 10000)})
+
+        assessment = DamageAssessment.objects.get(household=self.households[0])
+        assessment.damage_status = 'TOTAL'
+        assessment.save()
+        self.assertEqual(self.rollup(barangay='Tondo'), {
+            ('Tondo', 'PARTIAL', 5000): (1, 0, 5000),
+            ('Tondo', 'TOTAL', 10000): (1, 1, 10000),
+        })
+
+        assessment.notes = 'Roof gone'
+        with self.assertNumQueries(6):  # Rule set, savepoint, read before, UPDATE, read after, release
+            assessment.save()
+
+        assessment.delete()
+        self.assertEqual(self.rollup(barangay='Tondo'), {('Tondo', 'PARTIAL', 5000): (1, 0, 5000)})
+        self.assertRollupConsistent()
+
+    def test_household_changes_move_its_assessments(self):
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-12-01')
+        household = self.households[0]
+        DamageAssessment.objects.create(household=household, disaster=other, damage_status='TOTAL')
+
+        household.barangay = 'Baseco'
+        household.is_4ps = False
+        household.save()
+        self.assertEqual(self.rollup(barangay='Tondo'), {('Tondo', 'PARTIAL', 5000): (1, 0, 5000)})
+        self.assertEqual(self.rollup(barangay='Baseco'), {('Baseco', 'PARTIAL', 5000): (3, 1, 15000)})
+        self.assertRollupConsistent()
+
+        household.delete()
+        self.assertEqual(self.rollup(barangay='Baseco'), {('Baseco', 'PARTIAL', 5000): (2, 1, 10000)})
+        self.assertRollupConsistent()
+
+        other_id = other.pk
+        other.delete()
+        self.assertFalse(BudgetRollup.objects.filter(disaster_id=other_id).exists())
+        self.assertRollupConsistent()
+
+    def test_rolled_back_writes_leave_the_rollup_alone(self):
+        before = self.rollup()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            assessment = DamageAssessment.objects.get(household=self.households[0])
+            assessment.damage_status = 'NONE'
+            assessment.save()
+            raise RuntimeError
+        self.assertEqual(self.rollup(), before)
+
+    def test_summary_reads_the_rollup(self):
+        BudgetRollup.objects.filter(disaster=self.disaster, barangay='Tondo').update(count=100)
+        summary = self.client.get(reverse('budget_summary'), {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(summary['by_barangay']['Tondo']['count'], 100)
+
+    def test_command_verifies_and_rebuilds(self):
+        # QuerySet.update() bypasses the signals
+        DamageAssessment.objects.filter(household=self.households[0]).update(damage_status='NONE', recommended_ect_amount=0)
+        self.assertEqual(len(verify_rollup()), 2)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '2 rollup rows differ'):
+            call_command('budget_rollup', stdout=out)
+        self.assertIn(f'Disaster {self.disaster.pk} / Tondo / PARTIAL', out.getvalue())
+
+        call_command('budget_rollup', '--rebuild', '--disaster', str(self.disaster.pk), stdout=out)
+        self.assertRollupConsistent()
+        call_command('budget_rollup', stdout=out)
+        self.assertIn('matches', out.getvalue())
+        self.assertEqual(rebuild_rollup(), BudgetRollup.objects.count())
+
+
+class PayoutRuleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(self.disaster, 4, status=DamageAssessment.DamageStatus.TOTAL)
+        make_households(self.disaster, 5, start=4)
+        make_households(self.disaster, 2, start=9, status=DamageAssessment.DamageStatus.NONE)
+        self.other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        make_households(self.other, 3, start=11)
+
+    def adopt(self, amounts, disaster_id=None, **extra):
+        return self.client.post(
+            reverse('payout_rules'),
+            {'disaster_id': disaster_id or self.disaster.pk, 'amounts': amounts, **extra},
+            content_type='application/json',
+        )
+
+    def amounts(self, disaster):
+        return {
+            assessment.pk: int(assessment.recommended_ect_amount)
+            for assessment in DamageAssessment.objects.filter(disaster=disaster)
+        }
+
+    def test_saves_in_a_scope_read_the_rule_set_once(self):
+        assessments = list(DamageAssessment.objects.filter(disaster=self.disaster).order_by('pk')[:3])
+        with CaptureQueriesContext(connection) as queries, cached_payouts():
+            for assessment in assessments:
+                assessment.damage_status = 'PARTIAL'
+                assessment.save()
+            create_rule_set(PayoutRuleSet(disaster=self.disaster, total_amount=9000, partial_amount=6000))
+            assessments[0].damage_status = 'TOTAL'
+            assessments[0].save()
+        rule_set_reads = [q for q in queries if 'FROM "api_payoutruleset"' in q['sql'] and 'MAX(' not in q['sql']]
+        self.assertEqual(len(rule_set_reads), 2)  # First save, and recompute after the new version
+        assessments[0].refresh_from_db()
+        self.assertEqual(int(assessments[0].recommended_ect_amount), 9000)
+
+    def test_new_rule_set_reprices_the_disaster_like_save(self):
+        self.client.get(reverse('budget_summary'), {'disaster_id': self.disaster.pk})  # Cached
+        other_before = self.amounts(self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.adopt({'TOTAL': 9000, 'PARTIAL': 7000, 'NONE': 500}, notes='Revised after LGU review')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['rule_set']['version'], 1)
+        self.assertEqual(data['repriced'], 11)
+
+        repriced = self.amounts(self.disaster)
+        self.assertEqual(sorted(repriced.values()), [500] * 2 + [7000] * 5 + [9000] * 4)
+        # Saving each row one by one agrees with the bulk UPDATE
+        for assessment in DamageAssessment.objects.filter(disaster=self.disaster):
+            assessment.save()
+        self.assertEqual(self.amounts(self.disaster), repriced)
+        self.assertEqual(self.amounts(self.other), other_before)
+        self.assertEqual(verify_rollup(), [])
+
+        summary = self.client.get(reverse('budget_summary'), {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(summary['total_budget'], 2 * 500 + 5 * 7000 + 4 * 9000)
+
+    def test_versions(self):
+        self.adopt({'TOTAL': 9000, 'PARTIAL': 7000, 'NONE': 0})
+        response = self.adopt({'TOTAL': 9000, 'PARTIAL': 6000, 'NONE': 0}, created_by='MSWDO')
+        self.assertEqual(response.json()['rule_set']['version'], 2)
+        self.assertEqual(response.json()['repriced'], 5)  # Only the PARTIAL rows changed
+
+        data = self.client.get(reverse('payout_rules'), {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(data['current'], {'TOTAL': 9000, 'PARTIAL': 6000, 'NONE': 0})
+        self.assertEqual([v['version'] for v in data['versions']], [2, 1])
+        self.assertEqual(current_payouts(self.other.pk), {'TOTAL': 10000, 'PARTIAL': 5000, 'NONE': 0})
+
+        # New assessments are priced with the version in force
+        household = make_households(self.other, 1, start=20)[0]
+        assessment = DamageAssessment.objects.create(
+            household=household, disaster=self.disaster, damage_status=DamageAssessment.DamageStatus.PARTIAL,
+        )
+        self.assertEqual(assessment.recommended_ect_amount, 6000)
+
+    def test_recompute_is_one_update(self):
+        PayoutRuleSet.objects.create(disaster=self.disaster, version=1, total_amount=8000, partial_amount=4000)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(recompute(self.disaster.pk), 9)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_damageassessment"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE WHEN', updates[0])
+        self.assertEqual(recompute(self.disaster.pk), 0)
+
+    def test_errors(self):
+        cases = [
+            ({'TOTAL': 9000, 'PARTIAL': 7000}, 'NONE amount must be a whole number'),
+            ({'TOTAL': 12000, 'PARTIAL': 7000, 'NONE': 0}, 'TOTAL amount must be between 0 and 10000'),
+            ({'TOTAL': 9000, 'PARTIAL': 7000, 'NONE': 0, 'SEVERE': 1}, "Unknown damage status 'SEVERE'"),
+            ([9000, 7000, 0], 'amounts must be an object'),
+        ]
+        for amounts, message in cases:
+            response = self.adopt(amounts)
+            self.assertEqual(response.status_code, 400, amounts)
+            self.assertIn(message, response.json()['error'])
+        self.assertEqual(self.adopt({'TOTAL': 1, 'PARTIAL': 1, 'NONE': 0}, 999).status_code, 404)
+        self.assertEqual(self.client.get(reverse('payout_rules')).status_code, 400)
+        self.assertFalse(PayoutRuleSet.objects.exists())
+
+
+class PayoutSimulatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(self.disaster, 5, status=DamageAssessment.DamageStatus.TOTAL)
+        make_households(self.disaster, 7, start=5)
+        make_households(self.disaster, 3, start=12, status=DamageAssessment.DamageStatus.NONE)
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        make_households(other, 4, start=15)
+
+    def simulate(self, scenarios, disaster_id=None):
+        return self.client.post(
+            reverse('budget_simulate'),
+            {'disaster_id': disaster_id or self.disaster.pk, 'scenarios': scenarios},
+            content_type='application/json',
+        )
+
+    def expected(self, amounts, bonus_4ps):
+        """Price a scenario one assessment at a time"""
+        by_barangay = {}
+        for assessment in DamageAssessment.objects.filter(disaster=self.disaster).select_related('household'):
+            amount = amounts[assessment.damage_status]
+            if amount and assessment.household.is_4ps:
+                amount += bonus_4ps
+            barangay = by_barangay.setdefault(assessment.household.barangay, {'count': 0, 'budget': 0})
+            barangay['count'] += amount > 0
+            barangay['budget'] += amount
+        return by_barangay
+
+    def test_scenarios_match_a_row_by_row_pricing(self):
+        scenarios = [
+            {'name': 'Current rule'},
+            {'name': 'Partial 7k, 4Ps +2k', 'amounts': {'PARTIAL': 7000}, 'bonus_4ps': 2000},
+            {'amounts': {'TOTAL': 9000, 'PARTIAL': 0, 'NONE': 1000}, 'bonus_4ps': 500},
+        ]
+        response = self.simulate(scenarios)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_households'], 15)
+        self.assertEqual(data['current']['total_budget'], 5 * 10000 + 7 * 5000)
+
+        current, partial, third = data['scenarios']
+        self.assertEqual(current['change_from_current'], 0)
+        self.assertEqual(current['households_paid'], 12)
+        self.assertEqual(partial['amounts'], {'TOTAL': 10000, 'PARTIAL': 7000, 'NONE': 0})
+        self.assertEqual(third['name'], 'Scenario 3')
+        for result in data['scenarios']:
+            expected = self.expected(result['amounts'], result['bonus_4ps'])
+            self.assertEqual(result['by_barangay'], expected)
+            self.assertEqual(result['total_budget'], sum(b['budget'] for b in expected.values()))
+            self.assertEqual(result['change_from_current'], result['total_budget'] - data['current']['total_budget'])
+
+    def test_counts_come_from_the_budget_rollup(self):
+        with self.assertNumQueries(1):
+            simulator = PayoutSimulator(self.disaster.pk)
+        self.assertEqual(simulator.households, 15)
+        self.assertEqual(simulator.barangays, ['Baseco', 'Navotas', 'Tondo'])
+        self.assertEqual(int(simulator.counts[:, :, 1].sum()), 8)  # Even-numbered households are 4Ps
+
+    def test_left_out_amounts_follow_the_rule_set_in_force(self):
+        PayoutRuleSet.objects.create(disaster=self.disaster, version=1, total_amount=8000, partial_amount=6000)
+        recompute(self.disaster.pk)
+        data = self.simulate([{'name': 'Current rule'}]).json()
+        self.assertEqual(data['scenarios'][0]['amounts'], {'TOTAL': 8000, 'PARTIAL': 6000, 'NONE': 0})
+        self.assertEqual(data['current']['total_budget'], 5 * 8000 + 7 * 6000)
+        self.assertEqual(data['scenarios'][0]['change_from_current'], 0)
+
+    def test_empty_disaster(self):
+        empty = DisasterEvent.objects.create(name='Quiet Typhoon', date_occurred='2025-12-01')
+        data = self.simulate([{'name': 'Any'}], empty.pk).json()
+        self.assertEqual(data['scenarios'][0]['total_budget'], 0)
+        self.assertEqual(data['scenarios'][0]['by_barangay'], {})
+
+    def test_errors(self):
+        cases = [
+            ([], 'scenarios must be a non-empty list'),
+            ([{'amounts': {'SEVERE': 1}}], "Scenario 1: unknown damage status 'SEVERE'"),
+            ([{'name': 'Bad', 'amounts': {'PARTIAL': -5}}], 'Bad: PARTIAL amount must be between 0'),
+            ([{'name': 'Rich', 'amounts': {'TOTAL': 12000}}], 'Rich: TOTAL amount must be between 0 and 10000'),
+            ([{'name': 'Cents', 'bonus_4ps': 10.5}], 'Cents: bonus_4ps must be a whole number'),
+            ([{'name': 'Text', 'amounts': {'TOTAL': '10000'}}], 'Text: TOTAL amount must be a whole number'),
+        ]
+        for scenarios, message in cases:
+            response = self.simulate(scenarios)
+            self.assertEqual(response.status_code, 400, scenarios)
+            self.assertIn(message, response.json()['error'])
+        self.assertEqual(self.simulate([{}], 999).status_code, 404)
+        self.assertEqual(self.client.post(reverse('budget_simulate'), {}).status_code, 400)
+
+
+class ExportCsvTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 5, status=DamageAssessment.DamageStatus.TOTAL)
+        self.households += make_households(self.disaster, 4, start=5)
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        make_households(other, 2, start=9)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_csv'), {'disaster_id': self.disaster.pk, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def expected_rows(self):
+        """The export as the previous per-instance writer produced it"""
+        rows = [HEADER]
+        for assessment in DamageAssessment.objects.filter(disaster=self.disaster).select_related('household').order_by('pk'):
+            household = assessment.household
+            rows.append([
+                household.household_id or '', household.name, household.address, household.barangay,
+                str(float(household.latitude)), str(float(household.longitude)), assessment.damage_status,
+                str(int(float(assessment.recommended_ect_amount))), str(household.flood_depth),
+                str(household.house_height), str(household.house_width), 'Yes' if household.is_4ps else 'No',
+            ])
+        return rows
+
+    def test_export_matches_the_assessments(self):
+        Household.objects.filter(pk=self.households[0].pk).update(address='12 Rizal Ave, "Unit 3", Tondo')
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('bantayayuda_export_Typhoon_Test.csv', response['Content-Disposition'])
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode()))), self.expected_rows())
+
+    def test_gzip(self):
+        plain = self.export()[1]
+        response, content = self.export(gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(content), plain)
+
+    def test_rows_are_streamed_in_chunks(self):
+        chunks = list(stream_csv(export_rows(self.disaster.pk), chunk_size=4))
+        self.assertEqual(len(chunks), 4)  # Header, 4 + 4 + 1 rows
+        self.assertEqual(chunks[0].decode().strip().split(','), HEADER)
+        self.assertEqual(b''.join(chunks), self.export()[1])
+
+    def test_export_reads_one_query(self):
+        response = self.client.get(reverse('export_csv'), {'disaster_id': self.disaster.pk})
+        with self.assertNumQueries(1):
+            b''.join(response.streaming_content)
+
+
+class ParquetExportTests(TestCase):
+    def setUp(self):
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(self.disaster, 4, status=DamageAssessment.DamageStatus.TOTAL)
+        make_households(self.disaster, 5, start=4)
+        self.other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        make_households(self.other, 2, start=9, status=DamageAssessment.DamageStatus.NONE)
+        self.predicted = DamageAssessment.objects.filter(disaster=self.disaster).order_by('pk').first()
+        EctPrediction.objects.create(
+            assessment=self.predicted, feature_hash='abc', model_version='v7', ect_amount=5000,
+            probabilities={'0': 0.1, '5000': 0.7, '10000': 0.2},
+        )
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_parquet'), {'disaster_id': self.disaster.pk, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, io.BytesIO(b''.join(response.streaming_content))
+
+    def test_parquet_has_dtypes(self):
+        import pandas as pd
+
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        self.assertIn('bantayayuda_export_Typhoon_Test.parquet', response['Content-Disposition'])
+        frame = pd.read_parquet(content)
+        self.assertEqual(len(frame), 9)
+        for column in ('disaster', 'barangay', 'damage_status', 'model_version'):
+            self.assertEqual(frame[column].dtype, 'category', column)
+        self.assertEqual(list(frame['damage_status'].cat.categories), ['NONE', 'PARTIAL', 'TOTAL'])
+        self.assertEqual(frame['ect_amount'].dtype, 'int32')
+        self.assertEqual(frame['flood_depth'].dtype, 'float64')
+        self.assertEqual(frame['is_4ps'].dtype, 'bool')
+
+        expected = DamageAssessment.objects.filter(disaster=self.disaster).select_related('household').order_by('pk')
+        self.assertEqual(list(frame['household_id']), [a.household.household_id for a in expected])
+        self.assertEqual(list(frame['barangay']), [a.household.barangay for a in expected])
+        self.assertEqual(list(frame['ect_amount']), [int(a.recommended_ect_amount) for a in expected])
+        self.assertEqual(list(frame['latitude']), [float(a.household.latitude) for a in expected])
+        self.assertEqual(frame['assessed_at'][0], pd.Timestamp(expected[0].assessed_at))
+
+        # Stored predictions; the other rows are null
+        self.assertEqual(frame['predicted_ect_amount'][0], 5000)
+        self.assertEqual(frame['prediction_confidence'][0], 0.7)
+        self.assertEqual(frame['model_version'][0], 'v7')
+        self.assertEqual(frame['predicted_ect_amount'].isna().sum(), 8)
+
+    def test_record_batches_and_column_pruning(self):
+        import pyarrow.parquet as pq
+
+        content = io.BytesIO(b''.join(stream_export([self.disaster.pk], batch_size=4)))
+        parquet = pq.ParquetFile(content)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)  # 4 + 4 + 1 rows
+        table = parquet.read(columns=['barangay', 'ect_amount'])
+        self.assertEqual(table.column_names, ['barangay', 'ect_amount'])
+        self.assertEqual(sum(table.column('ect_amount').to_pylist()), 4 * 10000 + 5 * 5000)
+
+    def test_feather_matches_parquet(self):
+        import pandas as pd
+
+        response, content = self.export(output='feather')
+        self.assertIn('.feather"', response['Content-Disposition'])
+        feather = pd.read_feather(content)
+        pd.testing.assert_frame_equal(feather, pd.read_parquet(self.export()[1]))
+
+    def test_values_written_while_streaming_are_kept(self):
+        import pandas as pd
+
+        for output in ('parquet', 'feather'):
+            Household.objects.filter(household_id='HH-00008').update(barangay='Tondo')
+            EctPrediction.objects.exclude(assessment=self.predicted).delete()
+            chunks = stream_export([self.disaster.pk], file_format=output, batch_size=4)
+            content = [next(chunks)]  # Dictionaries read, first batch written
+            Household.objects.filter(household_id='HH-00008').update(barangay='Bagong Silang')
+            EctPrediction.objects.create(
+                assessment=DamageAssessment.objects.get(household__household_id='HH-00008'),
+                feature_hash='def', model_version='v8', ect_amount=0, probabilities={'0': 1.0},
+            )
+            content.extend(chunks)
+
+            read = pd.read_feather if output == 'feather' else pd.read_parquet
+            frame = read(io.BytesIO(b''.join(content))).set_index('household_id')
+            self.assertEqual(frame.loc['HH-00008', 'barangay'], 'Bagong Silang', output)
+            self.assertEqual(frame.loc['HH-00008', 'model_version'], 'v8', output)
+            self.assertEqual(frame.loc['HH-00000', 'model_version'], 'v7', output)
+            self.assertEqual(frame['barangay'].isna().sum(), 0, output)
+
+    def test_unknown_damage_status_fails(self):
+        DamageAssessment.objects.filter(pk=self.predicted.pk).update(damage_status='SEVERE')
+        with self.assertRaises(ValueError):
+            b''.join(stream_export([self.disaster.pk]))
+
+    def test_multiple_disasters(self):
+        import pandas as pd
+
+        response = self.client.get(reverse('export_parquet'), {'disaster_id': f'{self.disaster.pk},{self.other.pk}'})
+        self.assertIn('bantayayuda_export_2_disasters.parquet', response['Content-Disposition'])
+        frame = pd.read_parquet(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(frame.groupby('disaster', observed=True).size().to_dict(),
+                         {'Typhoon Test': 9, 'Other Typhoon': 2})
+        self.assertEqual(list(frame['disaster_id'].unique()), sorted([self.disaster.pk, self.other.pk]))
+
+    def test_errors(self):
+        url = reverse('export_parquet')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'disaster_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'disaster_id': self.disaster.pk, 'output': 'xlsx'}).status_code, 400)
+        response = self.client.get(url, {'disaster_id': [self.disaster.pk, 999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('999', response.json()['error'])
+
+
+class DeltaFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.url = reverse('household-geojson')
+        self.households = make_households(self.disaster, 4)
+
+        # Pretend the map was loaded yesterday
+        yesterday = timezone.now() - timedelta(days=1)
+        Household.objects.update(created_at=yesterday, updated_at=yesterday)
+        DamageAssessment.objects.update(updated_at=yesterday)
+        self.since = (yesterday + timedelta(minutes=1)).isoformat()
+
+    def get_delta(self, since=None):
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'since': since or self.since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_response_has_cursor(self):
+        data = self.client.get(self.url, {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(len(data['features']), 4)
+        self.assertLess(parse_cursor(data['cursor']), timezone.now())
+
+    def test_no_changes(self):
+        data = self.get_delta()
+        self.assertEqual(data['features'], [])
+        self.assertEqual(data['deleted'], [])
+        self.assertFalse(data['full'])
+        self.assertIn('cursor', data)
+
+    def test_reports_added_changed_and_deleted(self):
+        assessment = DamageAssessment.objects.get(household=self.households[0])
+        assessment.damage_status = 'TOTAL'
+        assessment.save()
+        self.households[1].name = 'Renamed'
+        self.households[1].save()
+        DamageAssessment.objects.get(household=self.households[2]).delete()
+        deleted_pk = self.households[3].pk
+        self.households[3].delete()
+        added, = make_households(self.disaster, 1, start=10)
+
+        data = self.get_delta()
+        changes = {f['properties']['id']: f['properties'] for f in data['features']}
+        self.assertEqual(set(changes), {self.households[0].pk, self.households[1].pk, self.households[2].pk, added.pk})
+        self.assertEqual(changes[self.households[0].pk]['damage_status'], 'TOTAL')
+        self.assertEqual(changes[self.households[0].pk]['change'], 'changed')
+        self.assertEqual(changes[self.households[1].pk]['name'], 'Renamed')
+        self.assertEqual(changes[self.households[2].pk]['damage_status'], 'NONE')
+        self.assertEqual(changes[added.pk]['change'], 'added')
+        self.assertEqual(data['deleted'], [deleted_pk])
+
+    def test_other_disasters_changes_are_ignored(self):
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-10-01')
+        DamageAssessment.objects.create(household=self.households[0], disaster=other, damage_status='TOTAL')
+        self.assertEqual(self.get_delta()['features'], [])
+
+    def test_accepts_epoch_seconds(self):
+        self.households[1].save()
+        since = (timezone.now() - timedelta(hours=1)).timestamp()
+        self.assertEqual(len(self.get_delta(str(since))['features']), 1)
+
+    def test_expired_cursor_gets_full_resync(self):
+        data = self.get_delta((timezone.now() - timedelta(days=30)).isoformat())
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['features']), 4)
+
+    def test_invalid_since(self):
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnarFormatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.url = reverse('household-geojson')
+        self.households = make_households(self.disaster, 3)
+        DamageAssessment.objects.filter(household=self.households[0]).update(
+            damage_status='TOTAL', recommended_ect_amount=10000,
+        )
+
+    def test_format_query_param(self):
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'format': 'columnar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], MEDIA_TYPE)
+
+        columns = decode_columnar(response.content)
+        geojson = self.client.get(self.url, {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(columns['id'], [f['properties']['id'] for f in geojson['features']])
+        self.assertEqual(columns['damage_status'], [f['properties']['damage_status'] for f in geojson['features']])
+        self.assertEqual(columns['ect_amount'], [f['properties']['ect_amount'] for f in geojson['features']])
+        self.assertEqual(
+            list(zip(columns['lon'], columns['lat'])),
+            [tuple(f['geometry']['coordinates']) for f in geojson['features']],
+        )
+
+    def test_accept_header(self):
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk}, HTTP_ACCEPT=MEDIA_TYPE)
+        self.assertEqual(response['Content-Type'], MEDIA_TYPE)
+        self.assertEqual(len(decode_columnar(response.content)['id']), 3)
+        # Same URL without the header still gets GeoJSON
+        response = self.client.get(self.url, {'disaster_id': self.disaster.pk})
+        self.assertEqual(response.json()['type'], 'FeatureCollection')
+
+    def test_payload_is_smaller_than_geojson(self):
+        make_households(self.disaster, 50, start=3)
+        columnar = self.client.get(self.url, {'disaster_id': self.disaster.pk, 'format': 'columnar'})
+        geojson = self.client.get(self.url, {'disaster_id': self.disaster.pk})
+        self.assertEqual(len(columnar.content), 8 + 17 * 53)
+        self.assertLess(len(columnar.content) * 10, len(geojson.content))
+
+    def test_errors_are_json(self):
+        response = self.client.get(self.url, {'format': 'columnar'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'disaster_id parameter is required'})
+
+    def test_popup_is_loaded_per_household(self):
+        household = self.households[0]
+        url = reverse('household-popup', args=[household.pk])
+        data = self.client.get(url, {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(data['name'], household.name)
+        self.assertEqual(data['damage_status'], 'TOTAL')
+        self.assertIn(household.name, data['popup_content'])
+        self.assertEqual(self.client.get(reverse('household-popup', args=[999]), {'disaster_id': self.disaster.pk}).status_code, 404)
+
+
+class BatchPredictionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 6)
+        for household, depth in zip(self.households, [0.1, 0.5, 1.5, 2.5, 3.5, 4.5]):
+            Household.objects.filter(pk=household.pk).update(flood_depth=depth)
+
+    def test_batch_matches_single_predictions(self):
+        assessments = DamageAssessment.objects.filter(disaster=self.disaster).order_by('household__name')
+        batch = ml_engine.predict_ect_batch(assessments)
+        self.assertEqual(len(batch), 6)
+        for amount in batch:
+            self.assertIn(amount, (0, 5000, 10000))
+
+        for assessment, amount in zip(assessments, batch):
+            household = Household.objects.get(pk=assessment.household_id)
+            self.assertEqual(ml_engine.predict_ect(household, assessment), amount)
+            self.assertEqual(ml_engine.predict_ect(household, assessment.damage_status), amount)
+
+    def test_predict_ect_uses_the_given_disasters_assessment(self):
+        household = Household.objects.get(pk=self.households[4].pk)
+        other = DisasterEvent.objects.create(name='Later Typhoon', date_occurred='2025-12-01')
+        DamageAssessment.objects.create(household=household, disaster=other, damage_status='NONE')
+        assessment = DamageAssessment.objects.get(household=household, disaster=self.disaster)
+
+        with self.assertNumQueries(0):
+            amount = ml_engine.predict_ect(household, assessment)
+        self.assertEqual(amount, ml_engine.predict_ect_batch([{
+            'barangay': household.barangay, 'latitude': household.latitude,
+            'longitude': household.longitude, 'flood_depth': household.flood_depth,
+            'house_height': household.house_height, 'house_width': household.house_width,
+            'damage_status': 'PARTIAL', 'is_4ps': household.is_4ps,
+        }])[0])
+
+    def test_batch_uses_one_model_call(self):
+        with mock.patch.object(ml_engine.get_model().compiled, 'predict_proba', wraps=ml_engine.get_model().compiled.predict_proba) as predict:
+            ml_engine.predict_ect_batch(DamageAssessment.objects.filter(disaster=self.disaster))
+        self.assertEqual(predict.call_count, 1)
+
+    def test_empty_batch(self):
+        self.assertEqual(ml_engine.predict_ect_batch(DamageAssessment.objects.none()), [])
+
+    def test_missing_model_falls_back_to_none(self):
+        with mock.patch.object(ml_engine, 'get_model', return_value=None):
+            self.assertEqual(ml_engine.predict_ect_batch(DamageAssessment.objects.all()), [None] * 6)
+
+    def test_flood_height_ratio_is_capped(self):
+        df = ml_engine.build_feature_frame([
+            {'barangay': 'Tondo', 'latitude': 14.6, 'longitude': 120.9, 'flood_depth': 2.0,
+             'house_height': 4.0, 'house_width': 8.0, 'damage_status': 'PARTIAL', 'is_4ps': True},
+            {'barangay': 'Tondo', 'latitude': 14.6, 'longitude': 120.9, 'flood_depth': 6.0,
+             'house_height': 4.0, 'house_width': 8.0, 'damage_status': 'TOTAL', 'is_4ps': False},
+        ])
+        self.assertEqual(df['Flood_Height_Ratio'].tolist(), [0.5, 1.0])
+        self.assertEqual(df['Is_4Ps_Recipient'].tolist(), [1, 0])
+
+    def test_ml_predict_view_query_count_is_constant(self):
+        # disaster lookup + joined feature/prediction read + one upsert
+        url = reverse('ml_predict')
+        with self.assertNumQueries(3):
+            self.client.get(url, {'disaster_id': self.disaster.pk})
+
+        other = DisasterEvent.objects.create(name='Bigger Typhoon', date_occurred='2025-12-01')
+        make_households(other, 30, start=100)
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'disaster_id': other.pk})
+        self.assertEqual(len(response.json()), 30)
+
+    def test_ml_predict_view(self):
+        response = self.client.get(reverse('ml_predict'), {'disaster_id': self.disaster.pk})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(len(results), 6)
+        self.assertEqual({r['household_id'] for r in results}, {h.household_id for h in self.households})
+        for result in results:
+            self.assertIn(result['ect_amount'], (0, 5000, 10000))
+            self.assertTrue(result['sms'].startswith('DSWD'))
+
+
+class PredictionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 5)
+        self.assessments = DamageAssessment.objects.filter(disaster=self.disaster)
+
+    def predict(self):
+        with mock.patch.object(ml_engine.get_model().compiled, 'predict_proba', wraps=ml_engine.get_model().compiled.predict_proba) as predict:
+            rows = predict_assessments(self.assessments.order_by('id'))
+        return rows, predict
+
+    def test_predictions_are_stored(self):
+        rows, _ = self.predict()
+        self.assertEqual(EctPrediction.objects.count(), 5)
+        stored = EctPrediction.objects.get(assessment_id=rows[0]['id'])
+        self.assertEqual(stored.ect_amount, rows[0]['ect_amount'])
+        self.assertEqual(stored.model_version, ml_engine.current_model_version())
+        self.assertAlmostEqual(sum(stored.probabilities.values()), 1.0, places=5)
+        self.assertEqual(rows[0]['model_version'], ml_engine.current_model_version())
+
+    def test_repeat_call_skips_the_model(self):
+        first, _ = self.predict()
+        with self.assertNumQueries(1), mock.patch.object(registry, 'current') as current:
+            second = predict_assessments(self.assessments.order_by('id'))
+        current.assert_not_called()  # Not even loaded
+        self.assertEqual([r['ect_amount'] for r in first], [r['ect_amount'] for r in second])
+
+    def test_changed_features_repredict_only_that_row(self):
+        self.predict()
+        changed = self.assessments.order_by('id').first()
+        changed.damage_status = 'TOTAL'
+        changed.save()
+
+        _, predict = self.predict()
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual(len(predict.call_args.args[0]['Latitude']), 1)
+
+    def test_model_change_repredicts_everything(self):
+        self.predict()
+        with mock.patch.object(ml_engine.get_model(), 'version', 'retrained'), \
+                mock.patch.object(registry, 'active_version', return_value='retrained'):
+            rows, predict = self.predict()
+        self.assertEqual(len(predict.call_args.args[0]['Latitude']), 5)
+        self.assertEqual({r['model_version'] for r in rows}, {'retrained'})
+        self.assertEqual(set(EctPrediction.objects.values_list('model_version', flat=True)), {'retrained'})
+
+    def test_missing_model_stores_nothing(self):
+        with mock.patch.object(ml_engine, 'get_model', return_value=None):
+            rows = predict_assessments(self.assessments)
+        self.assertEqual([r['ect_amount'] for r in rows], [None] * 5)
+        self.assertFalse(EctPrediction.objects.exists())
+
+
+class PredictionJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(self.disaster, 7)
+
+    def start(self, disaster=None):
+        with mock.patch('api.jobs.submit_job') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('prediction_jobs'),
+                    {'disaster_id': (disaster or self.disaster).pk},
+                    content_type='application/json',
+                )
+        return response, submit
+
+    def test_start_returns_pending_job_and_queues_it(self):
+        response, submit = self.start()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'PENDING')
+        self.assertEqual(job['total'], 7)
+        self.assertEqual(job['percent_done'], 0.0)
+        submit.assert_called_once_with(job['id'])
+
+    def test_one_active_job_per_disaster(self):
+        first = self.start()[0].json()
+        response, submit = self.start()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], first['id'])
+        submit.assert_not_called()
+
+        other = DisasterEvent.objects.create(name='Other Typhoon', date_occurred='2025-12-01')
+        self.assertEqual(self.start(other)[0].status_code, 202)
+
+    def test_run_job_records_progress_and_results(self):
+        job_id = self.start()[0].json()['id']
+        with mock.patch('api.jobs.JOB_CHUNK_SIZE', 3):
+            self.assertTrue(run_job(job_id))
+        self.assertFalse(run_job(job_id))  # Already claimed
+
+        progress = self.client.get(reverse('prediction_job_detail', args=[job_id])).json()
+        self.assertEqual(progress['status'], 'COMPLETED')
+        self.assertEqual(progress['processed'], 7)
+        self.assertEqual(progress['percent_done'], 100.0)
+        self.assertIsNotNone(progress['finished_at'])
+
+        url = reverse('prediction_job_results', args=[job_id])
+        page = self.client.get(url, {'page_size': 5}).json()
+        self.assertEqual(page['count'], 7)
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(page['status'], 'COMPLETED')
+        rows = page['results'] + self.client.get(url, {'page_size': 5, 'page': 2}).json()['results']
+
+        expected = self.client.get(reverse('ml_predict'), {'disaster_id': self.disaster.pk}).json()
+        key = lambda row: row['household_id']
+        self.assertEqual(sorted(rows, key=key), sorted(expected, key=key))
+
+    def test_failed_job_reports_error(self):
+        job_id = self.start()[0].json()['id']
+        with mock.patch('api.jobs.prediction_results', side_effect=RuntimeError('model exploded')):
+            run_job(job_id)
+        job = PredictionJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, PredictionJob.Status.FAILED)
+        self.assertEqual(job.error, 'model exploded')
+
+    def test_stale_running_job_is_failed_and_replaced(self):
+        job_id = self.start()[0].json()['id']
+        PredictionJob.objects.filter(pk=job_id).update(
+            status=PredictionJob.Status.RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+        response, submit = self.start()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['id'], job_id)
+        job = PredictionJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, PredictionJob.Status.FAILED)
+        self.assertIn('no heartbeat', job.error)
+
+        # Workers fail stale jobs as they poll
+        PredictionJob.objects.filter(pk=response.json()['id']).update(
+            status=PredictionJob.Status.RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+        call_command('run_prediction_workers', '--once', stdout=io.StringIO())
+        self.assertFalse(PredictionJob.objects.filter(status=PredictionJob.Status.RUNNING).exists())
+
+    def test_worker_of_a_failed_stale_job_stops(self):
+        job_id = self.start()[0].json()['id']
+
+        def lose_the_job(queryset):
+            # Another process decides this worker is gone while it predicts
+            PredictionJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+            fail_stale_jobs()
+            return prediction_results(queryset)
+
+        with mock.patch('api.jobs.prediction_results', side_effect=lose_the_job):
+            self.assertTrue(run_job(job_id))
+        job = PredictionJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, PredictionJob.Status.FAILED)
+        self.assertFalse(job.results.exists())
+
+    def test_one_active_job_is_enforced_by_the_database(self):
+        job = self.start()[0].json()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PredictionJob.objects.create(disaster=self.disaster)
+
+        # A request that lost the race gets the job the other one created
+        with mock.patch('api.jobs._active_job', side_effect=[None, PredictionJob.objects.get(pk=job['id'])]):
+            found, created = start_job(self.disaster)
+        self.assertEqual((found.pk, created), (job['id'], False))
+
+    def test_errors(self):
+        self.assertEqual(self.client.post(reverse('prediction_jobs'), {}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('prediction_jobs'), {'disaster_id': 999}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('prediction_job_detail', args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('prediction_job_results', args=[999])).status_code, 404)
+
+
+class TreeEvaluatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import numpy as np
+        from generate_synthetic_data import generate_synthetic_data
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = generate_synthetic_data(3000)
+        rng = np.random.default_rng(7)
+        df['Latitude'] = rng.uniform(14.50, 14.70, len(df))
+        df['Longitude'] = rng.uniform(120.90, 121.10, len(df))
+        df.loc[::50, 'Barangay_ID'] = 'Malabon'  # Category the model never saw
+        cls.frame = df
+
+    def assert_parity(self, frame):
+        import numpy as np
+        from catboost import Pool
+
+        model = ml_engine.get_model().model
+        X = frame[model.feature_names_]
+        pool = Pool(X, cat_features=model.get_cat_feature_indices())
+        compiled = compile_catboost(model)
+        np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(pool), atol=1e-9)
+        np.testing.assert_array_equal(compiled.predict(X), np.asarray(model.predict(pool)).reshape(-1))
+
+    def test_parity_with_catboost_on_synthetic_data(self):
+        self.assert_parity(self.frame)
+
+    def test_parity_with_training_labels(self):
+        frame = self.frame.copy()
+        frame['Damage_Classification'] = frame['Damage_Classification'].map(ml_engine.DAMAGE_LABELS)
+        self.assert_parity(frame)
+
+    def test_category_memo_is_thread_safe(self):
+        import numpy as np
+
+        model = ml_engine.get_model().model
+        compiled = compile_catboost(model)
+        frames = []
+        for i in range(8):
+            frame = self.frame.iloc[i * 300:(i + 1) * 300].copy()
+            frame['Barangay_ID'] = [f'Barangay {i}-{j % 40}' for j in range(len(frame))]
+            frames.append(frame[model.feature_names_])
+        expected = [compiled.predict_proba(frame) for frame in frames]
+
+        # A tiny memo is cleared all the time while other threads read it
+        results = [None] * len(frames)
+        with mock.patch('api.tree_eval.CATEGORY_CACHE_SIZE', 50):
+            def predict(i):
+                for _ in range(5):
+                    results[i] = compiled.predict_proba(frames[i])
+
+            threads = [threading.Thread(target=predict, args=(i,)) for i in range(len(frames))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for result, proba in zip(results, expected):
+            np.testing.assert_allclose(result, proba)
+
+    def test_categorical_hashing_matches_catboost(self):
+        import pandas as pd
+        from catboost import CatBoostClassifier
+
+        # Lengths covering every CityHash64 branch
+        values = ['1', 'abc', 'TOTAL', 'Not Damaged', 'Partially Damaged', 'x' * 31, 'Barangay ' * 5, 'Navotas City ' * 9]
+        frame = pd.DataFrame({'category': values * 20, 'number': range(len(values) * 20)})
+        labels = [i % 2 for i in range(len(frame))]
+        model = CatBoostClassifier(iterations=2, depth=2, one_hot_max_size=1, verbose=0, allow_writing_files=False)
+        model.fit(frame, labels, cat_features=[0])
+
+        compiled = compile_catboost(model)
+        for value in values:
+            self.assertTrue(compiled.knows_category('category', value), value)
+        self.assertFalse(compiled.knows_category('category', 'unseen'))
+
+    def test_ml_engine_uses_compiled_model_with_training_labels(self):
+        self.assertIsNotNone(ml_engine.get_model().compiled)
+        self.assertEqual(ml_engine.get_model().damage_labels, ml_engine.DAMAGE_LABELS)
+
+        row = {'barangay': 'Tondo', 'latitude': 14.6, 'longitude': 120.97, 'flood_depth': 0.2,
+               'house_height': 4.0, 'house_width': 8.0, 'is_4ps': False}
+        with mock.patch('catboost.Pool') as pool:
+            amounts = ml_engine.predict_ect_batch([
+                dict(row, damage_status='NONE'), dict(row, damage_status='TOTAL', flood_depth=4.0),
+            ])
+        pool.assert_not_called()
+        self.assertEqual(amounts, [0, 10000])
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.legacy = os.path.join(self.root, 'legacy.cbm')
+        with open(self.legacy, 'wb') as f:
+            f.write(b'legacy model')
+        self.loads = []
+
+    def loader(self, path, version, metadata):
+        self.loads.append(version)
+        return LoadedModel(version, path, model=object(), metadata=metadata)
+
+    def make_registry(self, loader=None):
+        return ModelRegistry(
+            os.path.join(self.root, 'models'), [self.legacy], loader or self.loader, check_interval=0,
+        )
+
+    def make_model_file(self, content):
+        path = os.path.join(self.root, f'{len(os.listdir(self.root))}.cbm')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_loads_lazily_and_serves_legacy_file_without_registry(self):
+        reg = self.make_registry()
+        self.assertEqual(self.loads, [])
+        loaded = reg.current()
+        self.assertTrue(loaded.version.startswith('legacy-'))
+        self.assertIs(reg.current(), loaded)
+        self.assertEqual(len(self.loads), 1)
+
+    def test_register_and_promote(self):
+        reg = self.make_registry()
+        version = reg.register(self.make_model_file(b'v2'), notes='retrained', metadata={'classes': ['0']})
+        self.assertEqual(reg.metadata(version)['notes'], 'retrained')
+        self.assertEqual([meta['version'] for meta in reg.versions()], [version])
+        self.assertIsNone(reg.promoted_version())
+
+        reg.promote(version)
+        self.assertEqual(reg.promoted_version(), version)
+        self.assertEqual(reg.current().version, version)
+        with self.assertRaises(ValueError):
+            reg.promote('no-such-version')
+
+    def test_promoted_model_is_swapped_in_without_blocking(self):
+        release = threading.Event()
+
+        def slow_loader(path, version, metadata):
+            if self.loads:  # The first (cold) load is synchronous
+                release.wait(5)
+            return self.loader(path, version, metadata)
+
+        reg = self.make_registry(slow_loader)
+        old = reg.current()
+        version = reg.register(self.make_model_file(b'v2'))
+        reg.promote(version)
+
+        # The new version loads in the background; the old one keeps serving
+        self.assertIs(reg.current(), old)
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == f'model-load-{version}':
+                thread.join(5)
+        self.assertEqual(reg.current().version, version)
+
+    def test_broken_model_keeps_previous_version(self):
+        def loader(path, version, metadata):
+            if not version.startswith('legacy-'):
+                raise ValueError('corrupt model')
+            return self.loader(path, version, metadata)
+
+        reg = self.make_registry(loader)
+        old = reg.reload()
+        reg.promote(reg.register(self.make_model_file(b'broken')))
+        with self.assertLogs('api.model_registry', 'ERROR'):
+            self.assertIsNone(reg.reload())
+        self.assertIs(reg.current(), old)
+
+    def test_real_model_file(self):
+        from api.ml_engine import load_model_file
+
+        source = registry.legacy_paths[0]
+        reg = self.make_registry(load_model_file)
+        reg.promote(reg.register(source))
+        loaded = reg.current()
+        self.assertIsNotNone(loaded.compiled)
+        self.assertEqual([int(c) for c in loaded.model.classes_], [0, 5000, 10000])
+
+    def test_prediction_responses_report_the_model_version(self):
+        disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(disaster, 2)
+        version = ml_engine.current_model_version()
+
+        response = self.client.get(reverse('ml_predict'), {'disaster_id': disaster.pk})
+        self.assertEqual(response['X-Model-Version'], version)
+        self.assertEqual({row['model_version'] for row in response.json()}, {version})
+        cached = self.client.get(reverse('ml_predict'), {'disaster_id': disaster.pk})
+        self.assertEqual(cached['X-Model-Version'], version)
+
+        # Promoting a model changes the cache key
+        with mock.patch.object(registry, 'active_version', return_value='promoted'):
+            self.assertNotEqual(
+                self.client.get(reverse('ml_predict'), {'disaster_id': disaster.pk})['ETag'],
+                cached['ETag'],
+            )
+
+        model = self.client.get(reverse('ml_model')).json()
+        self.assertEqual(model['version'], version)
+        self.assertTrue(model['numpy_evaluator'])
+
+
+class ModelServerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 4)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.address = 'unix:' + os.path.join(self.root, 'model.sock')
+
+    def start_server(self, predict, **kwargs):
+        server = ModelServer(self.address, predict=predict, info=lambda: {'version': 'remote'}, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            with override_settings(ML_MODEL_SERVER=self.address):
+                get_client().close()
+        self.addCleanup(stop)
+        return server
+
+    def fake_predict(self, rows):
+        return 'remote', [{'ect_amount': 5000, 'probabilities': {'5000': 1.0}} for _ in rows]
+
+    def test_batcher_merges_concurrent_requests(self):
+        calls = []
+
+        def predict(rows):
+            calls.append(list(rows))
+            return 'v1', [row * 10 for row in rows]
+
+        batcher = MicroBatcher(predict, max_batch_rows=6, max_wait=5)
+        futures = [batcher.submit([1, 2]), batcher.submit([3]), batcher.submit([4, 5, 6])]
+        self.assertEqual([future.result(5) for future in futures], [
+            ('v1', [10, 20]), ('v1', [30]), ('v1', [40, 50, 60]),
+        ])
+        batcher.stop()
+        self.assertEqual(calls, [[1, 2, 3, 4, 5, 6]])
+        self.assertEqual((batcher.batches, batcher.requests), (1, 3))
+
+    def test_predictions_are_routed_to_the_server(self):
+        server = self.start_server(self.fake_predict, max_batch_rows=4, max_wait=5)
+        with override_settings(ML_MODEL_SERVER=self.address), \
+                mock.patch.object(ml_engine, 'get_model', side_effect=AssertionError('loaded in-process')):
+            # Four concurrent single-row requests end up in one model call
+            results = [None] * 4
+            threads = [
+                threading.Thread(target=lambda i=i: results.__setitem__(
+                    i, ml_engine.predict_ect(self.households[i], 'TOTAL'),
+                ))
+                for i in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+            self.assertEqual(results, [5000] * 4)
+            self.assertEqual((server.batcher.batches, server.batcher.requests), (1, 4))
+
+            self.assertEqual(ml_engine.current_model_version(), 'remote')
+            response = self.client.get(reverse('ml_predict'), {'disaster_id': self.disaster.pk})
+            self.assertEqual(response['X-Model-Version'], 'remote')
+            self.assertEqual({row['ect_amount'] for row in response.json()}, {5000})
+            self.assertEqual(self.client.get(reverse('ml_model')).json()['served_by'], 'model-server')
+
+    def test_real_model_through_server_matches_in_process(self):
+        self.start_server(ml_engine.predict_in_process)
+        assessments = DamageAssessment.objects.filter(disaster=self.disaster).order_by('pk')
+        expected = ml_engine.predict_ect_details(assessments)
+        with override_settings(ML_MODEL_SERVER=self.address):
+            self.assertEqual(ml_engine.predict_ect_details(assessments), expected)
+
+    def test_falls_back_to_in_process_when_server_is_down(self):
+        household = self.households[0]
+        expected = ml_engine.predict_ect(household, 'TOTAL')
+        with override_settings(ML_MODEL_SERVER=self.address), \
+                self.assertLogs('api.ml_engine', 'WARNING'):
+            self.assertEqual(ml_engine.predict_ect(household, 'TOTAL'), expected)
+            self.assertEqual(self.client.get(reverse('ml_model')).json()['served_by'], 'in-process')
+
+    def test_server_errors_fall_back_to_in_process(self):
+        def broken(rows):
+            raise RuntimeError('model exploded')
+
+        self.start_server(broken)
+        household = self.households[0]
+        expected = ml_engine.predict_ect(household, 'TOTAL')
+        with override_settings(ML_MODEL_SERVER=self.address), \
+                self.assertLogs('api.model_server', 'ERROR'), \
+                self.assertLogs('api.ml_engine', 'WARNING') as logs:
+            self.assertEqual(ml_engine.predict_ect(household, 'TOTAL'), expected)
+        self.assertIn('model exploded', logs.output[0])
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_app_startup_does_not_import_ml_stack(self):
+        # A fresh interpreter: this test process has imported everything already
+        code = (
+            "import sys, django; django.setup(); "
+            "import api.urls, api.admin, api.jobs; "
+            "print(','.join(m for m in ['numpy', 'pandas', 'pyarrow', 'catboost', 'google.generativeai'] if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'BantayAyuda.settings'},
+        )
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Gemini REST endpoint. ``behaviour(barangay)``
+    returns (delay in seconds, HTTP status) for each call.
+    """
+    daemon_threads = True
+
+    def __init__(self, behaviour=lambda barangay: (0, 200)):
+        self.behaviour = behaviour
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.client_ports = set()
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), StubLLMHandler)
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1beta/models/stub:generateContent'
+
+    def handle_error(self, request, client_address):
+        pass  # Clients that timed out hang up before the answer
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like Gemini
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['contents'][0]['parts'][0]['text']
+        household_id = re.search(r'Household ID: (\S+)', prompt)
+        household_id = household_id.group(1) if household_id else 'HH'
+        barangay = re.search(r'Barangay: (.+)', prompt)
+        barangay = barangay.group(1) if barangay else ''
+        with server.lock:
+            server.calls += 1
+            server.client_ports.add(self.client_address[1])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            delay, status_code = server.behaviour(barangay)
+            time.sleep(delay)
+            payload = json.dumps({'candidates': [{'content': {'parts': [
+                {'text': f'Stub SMS para sa {household_id} sa {barangay}. #DSWDMayMalasakit'},
+            ]}}]}).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def sms_messages(count, amount=5000, barangays=None):
+    """``count`` messages, each in its own barangay unless ``barangays`` cycles"""
+    barangays = barangays or [f'Barangay {i}' for i in range(count)]
+    return [
+        {'amount': amount, 'household_id': f'HH-{i:05d}', 'brgy': barangays[i % len(barangays)], 'status': 'PARTIAL'}
+        for i in range(count)
+    ]
+
+
+def stub_sms(message):
+    return f"Stub SMS para sa {message['household_id']} sa {message['brgy']}. #DSWDMayMalasakit"
+
+
+class SmsPipelineTests(TestCase):
+    def setUp(self):
+        template_cache().clear()
+        gemini_breaker.reset()
+
+    def start_stub(self, behaviour=lambda barangay: (0, 200)):
+        server = StubLLMServer(behaviour)
+        self.addCleanup(server.stop)
+        return server
+
+    def pipeline(self, server, **options):
+        return SmsPipeline(url=server.url, api_key='test-key', **{
+            'concurrency': 4, 'rate': 1000, 'burst': 100, 'timeout': 2, 'deadline': 10, **options,
+        })
+
+    def test_calls_run_concurrently_within_the_limit(self):
+        server = self.start_stub(lambda barangay: (0.05, 200))
+        pipeline = self.pipeline(server)
+        messages = sms_messages(20)
+        start = time.monotonic()
+        texts = pipeline.run(messages)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(texts, [stub_sms(message) for message in messages])
+        self.assertEqual(pipeline.stats['llm'], 20)
+        self.assertLessEqual(server.max_in_flight, 4)
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLess(elapsed, 20 * 0.05 * 0.75)  # Well under the serial time
+
+    def test_rate_limit_bounds_throughput(self):
+        server = self.start_stub()
+        pipeline = self.pipeline(server, rate=20, burst=2)
+        start = time.monotonic()
+        pipeline.run(sms_messages(12))
+        # Two calls from the burst, the other ten at 20 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+        self.assertEqual(server.calls, 12)
+
+    def test_timeouts_and_errors_fall_back_to_the_template(self):
+        def behaviour(barangay):
+            return {'Barangay 1': (1.0, 200), 'Barangay 2': (0, 500)}.get(barangay, (0, 200))
+
+        server = self.start_stub(behaviour)
+        pipeline = self.pipeline(server, timeout=0.2)
+        messages = sms_messages(4)
+        with self.assertLogs('api.sms_pipeline', 'WARNING'):
+            texts = pipeline.run(messages)
+
+        self.assertEqual(texts[1], ml_engine.sms_template(**messages[1]))
+        self.assertEqual(texts[2], ml_engine.sms_template(**messages[2]))
+        self.assertEqual(texts[0], stub_sms(messages[0]))
+        self.assertEqual(pipeline.stats, {'llm': 2, 'cached': 0, 'template': 0, 'timeout': 1, 'error': 1})
+
+        # Failures aren't cached: the next run asks again
+        server.behaviour = lambda barangay: (0, 200)
+        retry = self.pipeline(server)
+        self.assertEqual(retry.run(messages), [stub_sms(message) for message in messages])
+        self.assertEqual(retry.stats['cached'], 2)
+        self.assertEqual(retry.llm_calls, 2)
+
+    def test_deadline_falls_back_to_the_template(self):
+        server = self.start_stub()
+        pipeline = self.pipeline(server, rate=5, burst=1, deadline=0.1)
+        with self.assertLogs('api.sms_pipeline', 'WARNING'):
+            texts = pipeline.run(sms_messages(5))
+        self.assertTrue(texts[0].startswith('Stub SMS'))
+        self.assertTrue(all(text.startswith('DSWD-ECT') for text in texts[1:]))
+        self.assertEqual(server.calls, 1)
+
+    def test_template_without_api_key_or_amount(self):
+        server = self.start_stub()
+        messages = sms_messages(2) + sms_messages(1, amount=0)
+        texts = SmsPipeline(url=server.url, api_key='').run(messages)
+        self.assertEqual(texts, [ml_engine.sms_template(**message) for message in messages])
+
+        pipeline = self.pipeline(server)
+        pipeline.run(sms_messages(1, amount=0))
+        self.assertEqual(server.calls, 0)
+        self.assertEqual(pipeline.stats['template'], 1)
+
+    def test_one_llm_call_per_amount_status_and_barangay(self):
+        server = self.start_stub()
+        messages = sms_messages(300, barangays=['Tondo', 'Baseco', 'Navotas'])
+        messages += sms_messages(30, amount=10000, barangays=['Tondo'])
+        pipeline = self.pipeline(server)
+        texts = pipeline.run(messages)
+
+        self.assertEqual(texts, [stub_sms(message) for message in messages])
+        self.assertEqual(server.calls, 4)
+        self.assertEqual(pipeline.stats['llm'], 330)
+
+        # The next batch (another chunk, another request) is served from the cache
+        again = self.pipeline(server)
+        again.run(sms_messages(10, barangays=['Baseco']))
+        self.assertEqual((server.calls, again.llm_calls, again.stats['cached']), (4, 0, 10))
+
+        # A new prompt version makes new templates
+        with mock.patch('api.sms_pipeline.SMS_PROMPT_VERSION', ml_engine.SMS_PROMPT_VERSION + 1):
+            self.pipeline(server).run(sms_messages(10, barangays=['Baseco']))
+        self.assertEqual(server.calls, 5)
+
+    def test_template_without_placeholder_is_rejected(self):
+        server = self.start_stub()
+        with mock.patch('api.sms_pipeline.sms_template_prompt', return_value='Household ID: HH-1\nBarangay: Tondo'):
+            pipeline = self.pipeline(server)
+            with self.assertLogs('api.sms_pipeline', 'WARNING'):
+                texts = pipeline.run(sms_messages(2, barangays=['Tondo']))
+        self.assertEqual(texts, [ml_engine.sms_template(**message) for message in sms_messages(2, barangays=['Tondo'])])
+        self.assertEqual(pipeline.stats['error'], 2)
+        self.assertEqual(template_cache().get(template_key(sms_messages(1, barangays=['Tondo'])[0])), None)
+
+    def test_open_circuit_fails_fast_to_the_template(self):
+        server = self.start_stub(lambda barangay: (0, 503))
+        pipeline = self.pipeline(server, concurrency=1)
+        messages = sms_messages(10)
+        with self.assertLogs('api', 'WARNING'):
+            texts = pipeline.run(messages)
+        self.assertEqual(texts, [ml_engine.sms_template(**message) for message in messages])
+        self.assertEqual(server.calls, gemini_breaker.failure_threshold)
+        self.assertEqual(pipeline.stats['error'], 10)
+
+    def test_token_bucket_allows_burst_then_rate(self):
+        async def acquire(count):
+            bucket = TokenBucket(rate=50, capacity=3)
+            start = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(acquire(3)), 0.02)
+        self.assertGreaterEqual(asyncio.run(acquire(8)), 0.09)  # 5 tokens at 50/s
+
+    def test_generate_sms_logs_gemini_errors(self):
+        gemini = mock.Mock()
+        gemini.GenerativeModel.return_value.generate_content.side_effect = RuntimeError('quota exceeded')
+        with mock.patch.object(ml_engine, 'GEMINI_API_KEY', 'test-key'), \
+                mock.patch.object(ml_engine, '_gemini', return_value=gemini), \
+                self.assertLogs('api.ml_engine', 'WARNING') as logs:
+            text = ml_engine.generate_sms(10000, 'HH-00001', 'Tondo', 'TOTAL')
+        self.assertEqual(text, ml_engine.sms_template(10000, 'HH-00001', 'Tondo', 'TOTAL'))
+        self.assertIn('quota exceeded', logs.output[0])
+
+    def test_pipelines_share_the_rate_limit(self):
+        self.assertIs(SmsPipeline(rate=7, burst=2).bucket, SmsPipeline(rate=7, burst=2).bucket)
+
+        bucket = TokenBucket(rate=50, capacity=2)
+        threads = [threading.Thread(target=asyncio.run, args=(bucket.acquire(),)) for _ in range(6)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.07)  # 4 tokens at 50/s, across event loops
+
+    def test_ml_predict_generates_sms_through_the_pipeline(self):
+        cache.clear()
+        disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        make_households(disaster, 6, status=DamageAssessment.DamageStatus.TOTAL)
+        server = self.start_stub()
+        with override_settings(SMS_LLM_URL=server.url), mock.patch.object(ml_engine, 'GEMINI_API_KEY', 'test-key'):
+            response = self.client.get(reverse('ml_predict'), {'disaster_id': disaster.pk})
+        rows = [row for row in response.json() if row['ect_amount']]
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertEqual(row['sms'], f"Stub SMS para sa {row['household_id']} sa {row['barangay']}. #DSWDMayMalasakit")
+        # At most one call per (amount, barangay)
+        self.assertLessEqual(server.calls, len({(row['ect_amount'], row['barangay']) for row in rows}))
+
+
+class HttpClientTests(TestCase):
+    def setUp(self):
+        gemini_breaker.reset()
+
+    def start_stub(self, behaviour=lambda barangay: (0, 200)):
+        server = StubLLMServer(behaviour)
+        self.addCleanup(server.stop)
+        return server
+
+    def failing_first(self, count, status_code=503):
+        """Stub behaviour: ``count`` calls fail with ``status_code``, then succeed"""
+        calls = []
+
+        def behaviour(barangay):
+            calls.append(barangay)
+            return (0, status_code) if len(calls) <= count else (0, 200)
+        return behaviour
+
+    def pooled_client(self, **options):
+        return PooledClient(**{'retries': 2, 'backoff': 0.001, 'breaker': CircuitBreaker(), **options})
+
+    def post(self, client, server):
+        return client.post_json(server.url, {'contents': [{'parts': [{'text': 'Kumusta'}]}]}, params={'key': 'test-key'})
+
+    def test_retries_transient_errors_on_pooled_connections(self):
+        server = self.start_stub(self.failing_first(2))
+        client = self.pooled_client()
+        self.assertEqual(gemini_text(self.post(client, server)), 'Stub SMS para sa HH sa . #DSWDMayMalasakit')
+        self.assertEqual(server.calls, 3)
+        for _ in range(3):
+            self.post(client, server)
+        self.assertEqual(len(server.client_ports), 1)  # One kept-alive connection
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_read_timeout_is_bounded(self):
+        server = self.start_stub(lambda barangay: (0.5, 200))
+        client = self.pooled_client(read_timeout=0.1, retries=1)
+        start = time.monotonic()
+        with self.assertRaises(UpstreamError) as raised:
+            self.post(client, server)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIsInstance(raised.exception.__cause__, requests.Timeout)
+        self.assertNotIn('test-key', str(raised.exception))
+
+    def test_client_errors_are_not_retried(self):
+        server = self.start_stub(lambda barangay: (0, 400))
+        client = self.pooled_client()
+        with self.assertRaises(UpstreamError):
+            self.post(client, server)
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        server = self.start_stub(self.failing_first(2, 500))
+        client = self.pooled_client(retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+        with self.assertLogs('api.http_client', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(UpstreamError):
+                    self.post(client, server)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            self.post(client, server)
+        self.assertEqual(server.calls, 2)  # Failed fast
+
+        time.sleep(0.25)
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.post(client, server)  # The trial call succeeds
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_generate_sms_view_uses_template_when_gemini_fails(self):
+        server = self.start_stub(lambda barangay: (0, 503))
+        data = {
+            'prompt': 'Gumawa ng SMS', 'household_name': 'Dela Cruz', 'barangay': 'Tondo',
+            'damage_status': 'TOTAL', 'ect_amount': 10000,
+        }
+        with override_settings(GEMINI_API_KEY='test-key', SMS_LLM_URL=server.url), \
+                mock.patch.object(gemini_client(), 'backoff', 0):
+            response = self.client.post(reverse('generate-sms'), data, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['source'], 'template')
+            self.assertEqual(response.json()['sms_message'], ml_engine.sms_template(10000, 'Dela Cruz', 'Tondo', 'TOTAL'))
+            self.assertNotIn('test-key', response.content.decode())
+            self.assertEqual(server.calls, gemini_client().retries + 1)
+
+            server.behaviour = lambda barangay: (0, 200)
+            response = self.client.post(reverse('generate-sms'), data, content_type='application/json')
+            self.assertEqual(response.json()['source'], 'llm')
+            self.assertTrue(response.json()['sms_message'].startswith('Stub SMS'))
+
+            # With the circuit open, the view answers without calling Gemini
+            calls = server.calls
+            with mock.patch.object(gemini_breaker, 'allow', return_value=False):
+                response = self.client.post(reverse('generate-sms'), data, content_type='application/json')
+            self.assertEqual(response.json()['source'], 'template')
+            self.assertEqual(server.calls, calls)
+
+
+class StubGateway:
+    """SMS gateway that rejects the given keys, or fails whole batches with ``error``"""
+
+    def __init__(self, reject=(), error=None):
+        self.reject = set(reject)
+        self.error = error
+        self.sent = []
+
+    def send(self, messages):
+        if self.error:
+            raise self.error
+        self.sent.extend(m for m in messages if m['key'] not in self.reject)
+        return {key: 'Invalid number' for key in self.reject}
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    """Local stand-in for an SMS provider's batch endpoint (see HttpGateway)"""
+    daemon_threads = True
+
+    def __init__(self, status_code=200, reject=()):
+        self.status_code = status_code
+        self.reject = set(reject)
+        self.batches = []
+        super().__init__(('127.0.0.1', 0), StubGatewayHandler)
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/send'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        messages = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['messages']
+        if self.server.status_code == 200:
+            self.server.batches.append(messages)
+        payload = json.dumps({'failed': {
+            m['key']: 'Invalid number' for m in messages if m['key'] in self.server.reject
+        }}).encode()
+        self.send_response(self.server.status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SmsOutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        self.households = make_households(self.disaster, 6)
+        for i, household in enumerate(self.households[:5]):
+            household.contact_number = f'+6391700000{i}'
+            household.save()
+
+    def enqueue(self):
+        return self.client.post(reverse('sms_outbox'), {'disaster_id': self.disaster.pk}, content_type='application/json')
+
+    def make_due(self):
+        SmsMessage.objects.update(next_attempt_at=timezone.now())
+
+    def test_enqueue_is_idempotent(self):
+        with mock.patch('api.outbox.prediction_results') as generate:
+            response = self.enqueue()
+        generate.assert_not_called()  # Texts are generated by the workers
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['queued'], 5)
+        self.assertEqual(response.json()['counts'], {'PENDING': 5, 'SENDING': 0, 'SENT': 0, 'FAILED': 0})
+        for message in SmsMessage.objects.select_related('household'):
+            self.assertEqual(message.text, '')
+            self.assertEqual(message.phone, message.household.contact_number)
+            self.assertEqual(message.idempotency_key, f'sms:{self.disaster.pk}:{message.household_id}')
+
+        response = self.enqueue()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['queued'], 0)
+
+        self.households[5].contact_number = '+639170000005'
+        self.households[5].save()
+        self.assertEqual(self.enqueue().json()['queued'], 1)
+        self.assertEqual(SmsMessage.objects.count(), 6)
+
+    def test_enqueue_counts_inserted_rows(self):
+        # A concurrent request queues the last household while the first
+        # chunk is inserted
+        household = self.households[4]
+        real_bulk_create = SmsMessage.objects.bulk_create
+
+        def racing_bulk_create(messages, **kwargs):
+            SmsMessage.objects.get_or_create(
+                idempotency_key=SmsMessage.key_for(household.pk, self.disaster.pk),
+                defaults={'household': household, 'disaster': self.disaster, 'phone': household.contact_number},
+            )
+            return real_bulk_create(messages, **kwargs)
+
+        with mock.patch('api.outbox.ENQUEUE_CHUNK_SIZE', 2), \
+                mock.patch.object(SmsMessage.objects, 'bulk_create', racing_bulk_create):
+            self.assertEqual(enqueue_disaster(self.disaster), 4)
+        self.assertEqual(SmsMessage.objects.count(), 5)
+
+    def test_workers_generate_the_texts(self):
+        self.enqueue()
+        gateway = StubGateway()
+        self.assertEqual(dispatch_batch(gateway), {'sent': 5, 'retried': 0, 'failed': 0})
+
+        predicted = self.client.get(reverse('ml_predict'), {'disaster_id': self.disaster.pk}).json()
+        sms = {row['household_id']: row['sms'] for row in predicted}
+        for message in SmsMessage.objects.select_related('household'):
+            self.assertEqual(message.text, sms[message.household.household_id])
+        self.assertEqual(
+            {m['key']: m['text'] for m in gateway.sent},
+            dict(SmsMessage.objects.values_list('idempotency_key', 'text')),
+        )
+
+    def test_failed_generation_is_retried(self):
+        self.enqueue()
+        DamageAssessment.objects.filter(household=self.households[0]).delete()
+        gateway = StubGateway()
+        with self.assertLogs('api.outbox', 'WARNING'):
+            with mock.patch('api.outbox.prediction_results', side_effect=RuntimeError('Model crashed')):
+                self.assertEqual(dispatch_batch(gateway), {'sent': 0, 'retried': 5, 'failed': 0})
+        self.assertEqual(gateway.sent, [])
+        self.assertEqual(set(SmsMessage.objects.values_list('text', 'last_error')), {('', 'RuntimeError: Model crashed')})
+
+        self.make_due()
+        self.assertEqual(dispatch_batch(gateway), {'sent': 4, 'retried': 1, 'failed': 0})
+        orphan = SmsMessage.objects.get(household=self.households[0])
+        self.assertEqual((orphan.attempts, orphan.last_error), (2, 'No assessment to generate the SMS from'))
+
+    def test_claims_are_exclusive(self):
+        self.enqueue()
+        first = claim_batch(3)
+        second = claim_batch(10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({m.pk for m in first} & {m.pk for m in second})
+        self.assertEqual(claim_batch(10), [])
+        self.assertTrue(all(m.status == SmsMessage.Status.SENDING for m in first + second))
+
+    def test_file_gateway_sends_batches(self):
+        self.enqueue()
+        path = os.path.join(tempfile.mkdtemp(), 'outbox.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        gateway = FileGateway(path)
+        self.assertEqual(dispatch_batch(gateway, size=2), {'sent': 2, 'retried': 0, 'failed': 0})
+        while any(dispatch_batch(gateway, size=2).values()):
+            pass
+
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(
+            [line['key'] for line in lines],
+            list(SmsMessage.objects.order_by('id').values_list('idempotency_key', flat=True)),
+        )
+        self.assertEqual(SmsMessage.objects.filter(status=SmsMessage.Status.SENT, sent_at__isnull=False).count(), 5)
+
+    def test_failed_messages_are_retried_then_dead_lettered(self):
+        self.enqueue()
+        bad = SmsMessage.objects.first()
+        gateway = StubGateway(reject=[bad.idempotency_key])
+        with mock.patch('api.outbox.MAX_ATTEMPTS', 2), self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(dispatch_batch(gateway), {'sent': 4, 'retried': 1, 'failed': 0})
+            bad.refresh_from_db()
+            self.assertEqual((bad.status, bad.attempts, bad.last_error), ('PENDING', 1, 'Invalid number'))
+            self.assertGreater(bad.next_attempt_at, timezone.now())
+            self.assertEqual(claim_batch(), [])  # Not due yet
+
+            self.make_due()
+            self.assertEqual(dispatch_batch(gateway), {'sent': 0, 'retried': 0, 'failed': 1})
+
+        summary = self.client.get(reverse('sms_outbox'), {'disaster_id': self.disaster.pk}).json()
+        self.assertEqual(summary['counts'], {'PENDING': 0, 'SENDING': 0, 'SENT': 4, 'FAILED': 1})
+        self.assertEqual(summary['dead_letters'][0]['idempotency_key'], bad.idempotency_key)
+        self.assertEqual(len(gateway.sent), 4)
+
+        self.assertEqual(requeue_failed(self.disaster), 1)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), ('PENDING', 0))
+
+    def test_gateway_failure_retries_the_whole_batch(self):
+        self.enqueue()
+        with self.assertLogs('api.outbox', 'WARNING'):
+            counts = dispatch_batch(StubGateway(error=GatewayError('Provider down')))
+        self.assertEqual(counts, {'sent': 0, 'retried': 5, 'failed': 0})
+        self.assertEqual(set(SmsMessage.objects.values_list('status', 'attempts')), {('PENDING', 1)})
+
+    def test_http_gateway(self):
+        self.enqueue()
+        bad = SmsMessage.objects.first()
+        server = StubGatewayServer(status_code=503, reject=[bad.idempotency_key])
+        self.addCleanup(server.stop)
+        gateway = HttpGateway(server.url)
+        gateway.client.backoff = 0
+
+        with self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(dispatch_batch(gateway), {'sent': 0, 'retried': 5, 'failed': 0})
+
+        server.status_code = 200
+        self.make_due()
+        self.assertEqual(dispatch_batch(gateway), {'sent': 4, 'retried': 1, 'failed': 0})
+        self.assertEqual(len(server.batches), 1)
+        self.assertEqual({m['phone'] for m in server.batches[0]}, set(SmsMessage.objects.values_list('phone', flat=True)))
+
+    def test_stale_claims_are_released(self):
+        self.enqueue()
+        claim_batch(2)
+        self.assertEqual(release_stale_claims(), 0)
+        SmsMessage.objects.filter(status=SmsMessage.Status.SENDING).update(
+            claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(release_stale_claims(), 2)
+        self.assertEqual(
+            sorted(SmsMessage.objects.values_list('attempts', flat=True)), [0, 0, 0, 1, 1],
+        )
+        self.assertEqual(len(claim_batch()), 5)
+
+    def test_released_claim_is_not_overwritten_by_the_slow_worker(self):
+        self.enqueue()
+        reclaimed = []
+
+        class SlowGateway(StubGateway):
+            def send(self, messages):
+                # The claim goes stale while sending; another worker takes it
+                SmsMessage.objects.filter(status=SmsMessage.Status.SENDING).update(
+                    claimed_at=timezone.now() - timedelta(hours=1),
+                )
+                release_stale_claims()
+                SmsMessage.objects.update(next_attempt_at=timezone.now())
+                reclaimed.extend(claim_batch())
+                return super().send(messages)
+
+        bad = SmsMessage.objects.order_by('id').first()
+        counts = dispatch_batch(SlowGateway(reject=[bad.idempotency_key]))
+        self.assertEqual(counts, {'sent': 0, 'retried': 0, 'failed': 0})
+        self.assertEqual(len(reclaimed), 5)
+        token = reclaimed[0].claim_token
+        # Still the second worker's claim, with the release as the only attempt
+        self.assertEqual(
+            set(SmsMessage.objects.values_list('status', 'claim_token', 'attempts', 'last_error')),
+            {('SENDING', token, 1, 'Worker stopped while sending')},
+        )
+
+    def test_repeatedly_stale_claims_are_dead_lettered(self):
+        self.enqueue()
+        stale = timezone.now() - timedelta(hours=1)
+        with mock.patch('api.outbox.MAX_ATTEMPTS', 2), self.assertLogs('api.outbox', 'WARNING'):
+            for _ in range(2):
+                self.make_due()
+                claim_batch(1)
+                SmsMessage.objects.filter(status=SmsMessage.Status.SENDING).update(claimed_at=stale)
+                self.assertEqual(release_stale_claims(), 1)
+        dead = SmsMessage.objects.get(status=SmsMessage.Status.FAILED)
+        self.assertEqual((dead.attempts, dead.last_error), (2, 'Worker stopped while sending'))
+
+    def test_errors(self):
+        self.assertEqual(self.client.post(reverse('sms_outbox'), {}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sms_outbox')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sms_outbox'), {'disaster_id': 999}).status_code, 404)
+
+
+class SmsWorkerCommandTests(TransactionTestCase):
+    """The command's worker threads need committed rows, hence TransactionTestCase"""
+
+    def test_workers_drain_the_outbox(self):
+        disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        households = make_households(disaster, 25)
+        SmsMessage.objects.bulk_create([
+            SmsMessage(
+                household=household, disaster=disaster, phone=f'+639170{i:06d}', text='Test SMS',
+                idempotency_key=SmsMessage.key_for(household.pk, disaster.pk),
+            )
+            for i, household in enumerate(households)
+        ])
+        gateway = StubGateway()
+        out, err = io.StringIO(), io.StringIO()
+        # One worker: the in-memory test database fails concurrent writers
+        # with 'table is locked' instead of waiting like a database file
+        with mock.patch('api.management.commands.run_sms_workers.get_gateway', return_value=gateway):
+            call_command('run_sms_workers', '--once', '--workers', '1', '--batch-size', '4', stdout=out, stderr=err)
+        self.assertIn('25 sent', out.getvalue(), err.getvalue())
+        self.assertEqual(sorted(m['key'] for m in gateway.sent),
+                         sorted(SmsMessage.objects.values_list('idempotency_key', flat=True)))
+        self.assertEqual(SmsMessage.objects.filter(status=SmsMessage.Status.SENT).count(), 25)
+
+    def test_workers_release_stale_claims(self):
+        disaster = DisasterEvent.objects.create(name='Typhoon Test', date_occurred='2025-11-10')
+        household = make_households(disaster, 1)[0]
+        SmsMessage.objects.create(
+            household=household, disaster=disaster, phone='+639170000000', text='Test SMS',
+            idempotency_key=SmsMessage.key_for(household.pk, disaster.pk),
+            status=SmsMessage.Status.SENDING, claim_token='gone', claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        gateway = StubGateway()
+        out = io.StringIO()
+        with mock.patch('api.management.commands.run_sms_workers.get_gateway', return_value=gateway):
+            call_command('run_sms_workers', '--once', '--workers', '1', stdout=out)
+        self.assertIn('Released 1 messages', out.getvalue())
+        message = SmsMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (SmsMessage.Status.SENT, 1))
+        self.assertEqual(len(gateway.sent), 1)
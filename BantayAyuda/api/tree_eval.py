@@ -0,0 +1,466 @@
+"""
+Pure-NumPy evaluator for CatBoost oblivious-tree models.
+
+CatBoost trees are oblivious: every node on one level of a tree tests the
+same split, so a row's leaf is just the bits of ``depth`` binary splits.
+compile_catboost() exports a trained CatBoostClassifier (through CatBoost's
+own JSON model format) into a handful of arrays:
+
+    - float features: borders (float32) per model feature
+    - one-hot categorical features: the hashed values they test
+    - CTR features: the learned per-category counter tables, keyed by the
+      hash of the category value, plus prior/scale/shift
+    - trees: a (splits x trees) matrix of level weights and the leaf values
+      (trees * 2**depth x K)
+
+ObliviousTrees then evaluates a whole batch with a few vectorized NumPy
+operations, without building a catboost.Pool: one comparison for all float
+borders, one matrix product for every tree's leaf index, one gather for the
+leaf values. Categorical splits are computed once per distinct category.
+Categorical strings are hashed exactly like CatBoost does (CityHash64,
+truncated to 32 bits), so unseen categories fall back to the CTR priors just
+as they do in CatBoost.
+
+Only the model features this app uses are supported: float features, one-hot
+categorical features, and CTRs over plain categorical values. Anything else
+makes compile_catboost() raise ValueError, and callers keep using CatBoost.
+"""
+import json
+import os
+import struct
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Distinct values memoized per categorical feature (see ObliviousTrees._category_rows)
+CATEGORY_CACHE_SIZE = 10000
+
+
+# --- CatBoost categorical hashing (CityHash64 v1.0, as in CatBoost's util/digest/city) ---
+
+_MASK = (1 << 64) - 1
+_K0 = 0xc3a5c85c97cb3127
+_K1 = 0xb492b66fbe98f273
+_K2 = 0x9ae16a3b2f90404f
+_K3 = 0xc949d7c7509e6557
+_KMUL = 0x9ddfea08eb382d69
+
+
+def _fetch64(s, i):
+    return struct.unpack_from('<Q', s, i)[0]
+
+
+def _fetch32(s, i):
+    return struct.unpack_from('<I', s, i)[0]
+
+
+def _rotate(value, shift):
+    return value if shift == 0 else ((value >> shift) | (value << (64 - shift))) & _MASK
+
+
+def _shift_mix(value):
+    return value ^ (value >> 47)
+
+
+def _hash_len16(u, v):
+    a = ((u ^ v) * _KMUL) & _MASK
+    a ^= a >> 47
+    b = ((v ^ a) * _KMUL) & _MASK
+    b ^= b >> 47
+    return (b * _KMUL) & _MASK
+
+
+def _hash_len0to16(s):
+    n = len(s)
+    if n > 8:
+        a = _fetch64(s, 0)
+        b = _fetch64(s, n - 8)
+        return _hash_len16(a, _rotate((b + n) & _MASK, n)) ^ b
+    if n >= 4:
+        a = _fetch32(s, 0)
+        return _hash_len16((n + (a << 3)) & _MASK, _fetch32(s, n - 4))
+    if n > 0:
+        y = (s[0] + (s[n >> 1] << 8)) & 0xffffffff
+        z = (n + (s[n - 1] << 2)) & 0xffffffff
+        return (_shift_mix(((y * _K2) ^ (z * _K3)) & _MASK) * _K2) & _MASK
+    return _K2
+
+
+def _hash_len17to32(s):
+    n = len(s)
+    a = (_fetch64(s, 0) * _K1) & _MASK
+    b = _fetch64(s, 8)
+    c = (_fetch64(s, n - 8) * _K2) & _MASK
+    d = (_fetch64(s, n - 16) * _K0) & _MASK
+    return _hash_len16(
+        (_rotate((a - b) & _MASK, 43) + _rotate(c, 30) + d) & _MASK,
+        (a + _rotate(b ^ _K3, 20) - c + n) & _MASK,
+    )
+
+
+def _hash_len33to64(s):
+    n = len(s)
+    z = _fetch64(s, 24)
+    a = (_fetch64(s, 0) + (n + _fetch64(s, n - 16)) * _K0) & _MASK
+    b = _rotate((a + z) & _MASK, 52)
+    c = _rotate(a, 37)
+    a = (a + _fetch64(s, 8)) & _MASK
+    c = (c + _rotate(a, 7)) & _MASK
+    a = (a + _fetch64(s, 16)) & _MASK
+    vf = (a + z) & _MASK
+    vs = (b + _rotate(a, 31) + c) & _MASK
+    a = (_fetch64(s, 16) + _fetch64(s, n - 32)) & _MASK
+    z = _fetch64(s, n - 8)
+    b = _rotate((a + z) & _MASK, 52)
+    c = _rotate(a, 37)
+    a = (a + _fetch64(s, n - 24)) & _MASK
+    c = (c + _rotate(a, 7)) & _MASK
+    a = (a + _fetch64(s, n - 16)) & _MASK
+    wf = (a + z) & _MASK
+    ws = (b + _rotate(a, 31) + c) & _MASK
+    r = _shift_mix(((vf + ws) * _K2 + (wf + vs) * _K0) & _MASK)
+    return (_shift_mix((r * _K0 + vs) & _MASK) * _K2) & _MASK
+
+
+def _weak_hash_len32(s, i, a, b):
+    w, x, y, z = _fetch64(s, i), _fetch64(s, i + 8), _fetch64(s, i + 16), _fetch64(s, i + 24)
+    a = (a + w) & _MASK
+    b = _rotate((b + a + z) & _MASK, 21)
+    c = a
+    a = (a + x + y) & _MASK
+    b = (b + _rotate(a, 44)) & _MASK
+    return (a + z) & _MASK, (b + c) & _MASK
+
+
+def city_hash64(data):
+    """CityHash64 of a bytes object"""
+    n = len(data)
+    if n <= 16:
+        return _hash_len0to16(data)
+    if n <= 32:
+        return _hash_len17to32(data)
+    if n <= 64:
+        return _hash_len33to64(data)
+
+    # Over 64 bytes: hash the end first, then loop over 64-byte chunks
+    x = _fetch64(data, 0)
+    y = _fetch64(data, n - 16) ^ _K1
+    z = _fetch64(data, n - 56) ^ _K0
+    v = _weak_hash_len32(data, n - 64, n, y)
+    w = _weak_hash_len32(data, n - 32, (n * _K1) & _MASK, _K0)
+    z = (z + _shift_mix(v[1]) * _K1) & _MASK
+    x = (_rotate((z + x) & _MASK, 39) * _K1) & _MASK
+    y = (_rotate(y, 33) * _K1) & _MASK
+
+    remaining = (n - 1) & ~63
+    pos = 0
+    while True:
+        x = (_rotate((x + y + v[0] + _fetch64(data, pos + 16)) & _MASK, 37) * _K1) & _MASK
+        y = (_rotate((y + v[1] + _fetch64(data, pos + 48)) & _MASK, 42) * _K1) & _MASK
+        x ^= w[1]
+        y ^= v[0]
+        z = _rotate(z ^ w[0], 33)
+        v = _weak_hash_len32(data, pos, (v[1] * _K1) & _MASK, (x + w[0]) & _MASK)
+        w = _weak_hash_len32(data, pos + 32, (z + w[1]) & _MASK, y)
+        x, z = z, x
+        pos += 64
+        remaining -= 64
+        if remaining == 0:
+            break
+    return _hash_len16(
+        (_hash_len16(v[0], w[0]) + _shift_mix(y) * _K1 + z) & _MASK,
+        (_hash_len16(v[1], w[1]) + x) & _MASK,
+    )
+
+
+def cat_feature_hash(value):
+    """CatBoost's 32-bit hash of a categorical value (ints are hashed as their decimal string)"""
+    return city_hash64(str(value).encode('utf-8')) & 0xffffffff
+
+
+# CTR projection hashing (CatBoost's CalcHash): h = MAGIC * (h + MAGIC * value)
+_CTR_HASH_MULT = np.uint64(0x4906ba494954cb65)
+
+
+def _factorize(values):
+    """(codes, uniques) of a column; plain Python for the small batches of single predictions"""
+    if len(values) > 64:
+        return pd.factorize(values)
+    positions = {}
+    codes = np.array([positions.setdefault(value, len(positions)) for value in values], dtype=np.intp)
+    return codes, list(positions)
+
+
+def _projection_hash(cat_hashes):
+    """Combine the 32-bit hashes of a CTR's categorical features into its table key"""
+    key = np.zeros(len(cat_hashes[0]), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for hashes in cat_hashes:
+            # CatBoost sign-extends the 32-bit hash to 64 bits
+            value = hashes.view(np.int32).astype(np.int64).view(np.uint64)
+            key = _CTR_HASH_MULT * (key + _CTR_HASH_MULT * value)
+    return key
+
+
+# --- Model export ---
+
+class _Ctr:
+    """One CTR feature: a counter table keyed by projection hash"""
+
+    def __init__(self, info, table):
+        if any(element['combination_element'] != 'cat_feature_value' for element in info['elements']):
+            raise ValueError('Only CTRs over plain categorical values are supported')
+        self.cat_features = [element['cat_feature_index'] for element in info['elements']]
+        self.type = info['ctr_type']
+        self.target_border_idx = info['target_border_idx']
+        self.prior_num = float(info['prior_numerator'])
+        self.prior_denom = float(info['prior_denomerator'])
+        self.scale = float(info['scale'])
+        self.shift = float(info['shift'])
+        self.borders = np.asarray(info['borders'], dtype=np.float32)
+
+        stride = table['hash_stride']
+        flat = table['hash_map']
+        keys = np.array([int(key) for key in flat[0::stride]], dtype=np.uint64)
+        counts = np.array([flat[i + 1:i + stride] for i in range(0, len(flat), stride)], dtype=np.float64)
+        # Drop the empty-bucket marker CatBoost writes into exported tables
+        real = keys != np.uint64(_MASK)
+        order = np.argsort(keys[real])
+        self.keys = keys[real][order]
+        self.counts = counts[real][order]
+        self.counter_denominator = float(table.get('counter_denominator', 0))
+
+    def values(self, cat_hashes):
+        """CTR value per row, given the row hashes of every categorical feature"""
+        key = _projection_hash([cat_hashes[index] for index in self.cat_features])
+        pos = np.minimum(np.searchsorted(self.keys, key), max(len(self.keys) - 1, 0))
+        found = (self.keys[pos] == key) if len(self.keys) else np.zeros(len(key), dtype=bool)
+        counts = np.where(found[:, None], self.counts[pos], 0.0)
+
+        if self.type == 'Borders':
+            # Share of rows whose class is above the target border
+            good = counts[:, self.target_border_idx + 1:].sum(axis=1)
+            total = counts.sum(axis=1)
+        elif self.type == 'Buckets':
+            good = counts[:, self.target_border_idx]
+            total = counts.sum(axis=1)
+        elif self.type in ('Counter', 'FeatureFreq'):
+            good = counts[:, 0]
+            total = np.full(len(key), self.counter_denominator)
+        else:
+            raise ValueError(f'Unsupported CTR type: {self.type}')
+
+        ctr = (good + self.prior_num) / (total + self.prior_denom)
+        return ((ctr + self.shift) * self.scale).astype(np.float32)
+
+
+class ObliviousTrees:
+    """
+    Array form of a CatBoost oblivious-tree classifier.
+
+    Build with compile_catboost(); evaluate with predict_proba(frame), where
+    ``frame`` is a DataFrame (or dict of arrays) with the model's feature names.
+    """
+
+    def __init__(self, document, classes):
+        info = document['features_info']
+        self.classes = np.asarray(classes)
+
+        # Float features: (column name, float32 borders)
+        self.float_features = [
+            (feature['feature_id'], np.asarray(feature.get('borders') or [], dtype=np.float32))
+            for feature in info.get('float_features', [])
+        ]
+        # Categorical features by CatBoost's cat feature index
+        self.cat_features = {
+            feature['feature_index']: feature['feature_id']
+            for feature in info.get('categorical_features', [])
+        }
+        self.one_hot = {
+            feature['feature_index']: np.asarray(feature['values'], dtype=np.uint32)
+            for feature in info.get('categorical_features', [])
+            if feature.get('values')
+        }
+        ctr_tables = document.get('ctr_data', {})
+        self.ctrs = [_Ctr(ctr, ctr_tables[ctr['identifier']]) for ctr in info.get('ctrs', [])]
+
+        # Binary features in CatBoost's split_index order:
+        # float borders, then one-hot values, then CTR borders
+        self.splits = []  # (kind, feature, threshold)
+        for position, (_, borders) in enumerate(self.float_features):
+            self.splits += [('float', position, border) for border in borders]
+        for cat_index, values in self.one_hot.items():
+            self.splits += [('one_hot', cat_index, value) for value in values]
+        for position, ctr in enumerate(self.ctrs):
+            self.splits += [('ctr', position, border) for border in ctr.borders]
+
+        trees = document['oblivious_trees']
+        depth = max(len(tree['splits']) for tree in trees)
+        dimension = len(trees[0]['leaf_values']) >> len(trees[0]['splits'])
+
+        # A row's leaf in tree t is sum(bit[s] * weights[s, t]) over splits s,
+        # where weights[s, t] = 2**level if tree t tests split s on that level.
+        # That turns leaf lookup for all trees into one matrix product.
+        weights = np.zeros((len(self.splits), len(trees)), dtype=np.float32)
+        # Shallower trees only use the first 2**d leaf slots
+        leaf_values = np.zeros((len(trees), 1 << depth, dimension))
+        for t, tree in enumerate(trees):
+            for level, split in enumerate(tree['splits']):
+                self._check_split(split)
+                weights[split['split_index'], t] += 1 << level
+            leaves = np.asarray(tree['leaf_values'], dtype=np.float64).reshape(-1, dimension)
+            leaf_values[t, :len(leaves)] = leaves
+        self.leaf_values = leaf_values.reshape(-1, dimension)
+        self._tree_offsets = np.arange(len(trees), dtype=np.intp) * (1 << depth)
+
+        # Float splits are evaluated in one comparison against all borders
+        float_splits = [i for i, split in enumerate(self.splits) if split[0] == 'float']
+        self._float_feature = np.array([self.splits[i][1] for i in float_splits], dtype=np.intp)
+        self._float_border = np.array([self.splits[i][2] for i in float_splits], dtype=np.float32)
+        self._float_weights = weights[float_splits]
+
+        # Splits that depend on a single categorical feature are evaluated
+        # once per distinct value in the batch, then broadcast to the rows
+        self._cat_groups = {}
+        multi_splits = []
+        for i, (kind, feature, _) in enumerate(self.splits):
+            if kind == 'one_hot':
+                self._cat_groups.setdefault(feature, []).append(i)
+            elif kind == 'ctr' and len(self.ctrs[feature].cat_features) == 1:
+                self._cat_groups.setdefault(self.ctrs[feature].cat_features[0], []).append(i)
+            elif kind == 'ctr':
+                multi_splits.append(i)
+        self._cat_weights = {index: weights[group] for index, group in self._cat_groups.items()}
+        self._multi_splits = multi_splits
+        self._multi_weights = weights[multi_splits]
+
+        scale, bias = document.get('scale_and_bias', [1, [0.0] * dimension])
+        self.scale = float(scale)
+        self.bias = np.asarray(bias, dtype=np.float64).reshape(-1)
+        self.dimension = dimension
+        self._category_cache = {}
+        self._category_lock = threading.Lock()
+
+    def _check_split(self, split):
+        """Make sure the split_index layout matches the exported split"""
+        index = split['split_index']
+        if index >= len(self.splits):
+            raise ValueError(f'Unknown split index {index}')
+        kind, _, threshold = self.splits[index]
+        expected = {'FloatFeature': 'float', 'OneHotFeature': 'one_hot', 'OnlineCtr': 'ctr'}.get(split['split_type'])
+        value = split.get('border', split.get('value'))
+        if kind != expected or not np.isclose(float(threshold), float(value)):
+            raise ValueError(f'Split {index} does not match the exported model layout')
+
+    def knows_category(self, feature_id, value):
+        """Whether the model learned anything about one categorical value (CTR statistics or a one-hot split)"""
+        index = next((i for i, name in self.cat_features.items() if name == feature_id), None)
+        if index is None:
+            return False
+        hashes = np.array([cat_feature_hash(value)], dtype=np.uint32)
+        if hashes[0] in self.one_hot.get(index, ()):
+            return True
+        key = _projection_hash([hashes])[0]
+        return any(ctr.cat_features == [index] and key in ctr.keys for ctr in self.ctrs)
+
+    def _hash_values(self, values):
+        """CatBoost hashes of categorical values"""
+        return np.array([cat_feature_hash(value) for value in values], dtype=np.uint32)
+
+    def _category_rows(self, index, values):
+        """
+        Leaf-index contribution (len(values) x trees) of the splits on one
+        categorical feature, per distinct value. Memoized per value, since
+        categories repeat across batches; the memo is shared by the threads
+        predicting with this model, so it is only touched under a lock.
+        """
+        with self._category_lock:
+            cache = self._category_cache.setdefault(index, {})
+            rows = {value: cache[value] for value in values if value in cache}
+        missing = [value for value in dict.fromkeys(values) if value not in rows]
+        if missing:
+            bits = self._split_bits(self._cat_groups[index], {index: self._hash_values(missing)})
+            computed = dict(zip(missing, bits @ self._cat_weights[index]))
+            rows.update(computed)
+            with self._category_lock:
+                if len(cache) + len(computed) > CATEGORY_CACHE_SIZE:
+                    cache.clear()
+                cache.update(computed)
+        return np.array([rows[value] for value in values], dtype=np.float32)
+
+    def _split_bits(self, splits, cat_hashes):
+        """Bits (rows x len(splits)) of categorical splits, given hashes per cat feature"""
+        ctr_values = {}
+        bits = np.empty((len(next(iter(cat_hashes.values()))), len(splits)), dtype=np.float32)
+        for column, index in enumerate(splits):
+            kind, feature, threshold = self.splits[index]
+            if kind == 'one_hot':
+                bits[:, column] = cat_hashes[feature] == threshold
+            else:
+                if feature not in ctr_values:
+                    ctr_values[feature] = self.ctrs[feature].values(cat_hashes)
+                bits[:, column] = ctr_values[feature] > threshold
+        return bits
+
+    def _leaf_indexes(self, frame):
+        """Leaf index of every row in every tree (n x trees)"""
+        floats = np.column_stack([np.asarray(frame[name], dtype=np.float32) for name, _ in self.float_features])
+        leaves = (floats[:, self._float_feature] > self._float_border).astype(np.float32) @ self._float_weights
+
+        for index in self._cat_groups:
+            codes, uniques = _factorize(np.asarray(frame[self.cat_features[index]]))
+            leaves += self._category_rows(index, [str(value) for value in uniques])[codes]
+
+        if self._multi_splits:
+            row_hashes = {}
+            for index, name in self.cat_features.items():
+                codes, uniques = _factorize(np.asarray(frame[name]))
+                row_hashes[index] = self._hash_values([str(value) for value in uniques])[codes]
+            leaves += self._split_bits(self._multi_splits, row_hashes) @ self._multi_weights
+
+        return leaves.astype(np.intp)
+
+    def raw_values(self, frame):
+        """Raw formula values (n x dimension)"""
+        leaves = self._leaf_indexes(frame) + self._tree_offsets
+        return self.scale * self.leaf_values[leaves].sum(axis=1) + self.bias
+
+    def predict_proba(self, frame):
+        """Class probabilities (n x classes), like CatBoostClassifier.predict_proba"""
+        raw = self.raw_values(frame)
+        if self.dimension == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        raw = raw - raw.max(axis=1, keepdims=True)
+        exp = np.exp(raw)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, frame):
+        """Most likely class per row, like CatBoostClassifier.predict"""
+        return self.classes[self.predict_proba(frame).argmax(axis=1)]
+
+
+def compile_catboost(model):
+    """
+    Export a trained CatBoostClassifier to an ObliviousTrees evaluator.
+
+    Raises:
+        ValueError: if the model uses features this evaluator doesn't support
+    """
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        model.save_model(path, format='json')
+        with open(path) as f:
+            document = json.load(f)
+    finally:
+        os.remove(path)
+
+    if not document.get('oblivious_trees'):
+        raise ValueError('Only oblivious-tree models are supported')
+    if document['features_info'].get('text_features') or document['features_info'].get('embedding_features'):
+        raise ValueError('Text and embedding features are not supported')
+    return ObliviousTrees(document, model.classes_)
@@ -1,6 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HouseholdViewSet, DisasterEventViewSet, DamageAssessmentViewSet, generate_sms, ml_predict_view, budget_summary_view, export_csv_view
+from .views import (
+    HouseholdViewSet, DisasterEventViewSet, DamageAssessmentViewSet, generate_sms, ml_predict_view, budget_summary_view, export_csv_view,
+    prediction_jobs_view, prediction_job_detail_view, prediction_job_results_view, ml_model_view, sms_outbox_view,
+    budget_simulate_view, payout_rules_view, export_parquet_view,
+)
 
 router = DefaultRouter()
 router.register(r'households', HouseholdViewSet, basename='household')
@@ -11,7 +15,15 @@ urlpatterns = [
     path('', include(router.urls)),
     path('generate-sms/', generate_sms, name='generate-sms'),
     path('ml/predict/', ml_predict_view, name='ml_predict'),
+    path('ml/model/', ml_model_view, name='ml_model'),
+    path('ml/jobs/', prediction_jobs_view, name='prediction_jobs'),
+    path('ml/jobs/<int:pk>/', prediction_job_detail_view, name='prediction_job_detail'),
+    path('ml/jobs/<int:pk>/results/', prediction_job_results_view, name='prediction_job_results'),
+    path('sms/outbox/', sms_outbox_view, name='sms_outbox'),
     path('budget/summary/', budget_summary_view, name='budget_summary'),
+    path('budget/simulate/', budget_simulate_view, name='budget_simulate'),
+    path('budget/rules/', payout_rules_view, name='payout_rules'),
     path('export/csv/', export_csv_view, name='export_csv'),
+    path('export/parquet/', export_parquet_view, name='export_parquet'),
 ]
 
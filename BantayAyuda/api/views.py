@@ -1,13 +1,35 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
-import requests
 import json
-from .models import Household, DisasterEvent, DamageAssessment
-from .serializers import HouseholdSerializer, DisasterEventSerializer, DamageAssessmentSerializer
-from .ml_engine import predict_ect, generate_sms as generate_sms_ml
+from .models import Household, DisasterEvent, DamageAssessment, PredictionJob, BudgetRollup, PayoutRuleSet
+from .serializers import (
+    HouseholdSerializer, DisasterEventSerializer, DamageAssessmentSerializer, PredictionJobSerializer,
+    PayoutRuleSetSerializer,
+)
+from .spatial import bbox_filter, parse_bbox
+from .clusters import cluster_precision, clusters_for_zoom
+from .response_cache import cache_disaster_response
+from .columnar import encode_columnar
+from .export import export_rows, gzip_stream, stream_csv
+from .parquet_export import FORMATS, stream_export
+from .renderers import ColumnarRenderer
+from .geojson import (
+    household_rows, build_feature, stream_feature_collection,
+    new_cursor, parse_cursor, delta_collection,
+)
+from .prediction_store import prediction_results
+from .jobs import start_job
+from .outbox import enqueue_disaster, outbox_summary
+from .payouts import PayoutRuleError, create_rule_set, current_payouts, parse_amounts
+from .payout_simulator import PayoutSimulator, ScenarioError, parse_scenarios
+from .http_client import UpstreamError, gemini_client, gemini_text
+from .ml_engine import model_info, sms_template
+from .model_registry import registry
 
 
 class HouseholdViewSet(viewsets.ModelViewSet):
@@ -18,7 +40,12 @@ class HouseholdViewSet(viewsets.ModelViewSet):
     queryset = Household.objects.all()
     serializer_class = HouseholdSerializer
 
-    @action(detail=False, methods=['get'])
+    @action(
+        detail=False,
+        methods=['get'],
+        renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarRenderer],
+    )
+    @cache_disaster_response
     def geojson(self, request):
         """
         CRITICAL IMPLEMENTATION: Custom GeoJSON endpoint for Leaflet.js map.
@@ -26,13 +53,29 @@ class HouseholdViewSet(viewsets.ModelViewSet):
         
         When frontend calls /api/households/geojson/?disaster_id=1, this function:
         1. Gets all Household locations
-        2. Finds their DamageAssessment for that specific disaster
+        2. LEFT JOINs their DamageAssessment for that specific disaster
+           (a single query, no per-household lookups)
         3. Bundles it all into a single GeoJSON file that Leaflet.js can read
         
         Returns GeoJSON with colored markers based on damage_status:
         - Red: Total Damage (₱10,000)
         - Orange: Partial Damage (₱5,000)
         - Green: No Damage (₱0)
+
+        Add &bbox=west,south,east,north (and optionally &zoom=<level>) to only
+        return households inside the map viewport; the lookup uses the
+        geohash grid index on Household.
+
+        Add &stream=1 to stream the FeatureCollection incrementally instead of
+        building it in memory (recommended for very large disasters).
+
+        Add &format=columnar (or send Accept: application/vnd.bantayayuda.columnar)
+        for a compact binary payload of typed arrays; see api/columnar.py.
+        Popups are then fetched per household from /api/households/<id>/popup/.
+
+        Every response carries a "cursor". Pass it back as &since=<cursor> to
+        get only the features added, changed or deleted since then (see
+        api/geojson.delta_collection).
         """
         disaster_id = request.query_params.get('disaster_id', None)
         
@@ -50,69 +93,126 @@ class HouseholdViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Build GeoJSON structure
-        features = []
-        
+        # Optional viewport filter: bbox=west,south,east,north and zoom=<leaflet zoom>
         households = Household.objects.all()
-        for household in households:
-            # Get assessment for this household and disaster
+        bbox = request.query_params.get('bbox')
+        zoom = request.query_params.get('zoom')
+        if bbox:
             try:
-                assessment = DamageAssessment.objects.get(
-                    household=household,
-                    disaster=disaster
+                bbox = parse_bbox(bbox)
+                zoom = int(zoom) if zoom else None
+            except ValueError:
+                return Response(
+                    {'error': 'bbox must be "west,south,east,north" and zoom an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                damage_status = assessment.damage_status
-                ect_amount = float(assessment.recommended_ect_amount)
-            except DamageAssessment.DoesNotExist:
-                damage_status = 'NONE'
-                ect_amount = 0
-
-            # Determine color based on damage status
-            if damage_status == 'TOTAL':
-                color = '#dc3545'  # Red
-                marker_color = 'red'
-            elif damage_status == 'PARTIAL':
-                color = '#fd7e14'  # Orange
-                marker_color = 'orange'
-            else:
-                color = '#28a745'  # Green
-                marker_color = 'green'
-
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [
-                        float(household.longitude),
-                        float(household.latitude)
-                    ]
-                },
-                'properties': {
-                    'id': household.id,
-                    'name': household.name,
-                    'address': household.address,
-                    'barangay': household.barangay,
-                    'contact_number': household.contact_number or '',
-                    'damage_status': damage_status,
-                    'ect_amount': ect_amount,
-                    'marker_color': marker_color,
-                    'popup_content': f"""
-                        <strong>{household.name}</strong><br>
-                        {household.address}<br>
-                        <strong>Status:</strong> {damage_status}<br>
-                        <strong>ECT Amount:</strong> ₱{ect_amount:,.2f}
-                    """
-                }
-            }
-            features.append(feature)
+            households = households.filter(bbox_filter(bbox, zoom))
+
+        # Compact binary columnar payload (?format=columnar or Accept header)
+        if request.accepted_renderer.format == 'columnar':
+            return Response(encode_columnar(disaster.pk, households))
+
+        # Delta mode: only features added/changed/deleted after the given cursor
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_cursor(since)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse(delta_collection(disaster.pk, since, households))
+
+        # Taken before querying, so the next delta can't miss concurrent writes
+        cursor = new_cursor()
+        rows = household_rows(disaster.pk, households)
+
+        # Streaming mode: write features incrementally from a DB cursor
+        if request.query_params.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(
+                stream_feature_collection(rows, cursor=cursor),
+                content_type='application/json'
+            )
+
+        # One LEFT JOIN for every household and its assessment for this disaster
+        features = [build_feature(row) for row in rows]
 
         geojson = {
             'type': 'FeatureCollection',
-            'features': features
+            'features': features,
+            'cursor': cursor
         }
 
         return JsonResponse(geojson)
 
+    @action(detail=True, methods=['get'])
+    def popup(self, request, pk=None):
+        """
+        Lazily loaded details for one household on a disaster's map
+        (used with the columnar map payload, which omits names and popups).
+
+        /api/households/<id>/popup/?disaster_id=1
+        """
+        disaster_id = request.query_params.get('disaster_id', None)
+
+        if not disaster_id:
+            return Response(
+                {'error': 'disaster_id parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        row = household_rows(disaster_id, Household.objects.filter(pk=pk)).first()
+        if row is None:
+            return Response(
+                {'error': 'Household not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(build_feature(row)['properties'])
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Pre-aggregated marker clusters for low zoom levels.
+
+        /api/households/clusters/?disaster_id=1&zoom=10[&bbox=west,south,east,north]
+
+        Each cluster is a geohash grid cell with its household count, the
+        TOTAL/PARTIAL/NONE breakdown and the summed recommended ECT amount.
+        Clusters are cached per disaster and updated incrementally when
+        households or assessments change.
+        """
+        disaster_id = request.query_params.get('disaster_id', None)
+
+        if not disaster_id:
+            return Response(
+                {'error': 'disaster_id parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            disaster = DisasterEvent.objects.get(pk=disaster_id)
+        except DisasterEvent.DoesNotExist:
+            return Response(
+                {'error': 'Disaster not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        bbox = request.query_params.get('bbox')
+        try:
+            zoom = int(request.query_params.get('zoom', 10))
+            bbox = parse_bbox(bbox) if bbox else None
+        except ValueError:
+            return Response(
+                {'error': 'bbox must be "west,south,east,north" and zoom an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'disaster_id': disaster.pk,
+            'zoom': zoom,
+            'precision': cluster_precision(zoom),
+            'clusters': clusters_for_zoom(disaster.pk, zoom, bbox),
+        })
+
 
 class DisasterEventViewSet(viewsets.ModelViewSet):
     """REST API ViewSet for DisasterEvent model."""
@@ -149,6 +249,10 @@ def generate_sms(request):
     This implements the "Innovation" and "AI/LLM" criteria from the PDFs.
     
     Takes household data and generates an empathetic SMS message in Filipino/Tagalog.
+
+    Gemini is called through the pooled client in api/http_client.py
+    (timeouts, retries, circuit breaker). When it fails or the circuit is
+    open, the template SMS is returned instead, with 'source': 'template'.
     """
     try:
         data = request.data
@@ -167,8 +271,6 @@ def generate_sms(request):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         # Call Gemini API
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={api_key}'
-        
         payload = {
             'contents': [{
                 'parts': [{
@@ -177,36 +279,27 @@ def generate_sms(request):
             }]
         }
         
-        headers = {
-            'Content-Type': 'application/json'
+        result = {
+            'success': True,
+            'household_name': household_name,
+            'damage_status': damage_status,
+            'ect_amount': ect_amount
         }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            # Extract the generated text from Gemini response
-            if 'candidates' in result and len(result['candidates']) > 0:
-                generated_text = result['candidates'][0]['content']['parts'][0]['text']
-                
-                return Response({
-                    'success': True,
-                    'sms_message': generated_text.strip(),
-                    'household_name': household_name,
-                    'damage_status': damage_status,
-                    'ect_amount': ect_amount
-                })
-            else:
-                return Response({
-                    'success': False,
-                    'error': 'No response from Gemini API'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            return Response({
-                'success': False,
-                'error': f'Gemini API error: {response.status_code} - {response.text}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        try:
+            response = gemini_client().post_json(settings.SMS_LLM_URL, payload, params={'key': api_key})
+            result['sms_message'] = gemini_text(response)
+            result['source'] = 'llm'
+        except UpstreamError as e:
+            # Fail fast to the template rather than an error
+            result['sms_message'] = sms_template(
+                int(float(ect_amount or 0)),
+                data.get('household_id') or household_name,
+                data.get('barangay', ''),
+                damage_status,
+            )
+            result['source'] = 'template'
+            result['warning'] = f'Gemini API unavailable, using the template SMS ({e})'
+        return Response(result)
             
     except Exception as e:
         return Response({
@@ -216,6 +309,7 @@ def generate_sms(request):
 
 
 # ML Prediction endpoint
+@cache_disaster_response
 @api_view(['GET'])
 def ml_predict_view(request):
     """
@@ -241,46 +335,151 @@ def ml_predict_view(request):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Get all assessments for this disaster
-    assessments = DamageAssessment.objects.filter(disaster_id=disaster_id)
+    # Feature rows and stored predictions for every assessment (one joined
+    # query); only rows whose features or model changed are re-predicted,
+    # in a single model call
+    results = prediction_results(DamageAssessment.objects.filter(disaster_id=disaster_id))
     
-    results = []
-    for assessment in assessments:
-        household = assessment.household
-        
-        # Get ML prediction
-        ect_amount = predict_ect(household)
-        
-        # If ML prediction failed, use assessment amount
-        if ect_amount is None:
-            ect_amount = int(float(assessment.recommended_ect_amount))
-        
-        # Generate SMS
-        household_id = household.household_id or household.name
-        sms = generate_sms_ml(
-            ect_amount, 
-            household_id, 
-            household.barangay, 
-            assessment.damage_status
+    response = Response(results)
+    model_version = results[0]['model_version'] if results else registry.active_version()
+    if model_version:
+        response['X-Model-Version'] = model_version
+    return response
+
+
+# Active ML model endpoint
+@api_view(['GET'])
+def ml_model_view(request):
+    """
+    Report the ML model version predictions are made with (see
+    api/model_registry.py), and whether the shared model server
+    (api/model_server.py) or this process serves it. Loads the model if it
+    isn't loaded yet.
+    """
+    info = model_info()
+    if info is None:
+        return Response(
+            {'error': 'No ML model available'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
-        
-        results.append({
-            'household_id': household_id,
-            'household_name': household.name,
-            'barangay': household.barangay,
-            'lat': float(household.latitude),
-            'lon': float(household.longitude),
-            'ect_amount': ect_amount,
-            'damage_status': assessment.damage_status,
-            'flood_depth': household.flood_depth,
-            'is_4ps': household.is_4ps,
-            'sms': sms
-        })
-    
-    return Response(results)
+    return Response({**info, 'promoted_version': registry.promoted_version()})
+
+
+# Background prediction jobs
+@api_view(['GET', 'POST'])
+def prediction_jobs_view(request):
+    """
+    Start a disaster-wide ML prediction run in the background (POST with
+    disaster_id), or list recent jobs (GET, optionally ?disaster_id=).
+    Poll /api/ml/jobs/<id>/ for progress and fetch rows from
+    /api/ml/jobs/<id>/results/.
+    """
+    if request.method == 'GET':
+        jobs = PredictionJob.objects.select_related('disaster')
+        disaster_id = request.GET.get('disaster_id')
+        if disaster_id:
+            jobs = jobs.filter(disaster_id=disaster_id)
+        return Response(PredictionJobSerializer(jobs[:50], many=True).data)
+
+    disaster_id = request.data.get('disaster_id')
+    if not disaster_id:
+        return Response(
+            {'error': 'disaster_id is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        disaster = DisasterEvent.objects.get(pk=disaster_id)
+    except (DisasterEvent.DoesNotExist, ValueError):
+        return Response(
+            {'error': 'Disaster not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Only one active run per disaster; asking again returns the running job
+    job, created = start_job(disaster)
+    return Response(
+        PredictionJobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+def prediction_job_detail_view(request, pk):
+    """Progress of a prediction job: status, percent done and rows per second"""
+    try:
+        job = PredictionJob.objects.select_related('disaster').get(pk=pk)
+    except PredictionJob.DoesNotExist:
+        return Response(
+            {'error': 'Job not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(PredictionJobSerializer(job).data)
+
+
+class PredictionResultPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+@api_view(['GET'])
+def prediction_job_results_view(request, pk):
+    """
+    Paginated results of a prediction job (?page=, ?page_size=), in the same
+    row format as /api/ml/predict/. Rows appear as chunks complete.
+    """
+    try:
+        job = PredictionJob.objects.get(pk=pk)
+    except PredictionJob.DoesNotExist:
+        return Response(
+            {'error': 'Job not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    paginator = PredictionResultPagination()
+    page = paginator.paginate_queryset(job.results.values_list('data', flat=True), request)
+    response = paginator.get_paginated_response(page)
+    response.data['status'] = job.status
+    return response
+
+
+# SMS outbox
+@api_view(['GET', 'POST'])
+def sms_outbox_view(request):
+    """
+    Queue the SMS for a disaster's households (POST with disaster_id), or
+    report its outbox (GET ?disaster_id=): message counts by status and the
+    latest dead letters. Messages are generated and sent by
+    `manage.py run_sms_workers`; queueing again only adds households that
+    have no SMS yet, and 'queued' counts the rows actually added.
+    """
+    disaster_id = request.data.get('disaster_id') if request.method == 'POST' else request.GET.get('disaster_id')
+    if not disaster_id:
+        return Response(
+            {'error': 'disaster_id is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        disaster = DisasterEvent.objects.get(pk=disaster_id)
+    except (DisasterEvent.DoesNotExist, ValueError):
+        return Response(
+            {'error': 'Disaster not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if request.method == 'GET':
+        return Response(outbox_summary(disaster))
+
+    queued = enqueue_disaster(disaster)
+    return Response(
+        {'queued': queued, **outbox_summary(disaster)},
+        status=status.HTTP_202_ACCEPTED if queued else status.HTTP_200_OK
+    )
 
 
 # Budget Summary endpoint
+@cache_disaster_response
 @api_view(['GET'])
 def budget_summary_view(request):
     """
@@ -302,32 +501,35 @@ def budget_summary_view(request):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Get all assessments
-    assessments = DamageAssessment.objects.filter(disaster_id=disaster_id)
+    # Pre-aggregated per barangay x status x amount (see api/rollup.py), so
+    # this reads a few rows per barangay whatever the number of households
+    rollups = BudgetRollup.objects.filter(disaster_id=disaster_id, count__gt=0).values_list(
+        'barangay', 'damage_status', 'ect_amount', 'count', 'count_4ps', 'amount_total',
+    )
     
     # Calculate statistics
     total_budget = 0
-    total_households = assessments.count()
+    total_households = 0
     by_status = {'TOTAL': 0, 'PARTIAL': 0, 'NONE': 0}
     by_barangay = {}
     by_amount = {0: 0, 5000: 0, 10000: 0}
     total_4ps = 0
     
-    for assessment in assessments:
-        household = assessment.household
-        amount = int(float(assessment.recommended_ect_amount))
+    for barangay, damage_status, ect_amount, count, count_4ps, amount_total in rollups:
+        amount = int(float(ect_amount))
+        budget = int(amount_total)
         
-        total_budget += amount
-        by_status[assessment.damage_status] = by_status.get(assessment.damage_status, 0) + 1
-        by_amount[amount] = by_amount.get(amount, 0) + 1
+        total_households += count
+        total_budget += budget
+        by_status[damage_status] = by_status.get(damage_status, 0) + count
+        by_amount[amount] = by_amount.get(amount, 0) + count
         
-        if household.barangay not in by_barangay:
-            by_barangay[household.barangay] = {'count': 0, 'budget': 0}
-        by_barangay[household.barangay]['count'] += 1
-        by_barangay[household.barangay]['budget'] += amount
+        if barangay not in by_barangay:
+            by_barangay[barangay] = {'count': 0, 'budget': 0}
+        by_barangay[barangay]['count'] += count
+        by_barangay[barangay]['budget'] += budget
         
-        if household.is_4ps:
-            total_4ps += 1
+        total_4ps += count_4ps
     
     return Response({
         'disaster_name': disaster.name,
@@ -341,15 +543,110 @@ def budget_summary_view(request):
     })
 
 
+# Payout what-if simulation
+@api_view(['POST'])
+def budget_simulate_view(request):
+    """
+    Price alternative payout rule sets for a disaster (see
+    api/payout_simulator.py). POST {"disaster_id": ..., "scenarios": [{"name",
+    "amounts": {"TOTAL", "PARTIAL", "NONE"}, "bonus_4ps"}, ...]}; returns the
+    total and per-barangay budget of every scenario next to the current one.
+    Amounts left out keep the disaster's current payout rule.
+    """
+    disaster_id = request.data.get('disaster_id')
+    if not disaster_id:
+        return Response(
+            {'error': 'disaster_id is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        disaster = DisasterEvent.objects.get(pk=disaster_id)
+    except (DisasterEvent.DoesNotExist, ValueError):
+        return Response(
+            {'error': 'Disaster not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        scenarios = parse_scenarios(request.data.get('scenarios'), defaults=current_payouts(disaster.pk))
+    except ScenarioError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    simulator = PayoutSimulator(disaster.pk)
+    return Response({
+        'disaster_name': disaster.name,
+        'total_households': simulator.households,
+        'current': simulator.current(),
+        'scenarios': simulator.evaluate(scenarios),
+    })
+
+
+# Payout rule sets
+@api_view(['GET', 'POST'])
+def payout_rules_view(request):
+    """
+    List a disaster's payout rule set versions, newest (in force) first
+    (GET ?disaster_id=), or adopt new amounts (POST {"disaster_id",
+    "amounts": {"TOTAL", "PARTIAL", "NONE"}, "notes"}): stores the next
+    version and re-prices every assessment of the disaster (see
+    api/payouts.py).
+    """
+    disaster_id = request.data.get('disaster_id') if request.method == 'POST' else request.GET.get('disaster_id')
+    if not disaster_id:
+        return Response(
+            {'error': 'disaster_id is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        disaster = DisasterEvent.objects.get(pk=disaster_id)
+    except (DisasterEvent.DoesNotExist, ValueError):
+        return Response(
+            {'error': 'Disaster not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if request.method == 'GET':
+        return Response({
+            'current': current_payouts(disaster.pk),
+            'versions': PayoutRuleSetSerializer(disaster.payout_rule_sets.all(), many=True).data,
+        })
+
+    try:
+        amounts = parse_amounts(request.data.get('amounts'))
+    except PayoutRuleError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    rule_set = PayoutRuleSet(
+        disaster=disaster,
+        total_amount=amounts['TOTAL'],
+        partial_amount=amounts['PARTIAL'],
+        none_amount=amounts['NONE'],
+        notes=str(request.data.get('notes') or ''),
+        created_by=str(request.data.get('created_by') or '')[:100],
+    )
+    repriced = create_rule_set(rule_set)
+    return Response(
+        {'rule_set': PayoutRuleSetSerializer(rule_set).data, 'repriced': repriced},
+        status=status.HTTP_201_CREATED
+    )
+
+
 # Export to CSV endpoint
+@cache_disaster_response
 @api_view(['GET'])
 def export_csv_view(request):
     """
-    Export assessment data to CSV
+    Export assessment data to CSV, streamed in chunks (see api/export.py).
+    Pass gzip=1 to download it gzip-compressed (.csv.gz).
     """
-    from django.http import HttpResponse
-    import csv
-    
     disaster_id = request.GET.get('disaster_id')
     
     if not disaster_id:
@@ -366,35 +663,63 @@ def export_csv_view(request):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Get all assessments
-    assessments = DamageAssessment.objects.filter(disaster_id=disaster_id).select_related('household')
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="bantayayuda_export_{disaster.name.replace(" ", "_")}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow([
-        'Household ID', 'Name', 'Address', 'Barangay', 
-        'Latitude', 'Longitude', 'Damage Status', 'ECT Amount (PHP)',
-        'Flood Depth (m)', 'House Height (m)', 'House Width (m)', '4Ps Recipient'
-    ])
-    
-    for assessment in assessments:
-        household = assessment.household
-        writer.writerow([
-            household.household_id or '',
-            household.name,
-            household.address,
-            household.barangay,
-            float(household.latitude),
-            float(household.longitude),
-            assessment.damage_status,
-            int(float(assessment.recommended_ect_amount)),
-            household.flood_depth,
-            household.house_height,
-            household.house_width,
-            'Yes' if household.is_4ps else 'No'
-        ])
+    filename = f'bantayayuda_export_{disaster.name.replace(" ", "_")}.csv'
+    chunks = stream_csv(export_rows(disaster.pk))
+    if request.GET.get('gzip') in ('1', 'true'):
+        response = StreamingHttpResponse(gzip_stream(chunks), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
     return response
+
+
+# Typed columnar export (Parquet / Feather)
+@api_view(['GET'])
+def export_parquet_view(request):
+    """
+    Export assessments and their stored predictions with dtypes, for
+    pandas/Arrow (see api/parquet_export.py). disaster_id takes one id or
+    several (comma-separated or repeated); output=feather returns an Arrow
+    IPC file instead of Parquet (DRF reserves ?format=). Not cached: the
+    file may span disasters.
+    """
+    try:
+        disaster_ids = sorted({
+            int(value) for param in request.GET.getlist('disaster_id') for value in param.split(',') if value
+        })
+    except ValueError:
+        return Response(
+            {'error': 'disaster_id must be a list of ids'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not disaster_ids:
+        return Response(
+            {'error': 'disaster_id parameter is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    file_format = request.GET.get('output', 'parquet')
+    if file_format not in FORMATS:
+        return Response(
+            {'error': f'output must be one of: {", ".join(FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    disasters = list(DisasterEvent.objects.filter(pk__in=disaster_ids))
+    if len(disasters) != len(disaster_ids):
+        missing = sorted(set(disaster_ids) - {disaster.pk for disaster in disasters})
+        return Response(
+            {'error': f'Disaster not found: {", ".join(map(str, missing))}'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    content_type, extension = FORMATS[file_format]
+    if len(disasters) == 1:
+        stem = disasters[0].name.replace(" ", "_")
+    else:
+        stem = f'{len(disasters)}_disasters'
+    response = StreamingHttpResponse(stream_export(disaster_ids, file_format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="bantayayuda_export_{stem}.{extension}"'
+    return response
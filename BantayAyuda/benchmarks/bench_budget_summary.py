@@ -0,0 +1,79 @@
+"""
+Budget summary benchmark: /api/budget/summary/ (read from the budget rollup,
+api/rollup.py) against the original per-assessment Python tally, which
+loaded every assessment and its household one query at a time. Also reports
+what keeping the rollup up to date adds to a single assessment save.
+
+The response cache is cleared before each request, so every timing is a
+full recomputation.
+
+    python benchmarks/bench_budget_summary.py [n_households ...]
+"""
+import sys
+import warnings
+
+from common import best_of, seed, test_database
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.models import DamageAssessment
+
+
+def python_tally(disaster_id):
+    """The previous implementation: one household query per assessment"""
+    total_budget = 0
+    by_barangay = {}
+    total_4ps = 0
+    for assessment in DamageAssessment.objects.filter(disaster_id=disaster_id):
+        household = assessment.household
+        amount = int(float(assessment.recommended_ect_amount))
+        total_budget += amount
+        barangay = by_barangay.setdefault(household.barangay, {'count': 0, 'budget': 0})
+        barangay['count'] += 1
+        barangay['budget'] += amount
+        total_4ps += household.is_4ps
+    return total_budget, by_barangay, total_4ps
+
+
+def main(sizes, legacy_limit=20000):
+    warnings.filterwarnings('ignore', 'Limit for query logging')  # The old tally's N+1
+    client = Client()
+    print("=" * 72)
+    print("Budget summary: rollup read vs per-assessment tally")
+    print("=" * 72)
+    print(f"{'households':>10} {'summary ms':>11} {'queries':>8} {'python tally ms':>16} {'save ms':>8}")
+    for n in sizes:
+        with test_database():
+            disaster = seed(n)
+
+            def summary():
+                cache.clear()
+                response = client.get('/api/budget/summary/', {'disaster_id': disaster.pk})
+                assert response.status_code == 200
+                return response.json()
+
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                data = summary()
+            elapsed, _ = best_of(summary)
+
+            legacy = '(skipped)'
+            if n <= legacy_limit:
+                legacy_time, (total_budget, by_barangay, total_4ps) = best_of(lambda: python_tally(disaster.pk), repeat=1)
+                assert (total_budget, by_barangay, total_4ps) == (
+                    data['total_budget'], data['by_barangay'], data['total_4ps'])
+                legacy = f'{legacy_time * 1000:.0f}'
+            assessment = DamageAssessment.objects.filter(disaster=disaster).first()
+
+            def flip_status():
+                assessment.damage_status = 'TOTAL' if assessment.damage_status != 'TOTAL' else 'PARTIAL'
+                assessment.save()
+            save_time, _ = best_of(flip_status, repeat=20)
+            print(f"{n:>10} {elapsed * 1000:>11.1f} {len(queries):>8} {legacy:>16} {save_time * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,73 @@
+"""
+ECT inference latency benchmark: CatBoost (Pool + predict_proba) vs the
+NumPy oblivious-tree evaluator (api/tree_eval.py).
+
+Times a single-household prediction and batches of several sizes on the
+model's feature frame, and checks both paths agree.
+
+    python benchmarks/bench_ect_inference.py [batch_size ...]
+"""
+import sys
+
+import numpy as np
+from catboost import Pool
+
+from common import best_of
+
+from api import ml_engine
+
+
+def feature_rows(n):
+    rng = np.random.default_rng(42)
+    statuses = ['TOTAL', 'PARTIAL', 'NONE']
+    barangays = ['Tondo', 'Baseco', 'Navotas']
+    return [
+        {
+            'barangay': barangays[i % 3],
+            'latitude': 14.55 + rng.random() * 0.12,
+            'longitude': 120.93 + rng.random() * 0.12,
+            'flood_depth': float(rng.exponential(1.0)),
+            'house_height': float(rng.normal(4.5, 1.0)),
+            'house_width': float(rng.normal(8.0, 2.0)),
+            'damage_status': statuses[i % 3],
+            'is_4ps': i % 3 == 0,
+        }
+        for i in range(n)
+    ]
+
+
+def main(sizes):
+    loaded = ml_engine.get_model()
+    if loaded is None or loaded.compiled is None:
+        print("No compiled ML model available; nothing to compare.")
+        return
+    model, compiled = loaded.model, loaded.compiled
+
+    def catboost_proba(X):
+        return np.asarray(model.predict_proba(Pool(X, cat_features=model.get_cat_feature_indices())))
+
+    print("=" * 72)
+    print("ECT inference latency: CatBoost vs NumPy oblivious trees")
+    print("=" * 72)
+    print(f"{'rows':>8} {'catboost ms':>12} {'numpy ms':>10} {'speedup':>8} {'us/row (numpy)':>15}")
+
+    for size in sorted(sizes):
+        columns = ml_engine.build_feature_columns(feature_rows(size))
+        X = ml_engine.build_feature_frame(feature_rows(size))[model.feature_names_]
+        repeat = 50 if size <= 100 else 5
+
+        catboost_time, expected = best_of(lambda: catboost_proba(X), repeat=repeat)
+        numpy_time, actual = best_of(lambda: compiled.predict_proba(columns), repeat=repeat)
+        assert np.allclose(expected, actual, atol=1e-9)
+
+        print(f"{size:>8} {catboost_time * 1000:>12.3f} {numpy_time * 1000:>10.3f} "
+              f"{catboost_time / numpy_time:>7.1f}x {numpy_time / size * 1e6:>15.2f}")
+
+    # End-to-end single prediction as the views call it (feature columns included)
+    row = feature_rows(1)
+    single_time, _ = best_of(lambda: ml_engine.predict_ect_batch(row), repeat=200)
+    print(f"\npredict_ect_batch, 1 row (features + NumPy evaluator): {single_time * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1, 10, 100, 1000, 10000, 100000])
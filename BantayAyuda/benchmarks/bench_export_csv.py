@@ -0,0 +1,90 @@
+"""
+CSV export benchmark: /api/export/csv/ streamed (api/export.py), plain and
+gzip, against the previous export that built the whole file in an
+HttpResponse from model instances.
+
+Python memory is traced (tracemalloc) only while the response body is
+consumed, so seeding doesn't count. The streamed export must stay flat:
+its peak at the largest size may not exceed FLAT_FACTOR times its peak at
+the smallest.
+
+    python benchmarks/bench_export_csv.py [n_households ...]
+"""
+import csv
+import sys
+import time
+import tracemalloc
+
+from common import seed, test_database
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client
+
+from api.models import DamageAssessment
+
+FLAT_FACTOR = 1.5
+
+
+def legacy_export(disaster_id):
+    """The previous implementation, minus the request handling"""
+    response = HttpResponse(content_type='text/csv')
+    writer = csv.writer(response)
+    writer.writerow(['Household ID', 'Name', 'Address', 'Barangay', 'Latitude', 'Longitude', 'Damage Status',
+                     'ECT Amount (PHP)', 'Flood Depth (m)', 'House Height (m)', 'House Width (m)', '4Ps Recipient'])
+    for assessment in DamageAssessment.objects.filter(disaster_id=disaster_id).select_related('household'):
+        household = assessment.household
+        writer.writerow([
+            household.household_id or '', household.name, household.address, household.barangay,
+            float(household.latitude), float(household.longitude), assessment.damage_status,
+            int(float(assessment.recommended_ect_amount)), household.flood_depth, household.house_height,
+            household.house_width, 'Yes' if household.is_4ps else 'No',
+        ])
+    return len(response.content)
+
+
+def traced(fn):
+    """Run ``fn``; return (seconds, peak traced MB, result)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(sizes, legacy_limit=100000):
+    client = Client()
+    print("=" * 72)
+    print("CSV export: streamed vs built in memory")
+    print("=" * 72)
+    print(f"{'rows':>9} {'variant':>8} {'seconds':>8} {'rows/s':>9} {'peak MB':>8} {'MB out':>7}")
+    peaks = []
+    for n in sizes:
+        with test_database():
+            disaster = seed(n)
+            for variant, params in (('stream', {}), ('gzip', {'gzip': '1'})):
+                def export():
+                    cache.clear()
+                    response = client.get('/api/export/csv/', {'disaster_id': disaster.pk, **params})
+                    assert response.status_code == 200 and response.streaming
+                    return sum(len(chunk) for chunk in response.streaming_content)
+
+                if not peaks:
+                    export()  # Warm up imports and caches outside the trace
+                elapsed, peak, size = traced(export)
+                if variant == 'stream':
+                    peaks.append(peak)
+                print(f"{n:>9} {variant:>8} {elapsed:>8.2f} {n / elapsed:>9,.0f} {peak:>8.1f} {size / 2 ** 20:>7.1f}")
+
+            if n <= legacy_limit:
+                elapsed, peak, size = traced(lambda: legacy_export(disaster.pk))
+                print(f"{n:>9} {'legacy':>8} {elapsed:>8.2f} {n / elapsed:>9,.0f} {peak:>8.1f} {size / 2 ** 20:>7.1f}")
+
+    assert peaks[-1] <= peaks[0] * FLAT_FACTOR, f'Streamed export memory grew: {peaks[0]:.1f} -> {peaks[-1]:.1f} MB'
+    print(f"\nStreamed peak stays flat: {peaks[0]:.1f} MB at {sizes[0]} rows, {peaks[-1]:.1f} MB at {sizes[-1]}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
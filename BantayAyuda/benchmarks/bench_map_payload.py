@@ -0,0 +1,49 @@
+"""
+Map payload benchmark: GeoJSON vs the columnar binary format.
+
+Compares payload size (raw and gzipped) and encode time of the
+/api/households/geojson/ responses for a few city sizes.
+
+    python benchmarks/bench_map_payload.py [n_households ...]
+"""
+import gzip
+import json
+import sys
+
+from common import best_of, seed, test_database
+
+from api.columnar import decode_columnar, encode_columnar
+from api.geojson import build_feature, household_rows
+
+
+def encode_geojson(disaster_id):
+    features = [build_feature(row) for row in household_rows(disaster_id)]
+    return json.dumps({'type': 'FeatureCollection', 'features': features}).encode()
+
+
+def main(sizes):
+    print("=" * 72)
+    print("Map payload benchmark: GeoJSON vs columnar")
+    print("=" * 72)
+    print(f"{'households':>10} {'format':>9} {'bytes':>12} {'gzip bytes':>12} {'encode ms':>10}")
+
+    with test_database():
+        seeded = 0
+        disaster = None
+        for size in sorted(sizes):
+            disaster = seed(size - seeded, disaster)
+            seeded = size
+
+            geojson_time, geojson = best_of(lambda: encode_geojson(disaster.pk), repeat=3)
+            columnar_time, columnar = best_of(lambda: encode_columnar(disaster.pk), repeat=3)
+            assert len(decode_columnar(columnar)['id']) == size
+
+            for name, payload, seconds in (('geojson', geojson, geojson_time), ('columnar', columnar, columnar_time)):
+                print(f"{size:>10} {name:>9} {len(payload):>12,} {len(gzip.compress(payload)):>12,} {seconds * 1000:>10.1f}")
+            print(f"{'':>10} {'ratio':>9} {len(geojson) / len(columnar):>11.1f}x "
+                  f"{len(gzip.compress(geojson)) / len(gzip.compress(columnar)):>11.1f}x "
+                  f"{geojson_time / columnar_time:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
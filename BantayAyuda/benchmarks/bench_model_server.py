@@ -0,0 +1,86 @@
+"""
+Shared model server benchmark (api/model_server.py).
+
+Reports the resident memory a worker spends on loading the model (what the
+model server saves per worker), then has concurrent client threads send
+single-household predictions and reports throughput and how many requests
+the server merged into each model call.
+
+    python benchmarks/bench_model_server.py [threads ...]
+"""
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from common import best_of
+
+
+REQUESTS_PER_THREAD = 200
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_clients(client, threads):
+    from bench_ect_inference import feature_rows
+
+    rows = feature_rows(threads)
+
+    def worker(row):
+        for _ in range(REQUESTS_PER_THREAD):
+            client.predict([row])
+        client.close()
+
+    workers = [threading.Thread(target=worker, args=(row,)) for row in rows]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main(thread_counts):
+    # What every worker predicting in-process pays: the ML stack and the model
+    before = max_rss_mb()
+    from api import ml_engine
+    from api.model_server import ModelServer, ModelServerClient
+    from bench_ect_inference import feature_rows
+
+    if ml_engine.get_model() is None:
+        print("No ML model available; nothing to serve.")
+        return
+    print(f"ML stack + model: +{max_rss_mb() - before:.0f} MB resident per process that loads them")
+
+    row = feature_rows(1)
+    in_process_time, _ = best_of(lambda: ml_engine.predict_in_process(row), repeat=200)
+    print(f"In-process, 1 row: {in_process_time * 1000:.3f} ms\n")
+
+    address = 'unix:' + os.path.join(tempfile.mkdtemp(), 'model.sock')
+    server = ModelServer(address, predict=ml_engine.predict_in_process)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ModelServerClient(address)
+
+    print("=" * 72)
+    print(f"Model server: {REQUESTS_PER_THREAD} single-row requests per client thread")
+    print("=" * 72)
+    print(f"{'threads':>8} {'requests/s':>11} {'ms/request':>11} {'model calls':>12} {'rows/call':>10}")
+    try:
+        for threads in thread_counts:
+            batches, requests = server.batcher.batches, server.batcher.requests
+            elapsed = run_clients(client, threads)
+            calls = server.batcher.batches - batches
+            served = server.batcher.requests - requests
+            print(f"{threads:>8} {served / elapsed:>11.0f} {elapsed / REQUESTS_PER_THREAD * 1000:>11.3f} "
+                  f"{calls:>12} {served / calls:>10.1f}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1, 4, 16, 64])
@@ -0,0 +1,78 @@
+"""
+Typed export benchmark: /api/export/parquet/ (api/parquet_export.py) as
+Parquet and Feather against the streamed CSV export, then what an analyst
+pays to load each file into pandas, in full and for two columns.
+
+Python memory is traced only while a response body is consumed, so seeding
+doesn't count; the typed export must stay flat like the CSV one (peak at the
+largest size at most FLAT_FACTOR times the smallest).
+
+    python benchmarks/bench_parquet_export.py [n_households ...]
+"""
+import io
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import best_of, seed, test_database
+
+import pandas as pd
+from django.test import Client
+
+FLAT_FACTOR = 1.5
+PRUNED = ['barangay', 'ect_amount']
+
+
+def download(client, url, params):
+    """Consume a streamed export into a file; return (seconds, peak traced MB, body)"""
+    with tempfile.TemporaryFile() as body:
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(url, params)
+        assert response.status_code == 200 and response.streaming
+        for chunk in response.streaming_content:
+            body.write(chunk)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        body.seek(0)
+        return elapsed, peak, body.read()
+
+
+def main(sizes):
+    client = Client()
+    exports = {
+        'csv': ('/api/export/csv/', {}, lambda data, **kw: pd.read_csv(io.BytesIO(data), **kw)),
+        'parquet': ('/api/export/parquet/', {}, lambda data, **kw: pd.read_parquet(io.BytesIO(data), **kw)),
+        'feather': ('/api/export/parquet/', {'output': 'feather'},
+                    lambda data, **kw: pd.read_feather(io.BytesIO(data), **kw)),
+    }
+    csv_columns = {'barangay': 'Barangay', 'ect_amount': 'ECT Amount (PHP)'}
+    print("=" * 72)
+    print("Typed export vs CSV: download and pandas load")
+    print("=" * 72)
+    print(f"{'rows':>9} {'format':>8} {'export s':>9} {'peak MB':>8} {'MB':>6} {'load ms':>8} {'2 cols ms':>10}")
+    peaks = []
+    for n in sizes:
+        with test_database():
+            disaster = seed(n)
+            for name, (url, params, load) in exports.items():
+                _, _, data = download(client, url, {'disaster_id': disaster.pk, **params})  # Warm up
+                elapsed, peak, data = download(client, url, {'disaster_id': disaster.pk, **params})
+                if name == 'parquet':
+                    peaks.append(peak)
+                columns = [csv_columns[c] for c in PRUNED] if name == 'csv' else PRUNED
+                kwargs = {'usecols': columns} if name == 'csv' else {'columns': columns}
+                load_time, frame = best_of(lambda: load(data), repeat=3)
+                assert len(frame) == n
+                pruned_time, _ = best_of(lambda: load(data, **kwargs), repeat=3)
+                print(f"{n:>9} {name:>8} {elapsed:>9.2f} {peak:>8.1f} {len(data) / 2 ** 20:>6.1f} "
+                      f"{load_time * 1000:>8.0f} {pruned_time * 1000:>10.0f}")
+
+    if len(peaks) > 1:
+        assert peaks[-1] <= peaks[0] * FLAT_FACTOR, f'Parquet export memory grew: {peaks[0]:.1f} -> {peaks[-1]:.1f} MB'
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 500000])
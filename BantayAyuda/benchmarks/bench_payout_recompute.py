@@ -0,0 +1,47 @@
+"""
+Payout recompute benchmark (api/payouts.py): re-pricing a disaster after a
+new rule set with one CASE UPDATE (plus re-keying the budget rollup), against
+re-saving every assessment. The re-save is timed on a sample and
+extrapolated.
+
+    python benchmarks/bench_payout_recompute.py [n_households ...]
+"""
+import sys
+import time
+
+from common import seed, test_database
+
+from django.db import connection, transaction
+
+from api.models import DamageAssessment, PayoutRuleSet
+from api.payouts import create_rule_set
+from api.rollup import verify
+
+
+def main(sizes, sample=2000):
+    print("=" * 72)
+    print("Payout recompute: one CASE UPDATE vs save() per assessment")
+    print("=" * 72)
+    print(f"{'assessments':>11} {'repriced':>9} {'recompute ms':>13} {'per-row save s':>15}")
+    for n in sizes:
+        with test_database():
+            disaster = seed(n)
+            connection.queries_log.clear()
+            rule_set = PayoutRuleSet(disaster=disaster, total_amount=9000, partial_amount=7000, none_amount=0)
+            start = time.perf_counter()
+            repriced = create_rule_set(rule_set)
+            elapsed = time.perf_counter() - start
+            assert repriced == DamageAssessment.objects.filter(disaster=disaster).exclude(damage_status='NONE').count()
+            assert verify([disaster.pk]) == []
+
+            assessments = list(DamageAssessment.objects.filter(disaster=disaster)[:sample])
+            start = time.perf_counter()
+            with transaction.atomic():
+                for assessment in assessments:
+                    assessment.save()
+            per_row = (time.perf_counter() - start) / len(assessments) * n
+            print(f"{n:>11} {repriced:>9} {elapsed * 1000:>13.0f} {per_row:>15.1f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
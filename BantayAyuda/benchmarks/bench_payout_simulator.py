@@ -0,0 +1,80 @@
+"""
+Payout simulator benchmark (api/payout_simulator.py): loading a disaster's
+household counts (from the budget rollup) into NumPy arrays, pricing batches of scenarios, and the whole
+POST /api/budget/simulate/ request, against pricing each scenario with a
+Python loop over the households.
+
+    python benchmarks/bench_payout_simulator.py [n_households ...]
+"""
+import random
+import sys
+
+from common import best_of, seed, test_database
+
+from django.test import Client
+
+from api.models import DamageAssessment
+from api.payout_simulator import MAX_PAYOUT, STATUSES, PayoutSimulator, parse_scenarios
+
+
+def random_scenarios(count, rng):
+    return parse_scenarios([
+        {
+            'name': f'Scenario {i + 1}',
+            'amounts': {status: rng.randrange(0, MAX_PAYOUT + 1, 500) for status in STATUSES},
+            'bonus_4ps': rng.randrange(0, 5001, 500),
+        }
+        for i in range(count)
+    ])
+
+
+def python_pricing(simulator_rows, scenarios):
+    """One pass over the households per scenario"""
+    totals = []
+    for scenario in scenarios:
+        amounts, bonus = scenario['amounts'], scenario['bonus_4ps']
+        total = 0
+        for status, is_4ps in simulator_rows:
+            amount = amounts[status]
+            total += amount + bonus if amount and is_4ps else amount
+        totals.append(total)
+    return totals
+
+
+def main(sizes, scenario_counts=(1, 100, 500, 1000), python_limit=100):
+    rng = random.Random(0)
+    client = Client()
+    print("=" * 72)
+    print("Payout simulator: counts tensor vs per-household loop")
+    print("=" * 72)
+    for n in sizes:
+        with test_database():
+            disaster = seed(n)
+            load_time, simulator = best_of(lambda: PayoutSimulator(disaster.pk))
+            print(f"\n{n} households, {len(simulator.barangays)} barangays: load {load_time * 1000:.1f} ms")
+            print(f"{'scenarios':>10} {'evaluate ms':>12} {'request ms':>11} {'python loop ms':>15}")
+
+            rows = list(DamageAssessment.objects.filter(disaster=disaster).values_list(
+                'damage_status', 'household__is_4ps'))
+            for count in scenario_counts:
+                scenarios = random_scenarios(count, rng)
+                evaluate_time, results = best_of(lambda: simulator.evaluate(scenarios))
+
+                body = {'disaster_id': disaster.pk, 'scenarios': scenarios}
+
+                def request():
+                    response = client.post('/api/budget/simulate/', body, content_type='application/json')
+                    assert response.status_code == 200
+                    return response
+                request_time, _ = best_of(request)
+
+                python = '(skipped)'
+                if count <= python_limit:
+                    python_time, totals = best_of(lambda: python_pricing(rows, scenarios), repeat=1)
+                    assert totals == [r['total_budget'] for r in results]
+                    python = f'{python_time * 1000:.0f}'
+                print(f"{count:>10} {evaluate_time * 1000:>12.1f} {request_time * 1000:>11.1f} {python:>15}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
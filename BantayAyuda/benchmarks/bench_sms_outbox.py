@@ -0,0 +1,88 @@
+"""
+SMS outbox throughput (api/outbox.py): messages per minute that the
+run_sms_workers command claims, sends and marks SENT, by worker count and
+batch size, through the file gateway. A second run has the gateway reject
+a share of the messages to include the retry bookkeeping.
+
+    python benchmarks/bench_sms_outbox.py [--messages 20000]
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from common import seed, test_database
+
+from django.core.management import call_command
+from django.db import connection
+
+from api.models import Household, SmsMessage
+from api.outbox import FileGateway
+
+
+class RejectingGateway(FileGateway):
+    """File gateway that rejects every ``every``-th message of a batch"""
+
+    def __init__(self, path, every):
+        super().__init__(path)
+        self.every = every
+
+    def send(self, messages):
+        super().send(messages)
+        return {m['key']: 'Invalid number' for m in messages[::self.every]}
+
+
+def queue_messages(disaster):
+    SmsMessage.objects.all().delete()
+    SmsMessage.objects.bulk_create([
+        SmsMessage(
+            household_id=pk, disaster=disaster, phone=phone, text=f'Stub SMS para sa household {pk}.',
+            idempotency_key=SmsMessage.key_for(pk, disaster.pk),
+        )
+        for pk, phone in Household.objects.values_list('pk', 'contact_number')
+    ], batch_size=5000)
+
+
+def run_workers(gateway, workers, batch_size):
+    with mock.patch('api.management.commands.run_sms_workers.get_gateway', return_value=gateway):
+        start = time.perf_counter()
+        call_command('run_sms_workers', '--once', '--workers', str(workers), '--batch-size', str(batch_size),
+                     stdout=io.StringIO())
+    return time.perf_counter() - start
+
+
+def main(n_messages, configurations):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'outbox.jsonl')
+    # A file database, like production: the in-memory test database locks
+    # whole tables and would fail concurrent workers instead of waiting
+    connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    with test_database():
+        disaster = seed(n_messages)
+
+        print("=" * 72)
+        print(f"SMS outbox: {n_messages} messages through the file gateway")
+        print("=" * 72)
+        print(f"{'workers':>8} {'batch':>6} {'seconds':>8} {'messages/min':>13}")
+        for workers, batch_size in configurations:
+            queue_messages(disaster)
+            elapsed = run_workers(FileGateway(path), workers, batch_size)
+            assert SmsMessage.objects.filter(status=SmsMessage.Status.SENT).count() == n_messages
+            print(f"{workers:>8} {batch_size:>6} {elapsed:>8.2f} {n_messages / elapsed * 60:>13,.0f}")
+
+        queue_messages(disaster)
+        elapsed = run_workers(RejectingGateway(path, every=10), 2, 200)
+        retried = SmsMessage.objects.filter(status=SmsMessage.Status.PENDING, attempts=1).count()
+        print(f"\nwith 10% rejected: {elapsed:.2f} s ({n_messages / elapsed * 60:,.0f} messages/min), "
+              f"{retried} scheduled for retry")
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.messages, [(1, 50), (1, 200), (2, 200), (4, 200), (4, 1000)])
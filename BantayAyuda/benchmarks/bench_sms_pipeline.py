@@ -0,0 +1,117 @@
+"""
+SMS generation throughput: serial generate_sms calls vs the concurrent,
+rate-limited pipeline (api/sms_pipeline.py).
+
+Runs against a local stub of the Gemini REST endpoint with a fixed latency,
+so the numbers show how throughput follows the rate limit rather than the
+LLM latency. The first runs give every message its own barangay (no shared
+templates); the last one is a disaster spread over --barangays barangays,
+where the template cache needs one LLM call per (amount, barangay).
+
+    python benchmarks/bench_sms_pipeline.py [--messages 10000] [--latency-ms 50] [--rate 500]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common  # noqa: F401  (sets Django up)
+
+from api.sms_pipeline import SmsPipeline, template_cache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        household_id = re.search(r'Household ID: (\S+)', body['contents'][0]['parts'][0]['text']).group(1)
+        time.sleep(self.server.latency)
+        payload = json.dumps({'candidates': [{'content': {'parts': [
+            {'text': f'Stub SMS para sa {household_id}. #DSWDMayMalasakit'},
+        ]}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def make_messages(n_messages, n_barangays=None):
+    amounts = [5000, 10000]
+    return [
+        {
+            'amount': amounts[i % 2],
+            'household_id': f'HH-{i:07d}',
+            'brgy': f'Barangay {i % n_barangays if n_barangays else i}',
+            'status': 'PARTIAL' if amounts[i % 2] == 5000 else 'TOTAL',
+        }
+        for i in range(n_messages)
+    ]
+
+
+def main(n_messages, latency, rate, concurrency, n_barangays):
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/v1beta/models/stub:generateContent'
+
+    messages = make_messages(n_messages)
+
+    print("=" * 72)
+    print(f"SMS generation: {n_messages} messages, {latency * 1000:.0f} ms stub latency")
+    print("=" * 72)
+
+    # Serial: one call at a time, like generate_sms per household (sampled)
+    serial = SmsPipeline(url=url, api_key='bench', concurrency=1, rate=1e9, burst=1, deadline=0)
+    sample = messages[:min(50, n_messages)]
+    start = time.perf_counter()
+    serial.run(sample)
+    per_message = (time.perf_counter() - start) / len(sample)
+    print(f"serial (estimated from {len(sample)}):  {per_message * n_messages:>8.1f} s "
+          f"({1 / per_message:>7.0f} msg/s)")
+
+    template_cache().clear()
+    pipeline = SmsPipeline(url=url, api_key='bench', concurrency=concurrency, rate=rate, burst=concurrency,
+                           timeout=10, deadline=0)
+    start = time.perf_counter()
+    texts = pipeline.run(messages)
+    elapsed = time.perf_counter() - start
+    assert len(texts) == n_messages
+    print(f"pipeline ({concurrency} in flight):     {elapsed:>8.1f} s ({n_messages / elapsed:>7.0f} msg/s)")
+    print(f"rate limit bound:              {n_messages / rate:>8.1f} s ({rate:>7.0f} msg/s)")
+    print(f"outcomes: {pipeline.stats}")
+
+    template_cache().clear()
+    disaster = make_messages(n_messages, n_barangays)
+    pipeline = SmsPipeline(url=url, api_key='bench', concurrency=concurrency, rate=rate, burst=concurrency,
+                           timeout=10, deadline=0)
+    start = time.perf_counter()
+    pipeline.run(disaster)
+    elapsed = time.perf_counter() - start
+    print(f"\ndisaster over {n_barangays} barangays:  {elapsed:>8.1f} s, {pipeline.llm_calls} LLM calls "
+          f"for {n_messages} messages")
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--rate', type=float, default=500, help='Calls per second allowed')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--barangays', type=int, default=100)
+    args = parser.parse_args()
+    main(args.messages, args.latency_ms / 1000, args.rate, args.concurrency, args.barangays)
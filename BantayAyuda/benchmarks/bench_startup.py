@@ -0,0 +1,163 @@
+"""
+Startup benchmark: import time and first-request latency.
+
+Every measurement runs in a fresh interpreter, so nothing is warm:
+
+    django.setup()        settings, apps and models
+    import api.urls       every view module (what each worker imports)
+    manage.py check       a management command end to end
+    first request         first non-ML and first ML request of a process
+
+and reports which heavy modules (NumPy, pandas, CatBoost, Gemini) each step
+loaded. The ML stack should only appear with the first ML request.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--history startup.jsonl]
+
+--history appends the results as one JSON line (with the git commit) so
+startup can be tracked over time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'pandas', 'catboost', 'google.generativeai']
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+# --- Measurements, each run in a child process ---
+
+def child_imports():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'BantayAyuda.settings')
+    sys.path.insert(0, PROJECT_DIR)
+
+    start = time.perf_counter()
+    import django
+    django.setup()
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    import api.urls  # noqa: F401
+    urls = time.perf_counter() - start
+    return {'setup': setup, 'urls': urls, 'heavy_modules': loaded_heavy_modules()}
+
+
+def child_requests():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    from common import seed, test_database  # Sets Django up
+    import api.urls  # noqa: F401
+    imports = time.perf_counter() - start
+
+    from django.core.cache import cache
+    from django.test import Client
+
+    client = Client()
+    results = {'imports': imports}
+    with test_database():
+        disaster = seed(200)
+        cache.clear()
+
+        start = time.perf_counter()
+        client.get('/api/budget/summary/', {'disaster_id': disaster.pk})
+        results['first_request'] = time.perf_counter() - start
+        results['heavy_after_first_request'] = loaded_heavy_modules()
+
+        start = time.perf_counter()
+        response = client.get('/api/ml/predict/', {'disaster_id': disaster.pk})
+        results['first_ml_request'] = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+
+        cache.clear()
+        start = time.perf_counter()
+        client.get('/api/ml/predict/', {'disaster_id': disaster.pk})
+        results['warm_ml_request'] = time.perf_counter() - start
+        results['heavy_after_ml_request'] = loaded_heavy_modules()
+    return results
+
+
+CHILDREN = {'imports': child_imports, 'requests': child_requests}
+
+
+# --- Driver ---
+
+def run_child(name):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', name],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_command(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'manage.py', *args], cwd=PROJECT_DIR, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(repeat, history):
+    imports = [run_child('imports') for _ in range(repeat)]
+    checks = [run_command(['check']) for _ in range(repeat)]
+    requests = [run_child('requests') for _ in range(repeat)]
+
+    def median(runs, key):
+        return statistics.median(run[key] for run in runs)
+
+    results = {
+        'django_setup_ms': median(imports, 'setup') * 1000,
+        'import_urls_ms': median(imports, 'urls') * 1000,
+        'manage_check_ms': statistics.median(checks) * 1000,
+        'first_request_ms': median(requests, 'first_request') * 1000,
+        'first_ml_request_ms': median(requests, 'first_ml_request') * 1000,
+        'warm_ml_request_ms': median(requests, 'warm_ml_request') * 1000,
+    }
+
+    print("=" * 72)
+    print(f"Startup benchmark (median of {repeat} fresh processes)")
+    print("=" * 72)
+    for key, value in results.items():
+        print(f"{key:<24} {value:>10.1f}")
+    print(f"\nHeavy modules after import api.urls:  {imports[0]['heavy_modules'] or 'none'}")
+    print(f"Heavy modules after a non-ML request: {requests[0]['heavy_after_first_request'] or 'none'}")
+    print(f"Heavy modules after an ML request:    {requests[0]['heavy_after_ml_request'] or 'none'}")
+
+    if history:
+        with open(history, 'a') as f:
+            f.write(json.dumps({
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': sys.version.split()[0],
+                **{key: round(value, 1) for key, value in results.items()},
+                'heavy_modules_at_import': imports[0]['heavy_modules'],
+            }) + '\n')
+        print(f"\nAppended results to {history}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--history', help='JSON lines file to append the results to')
+    parser.add_argument('--child', choices=sorted(CHILDREN), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(CHILDREN[args.child]()))
+    else:
+        main(args.repeat, args.history)
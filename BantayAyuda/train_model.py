@@ -45,4 +45,8 @@ if __name__ == '__main__':
     print(f"Model file: {model_path}")
     print(f"Model size: {os.path.getsize(model_path) / 1024:.2f} KB")
     print("\nYou can now use the model for ECT predictions!")
+    print("Running workers pick up the new file within ML_MODEL_CHECK_INTERVAL seconds,")
+    print("unless a registry version is promoted.")
+    print("To keep it as a registry version instead:")
+    print(f"   python manage.py ml_models register {model_path} --promote")
 